@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# benchmarks/bench_compress.py
+# --compress の圧縮率と速度のトレードオフを計測する
+#   コーパス（corpus.py）の種類・サイズごとに、圧縮なし / zlib:1 / zlib:6 / zlib:9（zstandard があれば zstd:1 / zstd:3 / zstd:19）で
+#   encrypt_stream / decrypt_stream を実行し、出力の大きさ（ratio = .veil / 入力）と MB/s（入力サイズ基準）を比べる。
+# 鍵導出は KeyCache で1回にまとめ、計測から外す。--raw（既定）なら pypdf の解析も外れる。
+#
+# 使い方: python benchmarks/bench_compress.py --sizes 1M 64M --repeat 3 --output compress.json
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from corpus import KINDS, generate_corpus, parse_size  # noqa: E402
+from pdfveil import __version__  # noqa: E402
+from pdfveil.encryptor import encrypt_stream  # noqa: E402
+from pdfveil.decryptor import decrypt_stream  # noqa: E402
+from pdfveil.utils import KeyCache, generate_salt  # noqa: E402
+
+PASSWORD = "benchmark-password"
+ZLIB_CODECS = ["zlib:1", "zlib:6", "zlib:9"]
+ZSTD_CODECS = ["zstd:1", "zstd:3", "zstd:19"]
+
+
+def available_codecs() -> list:
+    codecs = [None] + ZLIB_CODECS
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return codecs
+    return codecs + ZSTD_CODECS
+
+
+def best_of(func, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run_codec(path: str, work_dir: str, codec, options: dict, repeat: int) -> dict:
+    size = os.path.getsize(path)
+    veil_path = os.path.join(work_dir, "bench.veil")
+    out_path = os.path.join(work_dir, "bench.pdf")
+
+    def encrypt():
+        with open(path, "rb") as src, open(veil_path, "wb") as dst:
+            encrypt_stream(src, dst, PASSWORD, compression=codec, **options)
+
+    def decrypt():
+        with open(veil_path, "rb") as src, open(out_path, "wb") as dst:
+            decrypt_stream(src, dst, PASSWORD, key_cache=options["key_cache"], threads=options["threads"])
+
+    encrypt_seconds = best_of(encrypt, repeat)
+    decrypt_seconds = best_of(decrypt, repeat)
+    veil_size = os.path.getsize(veil_path)
+    return {
+        "codec": codec or "none",
+        "veil_bytes": veil_size,
+        "ratio": round(veil_size / size, 4),
+        "encrypt_mb_per_s": round(size / 1e6 / encrypt_seconds, 3),
+        "decrypt_mb_per_s": round(size / 1e6 / decrypt_seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="--compress の圧縮率と速度のベンチマーク")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[parse_size("1M"), parse_size("16M")])
+    parser.add_argument("--codecs", nargs="+", help="計測する指定（例: none zlib:6 zstd:3、省略時は使えるものすべて）")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--parse", action="store_true", help="--raw を使わず、pypdf の解析・書き直しも含めて計測する")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを保存するファイル（省略時は標準出力）")
+    args = parser.parse_args()
+
+    codecs = [None if codec == "none" else codec for codec in args.codecs] if args.codecs else available_codecs()
+    # 鍵導出は最初の1回だけ（共通ソルト + KeyCache）
+    options = dict(raw=not args.parse, threads=args.threads, kdf_salt=generate_salt(), key_cache=KeyCache())
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = os.path.join(tmp, "corpus")
+        os.makedirs(corpus_dir)
+        for name, path, kind, pages in generate_corpus(corpus_dir, args.kinds, args.sizes, args.seed):
+            size = os.path.getsize(path)
+            for codec in codecs:
+                result = dict(file=name, kind=kind, size=size, **run_codec(path, tmp, codec, options, args.repeat))
+                results.append(result)
+                print(f"{name:<20} {result['codec']:<8} ratio {result['ratio']:>6.3f}  "
+                      f"enc {result['encrypt_mb_per_s']:>8.1f} MB/s  dec {result['decrypt_mb_per_s']:>8.1f} MB/s", file=sys.stderr)
+
+    report = {
+        "pdfveil": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "threads": args.threads,
+            "raw": not args.parse,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
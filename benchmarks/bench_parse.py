@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# benchmarks/bench_parse.py
+# encrypt_pdf の抽出処理（ヘッダー・/Info と本体）を計測する
+#   旧: extract_body_without_metadata + extract_pdf_metadata（パスごとに PdfReader を2回構築）
+#   新: extract_document + write_body_from_reader（1つの PdfReader を共有）
+#
+# 使い方: python benchmarks/bench_parse.py --sizes 1M 8M --repeat 3
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from corpus import parse_size, write_pdf  # noqa: E402
+from pdfveil.encryptor import (  # noqa: E402
+    extract_body_without_metadata,
+    extract_document,
+    extract_pdf_metadata,
+    write_body_from_reader,
+)
+
+
+class NullSink:
+    """書き込まれたバイト数だけ数える出力先"""
+
+    def __init__(self):
+        self.size = 0
+
+    def write(self, data):
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def flush(self):
+        pass
+
+
+def run_two_pass(path: str):
+    body = extract_body_without_metadata(path)
+    meta = extract_pdf_metadata(path)
+    return len(meta), len(body)
+
+
+def run_single_pass(path: str):
+    sink = NullSink()
+    with open(path, "rb") as f:
+        meta, reader = extract_document(f)
+        write_body_from_reader(reader, sink)
+    return len(meta), sink.size
+
+
+def best_of(func, path: str, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(path)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PDF抽出処理のベンチマーク")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[parse_size("512K"), parse_size("4M"), parse_size("16M")])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'pages':>7} {'size(MB)':>9} {'two-pass(s)':>12} {'single(s)':>10} {'speedup':>8}")
+        for size in args.sizes:
+            path = os.path.join(tmp, f"bench_{size}.pdf")
+            pages = write_pdf(path, "text", size)
+            size_mb = os.path.getsize(path) / 1e6
+            two_pass = best_of(run_two_pass, path, args.repeat)
+            single = best_of(run_single_pass, path, args.repeat)
+            print(f"{pages:>7} {size_mb:>9.2f} {two_pass:>12.3f} {single:>10.3f} {two_pass / single:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
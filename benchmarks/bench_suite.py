@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# benchmarks/bench_suite.py
+# 合成PDFコーパス（corpus.py）で encrypt_pdf / decrypt_pdf を段階ごとに計測し、結果をJSONで出力する
+#   parse           : PdfReader の構築とヘッダー・/Info の抽出（extract_document）
+#   serialize       : /Info を除いた本体の書き出し（PdfWriter）
+#   kdf             : PBKDF2 による鍵導出（derive_file_keys）
+#   aes_gcm_encrypt : 本体のセグメント暗号化（出力は捨てる）
+#   aes_gcm_decrypt : 本体のセグメント復号（出力は捨てる）
+#   write           : 本体サイズ分のファイル書き込み（fsync まで）
+#   encrypt / decrypt, encrypt_raw / decrypt_raw : encrypt_pdf / decrypt_pdf 全体
+# 各段階の値は seconds / mb_per_s（入力サイズ基準）/ peak_rss_mb。
+# 段階ごとの計測は1プロセスで順に行うので、peak_rss_mb はその段階までの最大値。
+# encrypt / decrypt などの全体計測はファイルごとに別プロセスで行う。
+#
+# 使い方: python benchmarks/bench_suite.py --sizes 1M 64M 2G --output results.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from bench_parse import NullSink  # noqa: E402
+from corpus import KINDS, generate_corpus, parse_size  # noqa: E402
+from pdfveil import __version__  # noqa: E402
+from pdfveil.utils import PBKDF2_ITERATIONS  # noqa: E402
+
+PASSWORD = "benchmark-password"
+KDF_ITERATIONS = PBKDF2_ITERATIONS
+
+
+def peak_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux は KiB、macOS はバイト
+    return usage / (1024 * 1024) if sys.platform == "darwin" else usage / 1024
+
+
+def measure(func, size=None):
+    """func を実行し、(戻り値, 計測結果) を返す"""
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # pdfveil の進捗表示を JSON に混ぜない
+        result = func()
+    seconds = time.perf_counter() - start
+    return result, {
+        "seconds": round(seconds, 6),
+        "mb_per_s": round(size / 1e6 / seconds, 3) if size and seconds > 0 else None,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def run_stages(path: str, work_dir: str, segment_size: int, threads: int) -> dict:
+    """1ファイルを段階ごとに計測する（ワーカープロセスで実行）"""
+    from pdfveil.encryptor import extract_document, write_body_from_reader
+    from pdfveil.stream import SegmentWriter, decrypt_segments, generate_nonce_prefix
+    from pdfveil.utils import derive_file_keys, generate_salt
+
+    size = os.path.getsize(path)
+    body_path = os.path.join(work_dir, "body.bin")
+    encrypted_path = os.path.join(work_dir, "body.enc")
+    stages = {}
+
+    with open(path, "rb") as f:
+        (_, reader), stages["parse"] = measure(lambda: extract_document(f), size)
+        with open(body_path, "wb") as body:
+            _, stages["serialize"] = measure(lambda: write_body_from_reader(reader, body), size)
+    body_size = os.path.getsize(body_path)
+
+    (_, body_key), stages["kdf"] = measure(
+        lambda: derive_file_keys(PASSWORD, generate_salt(), generate_salt(), False, "encrypt", path, skip_strength_check=True, iterations=KDF_ITERATIONS)
+    )
+    nonce_prefix = generate_nonce_prefix()
+
+    def encrypt_body(dst):
+        with open(body_path, "rb") as src, SegmentWriter(dst, body_key, nonce_prefix, segment_size, threads=threads) as writer:
+            shutil.copyfileobj(src, writer, segment_size)
+
+    _, stages["aes_gcm_encrypt"] = measure(lambda: encrypt_body(NullSink()), body_size)
+
+    # 復号の計測用に暗号化した本体を用意する（計測しない）
+    with open(encrypted_path, "wb") as dst:
+        encrypt_body(dst)
+
+    def decrypt_body():
+        with open(encrypted_path, "rb") as src:
+            decrypt_segments(src, NullSink(), body_key, nonce_prefix, segment_size, threads=threads)
+
+    _, stages["aes_gcm_decrypt"] = measure(decrypt_body, body_size)
+
+    def write_body():
+        with open(body_path, "rb") as src, open(os.path.join(work_dir, "body.out"), "wb") as dst:
+            shutil.copyfileobj(src, dst, segment_size)
+            dst.flush()
+            os.fsync(dst.fileno())
+
+    _, stages["write"] = measure(write_body, body_size)
+    return stages
+
+
+def run_encrypt(path: str, veil_path: str, segment_size: int, threads: int, raw: bool) -> dict:
+    from pdfveil.encryptor import encrypt_pdf
+    _, result = measure(
+        lambda: encrypt_pdf(path, PASSWORD, output_path=veil_path, force=True, skip_strength_check=True, segment_size=segment_size, threads=threads, raw=raw),
+        os.path.getsize(path),
+    )
+    return result
+
+
+def run_decrypt(veil_path: str, out_path: str, threads: int) -> dict:
+    from pdfveil.decryptor import decrypt_pdf
+    _, result = measure(
+        lambda: decrypt_pdf(veil_path, PASSWORD, output_path=out_path, force=True, threads=threads),
+        os.path.getsize(veil_path),
+    )
+    return result
+
+
+def worker(args) -> dict:
+    if args.worker == "stages":
+        return run_stages(args.path, args.work_dir, args.segment_size, args.threads)
+    veil_path = os.path.join(args.work_dir, "raw.veil" if args.raw else "pdf.veil")
+    if args.worker == "encrypt":
+        return run_encrypt(args.path, veil_path, args.segment_size, args.threads, args.raw)
+    return run_decrypt(veil_path, os.path.join(args.work_dir, "decrypted.pdf"), args.threads)
+
+
+def spawn(mode: str, path: str, work_dir: str, args, raw: bool = False) -> dict:
+    """計測をワーカープロセスで実行し、JSONの結果を受け取る（ピークRSSを計測ごとに分けるため）"""
+    command = [
+        sys.executable, os.path.abspath(__file__), "--worker", mode, "--path", path, "--work-dir", work_dir,
+        "--segment-size", str(args.segment_size), "--threads", str(args.threads),
+    ]
+    if raw:
+        command.append("--raw")
+    completed = subprocess.run(command, capture_output=True, text=True, check=True)
+    return json.loads(completed.stdout)
+
+
+def best_of(runs):
+    # 秒数が最小の回を採用する
+    return min(runs, key=lambda stage: stage["seconds"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成PDFコーパスで pdfveil の各段階を計測し、JSONで出力")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[parse_size("1M"), parse_size("16M")])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="各計測の繰り返し回数（最速の回を採用）")
+    parser.add_argument("--segment-size", type=parse_size, default=parse_size("1M"))
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--corpus-dir", help="コーパスの保存先（省略時は一時ディレクトリに作って削除）")
+    parser.add_argument("--output", "-o", help="結果のJSONの保存先（省略時は標準出力）")
+    # 内部用: ワーカープロセスとして1つの計測を実行する
+    parser.add_argument("--worker", choices=["stages", "encrypt", "decrypt"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    parser.add_argument("--work-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--raw", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus_dir or os.path.join(tmp, "corpus")
+        corpus = generate_corpus(corpus_dir, args.kinds, args.sizes, args.seed)
+        for name, path, kind, pages in corpus:
+            print(f"[i] {name} ({os.path.getsize(path) / 1e6:.2f} MB, {pages} pages)", file=sys.stderr)
+            work_dir = os.path.join(tmp, name)
+            os.makedirs(work_dir)
+
+            runs = {}
+            for _ in range(args.repeat):
+                for stage, result in spawn("stages", path, work_dir, args).items():
+                    runs.setdefault(stage, []).append(result)
+                for raw, suffix in ((False, ""), (True, "_raw")):
+                    runs.setdefault("encrypt" + suffix, []).append(spawn("encrypt", path, work_dir, args, raw))
+                    runs.setdefault("decrypt" + suffix, []).append(spawn("decrypt", path, work_dir, args, raw))
+            results.append({
+                "name": name,
+                "kind": kind,
+                "bytes": os.path.getsize(path),
+                "pages": pages,
+                "stages": {stage: best_of(stage_runs) for stage, stage_runs in runs.items()},
+            })
+            shutil.rmtree(work_dir)
+
+    report = {
+        "pdfveil": __version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "config": {
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "segment_size": args.segment_size,
+            "threads": args.threads,
+            "kdf_iterations": KDF_ITERATIONS,
+        },
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"[+] 結果を保存しました: {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# benchmarks/corpus.py
+# ベンチマーク用の合成PDFを決定的に生成する（同じ引数なら同じバイト列）
+#   text  : テキストだけのページ（ページ数でサイズを合わせる）
+#   image : 非圧縮RGB画像を1枚ずつ貼ったページ（画像サイズでサイズを合わせる）
+#   info  : text に加えて大きな /Info 辞書を持つ
+# マルチGBのファイルも作れるよう、オブジェクトは逐次ファイルに書き出す
+#
+# 使い方: python benchmarks/corpus.py out_dir --kinds text image --sizes 1M 64M
+
+import argparse
+import os
+import random
+
+KINDS = ("text", "image", "info")
+TEXT_PAGE_SIZE = 3600  # 40行のテキストページ1枚のおおよそのバイト数
+IMAGE_PAGES_MAX = 64  # image の最大ページ数（大きなファイルは画像を大きくする）
+IMAGE_CHUNK_SIZE = 4 * 1024 * 1024
+INFO_ENTRIES = 2000
+
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod", "tempor")
+
+
+def parse_size(value: str) -> int:
+    """'512K' / '64M' / '2G' のようなサイズ指定をバイト数に変換"""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper().rstrip("B")
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def format_size(size: int) -> str:
+    for unit, factor in (("G", 1024 ** 3), ("M", 1024 ** 2), ("K", 1024)):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+
+class _PdfFile:
+    """オブジェクトを順に書き出し、最後に xref と trailer を付ける"""
+
+    def __init__(self, f):
+        self.f = f
+        self.offsets = []
+        f.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def reserve(self) -> int:
+        # 後で書くオブジェクトの番号を確保（/Pages の /Kids などで先に参照するため）
+        self.offsets.append(None)
+        return len(self.offsets)
+
+    def add(self, obj: bytes, number: int = None) -> int:
+        if number is None:
+            number = self.reserve()
+        self.offsets[number - 1] = self.f.tell()
+        self.f.write(f"{number} 0 obj\n".encode() + obj + b"\nendobj\n")
+        return number
+
+    def add_stream(self, number: int, dictionary: str, length: int, chunks):
+        self.offsets[number - 1] = self.f.tell()
+        self.f.write(f"{number} 0 obj\n<< {dictionary} /Length {length} >>\nstream\n".encode())
+        for chunk in chunks:
+            self.f.write(chunk)
+        self.f.write(b"\nendstream\nendobj\n")
+
+    def finish(self, root: int, info: int):
+        xref_offset = self.f.tell()
+        self.f.write(f"xref\n0 {len(self.offsets) + 1}\n0000000000 65535 f \n".encode())
+        for offset in self.offsets:
+            self.f.write(f"{offset:010d} 00000 n \n".encode())
+        self.f.write(f"trailer\n<< /Size {len(self.offsets) + 1} /Root {root} 0 R /Info {info} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+
+def _text_stream(rng: random.Random, page: int, lines: int = 40) -> bytes:
+    text = "\n".join(
+        f"0 -14 Td (page {page} line {j + 1} {' '.join(rng.choice(WORDS) for _ in range(8))}) Tj"
+        for j in range(lines)
+    )
+    return f"BT /F1 11 Tf 72 760 Td\n{text}\nET".encode()
+
+
+def _image_chunks(rng: random.Random, size: int):
+    # 乱数の画素（JPEGなどと同様にほぼ圧縮できない）
+    while size > 0:
+        take = min(size, IMAGE_CHUNK_SIZE)
+        # rng.randbytes（3.9 以降）と同じバイト列（take は必ず1以上）
+        yield rng.getrandbits(8 * take).to_bytes(take, "little")
+        size -= take
+
+
+def _info_dictionary(kind: str, rng: random.Random) -> bytes:
+    entries = [f"/Title (synthetic {kind})", "/Author (pdfveil benchmarks)", "/Producer (corpus.py)"]
+    if kind == "info":
+        for i in range(INFO_ENTRIES):
+            entries.append(f"/Custom{i:05d} ({' '.join(rng.choice(WORDS) for _ in range(10))})")
+    return ("<< " + "\n".join(entries) + " >>").encode()
+
+
+def write_pdf(path: str, kind: str = "text", size: int = 1024 * 1024, seed: int = 0) -> int:
+    """kind の合成PDFを約 size バイトで path に書き出し、ページ数を返す"""
+    if kind not in KINDS:
+        raise ValueError(f"未対応の種類です: {kind}")
+    rng = random.Random(f"{kind}:{size}:{seed}")
+
+    if kind == "image":
+        pages = max(1, min(IMAGE_PAGES_MAX, size // (256 * 1024)))
+        side = max(1, int(((size // pages) // 3) ** 0.5))  # 正方形の RGB 画像
+    else:
+        pages = max(1, size // TEXT_PAGE_SIZE)
+
+    with open(path, "wb") as f:
+        pdf = _PdfFile(f)
+        catalog = pdf.reserve()
+        pages_obj = pdf.reserve()
+        font = pdf.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        kids = []
+        for i in range(pages):
+            page = pdf.reserve()
+            contents = pdf.reserve()
+            kids.append(page)
+            resources = f"/Font << /F1 {font} 0 R >>"
+            if kind == "image":
+                image = pdf.reserve()
+                resources += f" /XObject << /Im1 {image} 0 R >>"
+                stream = f"q 540 0 0 540 36 126 cm /Im1 Do Q BT /F1 11 Tf 36 100 Td (page {i + 1}) Tj ET".encode()
+                pdf.add_stream(image, f"/Type /XObject /Subtype /Image /Width {side} /Height {side} /ColorSpace /DeviceRGB /BitsPerComponent 8", side * side * 3, _image_chunks(rng, side * side * 3))
+            else:
+                stream = _text_stream(rng, i + 1)
+            pdf.add(f"<< /Type /Page /Parent {pages_obj} 0 R /MediaBox [0 0 612 792] /Resources << {resources} >> /Contents {contents} 0 R >>".encode(), page)
+            pdf.add_stream(contents, "", len(stream), [stream])
+        pdf.add(f"<< /Type /Pages /Kids [{' '.join(f'{k} 0 R' for k in kids)}] /Count {pages} >>".encode(), pages_obj)
+        pdf.add(f"<< /Type /Catalog /Pages {pages_obj} 0 R >>".encode(), catalog)
+        info = pdf.add(_info_dictionary(kind, rng))
+        pdf.finish(catalog, info)
+    return pages
+
+
+def generate_corpus(out_dir: str, kinds, sizes, seed: int = 0):
+    """kinds × sizes の合成PDFを out_dir に作り、(名前, パス, 種類, ページ数) のリストを返す"""
+    os.makedirs(out_dir, exist_ok=True)
+    corpus = []
+    for size in sizes:
+        for kind in kinds:
+            name = f"{kind}-{format_size(size)}"
+            path = os.path.join(out_dir, f"{name}.pdf")
+            pages = write_pdf(path, kind, size, seed)
+            corpus.append((name, path, kind, pages))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用の合成PDFを生成")
+    parser.add_argument("out_dir")
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=list(KINDS))
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[parse_size("1M")])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for name, path, kind, pages in generate_corpus(args.out_dir, args.kinds, args.sizes, args.seed):
+        print(f"{name:>14} {pages:>7} pages {os.path.getsize(path) / 1e6:>10.2f} MB  {path}")
+
+
+if __name__ == "__main__":
+    main()
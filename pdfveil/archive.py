@@ -0,0 +1,272 @@
+# pdfveil/archive.py
+# 複数のPDFを1つのファイルにまとめる暗号化アーカイブ（pdfveil pack / unpack / extract NAME）
+# [magic(4)="VARC"][version(1)=0x01][flag(1)=0][kdf_salt(16)][index_offset(8)][index_length(4)]
+# [entry_0][entry_1]...[index]
+#   PBKDF2 はアーカイブ全体で1回だけ（master = PBKDF2(password, kdf_salt)）
+#   entry : 元のPDFファイルをそのままセグメント暗号化したもの（stream.py と同じ形式）
+#           鍵は HKDF(master, salt=entry_salt, info="pdfveil archive entry")。entry_salt と nonce_prefix は索引に入る
+#   index : [nonce(12)][ciphertext][tag(16)] の AES-GCM（鍵は HKDF(master, salt=kdf_salt, info="pdfveil archive index")）
+#           平文はエントリーの一覧（名前・位置・大きさ・ソルトなど）のJSON。AAD はヘッダーの先頭22バイト + index_offset
+# 1つのエントリーだけを読むときは、索引を復号してそのエントリーの位置へシークする。
+# 追加は既存のエントリーを書き換えない。末尾に新しいエントリーと索引を書いて同期してから、
+# ヘッダーの index_offset / index_length を書き換える（途中で止まってもヘッダーは前の索引を指したまま）。
+
+import io
+import json
+import os
+import struct
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from .format import ARCHIVE_MAGIC, ARCHIVE_VERSION_1
+from .output import AtomicOutput, DEFAULT_FSYNC, check_fsync_policy
+from .stream import DEFAULT_SEGMENT_SIZE, SegmentWriter, check_segment_size, generate_nonce_prefix, iter_decrypted_segments, read_full
+from .utils import PBKDF2_ITERATIONS, derive_key, derive_subkey, generate_salt
+
+HEADER = struct.Struct(">4sBB16sQI")  # magic, version, flag, kdf_salt, index_offset, index_length
+POINTER = struct.Struct(">QI")  # index_offset, index_length
+POINTER_OFFSET = HEADER.size - POINTER.size
+ENTRY_KEY_INFO = b"pdfveil archive entry"
+INDEX_KEY_INFO = b"pdfveil archive index"
+COPY_SIZE = 1024 * 1024
+
+
+def is_archive(path: str) -> bool:
+    """path がアーカイブ（先頭が VARC）か"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(ARCHIVE_MAGIC)) == ARCHIVE_MAGIC
+    except OSError:
+        return False
+
+
+def check_entry_name(name: str) -> str:
+    """エントリー名がディレクトリを含まない単独のファイル名か検証（展開時に外へ書かないため）"""
+    if not name or name in (".", "..") or "/" in name or "\\" in name or "\0" in name:
+        raise ValueError(f"アーカイブのエントリー名が不正です: {name!r}")
+    return name
+
+
+def _read_header(f) -> dict:
+    data = read_full(f, HEADER.size)
+    if len(data) < HEADER.size or data[:len(ARCHIVE_MAGIC)] != ARCHIVE_MAGIC:
+        raise ValueError("無効なアーカイブ: magicヘッダーが見つかりません")
+    _, version, flag, kdf_salt, index_offset, index_length = HEADER.unpack(data)
+    if bytes([version]) != ARCHIVE_VERSION_1:
+        raise ValueError(f"未対応のアーカイブのバージョン: {version:02x}")
+    return {"flag": flag, "kdf_salt": kdf_salt, "index_offset": index_offset, "index_length": index_length}
+
+
+def _index_aad(header: dict, index_offset: int) -> bytes:
+    # 索引をヘッダーと位置に結び付ける（別のアーカイブや別の位置の索引とは入れ替えられない）
+    return HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION_1[0], header["flag"], header["kdf_salt"], 0, 0)[:POINTER_OFFSET] + struct.pack(">Q", index_offset)
+
+
+def _seal_index(key: bytes, aad: bytes, entries: list) -> bytes:
+    nonce = os.urandom(12)
+    plaintext = json.dumps({"entries": entries}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(nonce)).encryptor()
+    encryptor.authenticate_additional_data(aad)
+    return nonce + encryptor.update(plaintext) + encryptor.finalize() + encryptor.tag
+
+
+def _open_index(key: bytes, aad: bytes, data: bytes) -> list:
+    if len(data) < 12 + 16:
+        raise ValueError("アーカイブの索引が途中で切れています")
+    decryptor = Cipher(algorithms.AES(key), modes.GCM(data[:12], data[-16:])).decryptor()
+    decryptor.authenticate_additional_data(aad)
+    try:
+        plaintext = decryptor.update(data[12:-16]) + decryptor.finalize()
+    except InvalidTag:
+        raise ValueError("アーカイブの索引の認証に失敗しました。パスワードが間違っているか、ファイルが破損しています。")
+    return json.loads(plaintext)["entries"]
+
+
+class _EntryReader:
+    # アーカイブの中の1エントリー分だけを読めるようにする（iter_decrypted_segments に渡す）
+    def __init__(self, f, offset: int, size: int):
+        f.seek(offset)
+        self._f = f
+        self._remaining = size
+
+    def read(self, size: int) -> bytes:
+        data = self._f.read(min(size, self._remaining))
+        self._remaining -= len(data)
+        return data
+
+    def readinto(self, buffer) -> int:
+        with memoryview(buffer) as view:
+            n = self._f.readinto(view[:min(len(view), self._remaining)])
+        self._remaining -= n
+        return n
+
+
+class Archive:
+    """開いたアーカイブ（f は読み書きできるファイルオブジェクト）
+
+    entries は名前 -> エントリー情報（追加した順）。add で書いたエントリーは commit するまで索引に載らない。
+    create=True なら f に空のアーカイブを書いてから開く。
+    sync=True なら commit でヘッダーを書き換える前後に fsync する（その場で追加する場合）。
+    """
+
+    def __init__(self, f, password: str, key_cache=None, create: bool = False, sync: bool = False):
+        self._file = f
+        self.sync = sync
+        f.seek(0)
+        if create:
+            f.write(HEADER.pack(ARCHIVE_MAGIC, ARCHIVE_VERSION_1[0], 0, generate_salt(), 0, 0))
+            f.seek(0)
+        self.header = _read_header(f)
+        salt = self.header["kdf_salt"]
+        derive = lambda: derive_key(password, salt, iterations=PBKDF2_ITERATIONS)
+        self._master = key_cache.get_or_derive(password, salt, PBKDF2_ITERATIONS, derive) if key_cache is not None else derive()
+        self._index_key = derive_subkey(self._master, salt, INDEX_KEY_INFO)
+        if create:
+            self.entries = {}
+            self.commit()
+        else:
+            f.seek(self.header["index_offset"])
+            data = read_full(f, self.header["index_length"])
+            entries = _open_index(self._index_key, _index_aad(self.header, self.header["index_offset"]), data)
+            self.entries = {entry["name"]: entry for entry in entries}
+
+    def add(self, name: str, src, mtime: float = None, segment_size: int = DEFAULT_SEGMENT_SIZE, replace: bool = False) -> dict:
+        """src（読めるファイルオブジェクト）の中身を name としてファイルの末尾に暗号化して書く"""
+        check_entry_name(name)
+        check_segment_size(segment_size)
+        if name in self.entries and not replace:
+            raise ValueError(f"アーカイブには既に '{name}' があります。")
+        salt = generate_salt()
+        nonce_prefix = generate_nonce_prefix()
+        f = self._file
+        offset = f.seek(0, os.SEEK_END)
+        with SegmentWriter(f, derive_subkey(self._master, salt, ENTRY_KEY_INFO), nonce_prefix, segment_size) as writer:
+            while True:
+                chunk = src.read(COPY_SIZE)
+                if not chunk:
+                    break
+                writer.write(chunk)
+            plain_size = writer.tell()
+        entry = {"name": name, "offset": offset, "size": f.tell() - offset, "plain_size": plain_size,
+                 "salt": salt.hex(), "nonce_prefix": nonce_prefix.hex(), "segment_size": segment_size, "mtime": mtime}
+        self.entries.pop(name, None)  # 置き換えたエントリーは末尾に回す（古い中身は使われない領域として残る）
+        self.entries[name] = entry
+        return entry
+
+    def commit(self):
+        """末尾に新しい索引を書き、ヘッダーが指す索引を切り替える"""
+        f = self._file
+        index_offset = f.seek(0, os.SEEK_END)
+        index = _seal_index(self._index_key, _index_aad(self.header, index_offset), list(self.entries.values()))
+        f.write(index)
+        # 新しい索引を書き終えてから指す先を変える（途中で止まっても前の索引のまま読める）
+        self._flush()
+        f.seek(POINTER_OFFSET)
+        f.write(POINTER.pack(index_offset, len(index)))
+        self._flush()
+        self.header.update(index_offset=index_offset, index_length=len(index))
+        f.seek(0, os.SEEK_END)
+
+    def _flush(self):
+        self._file.flush()
+        if self.sync:
+            os.fsync(self._file.fileno())
+
+    def entry(self, name: str) -> dict:
+        if name not in self.entries:
+            raise ValueError(f"アーカイブに '{name}' はありません。")
+        return self.entries[name]
+
+    def read_into(self, name: str, dst, threads: int = 1) -> int:
+        """name の中身を復号して dst に書き、書いたバイト数を返す（そのエントリーの位置までシークして読む）"""
+        entry = self.entry(name)
+        key = derive_subkey(self._master, bytes.fromhex(entry["salt"]), ENTRY_KEY_INFO)
+        src = _EntryReader(self._file, entry["offset"], entry["size"])
+        written = 0
+        for chunk in iter_decrypted_segments(src, key, bytes.fromhex(entry["nonce_prefix"]), entry["segment_size"], threads=threads):
+            dst.write(chunk)
+            written += len(chunk)
+        if written != entry["plain_size"]:
+            raise ValueError(f"アーカイブの '{name}' の大きさが索引と一致しません。")
+        return written
+
+    def read(self, name: str) -> bytes:
+        """name の中身を復号して返す"""
+        buffer = io.BytesIO()
+        self.read_into(name, buffer)
+        return buffer.getvalue()
+
+
+def pack_files(archive_path: str, files: list, password: str, append: bool = False, force: bool = False, segment_size: int = DEFAULT_SEGMENT_SIZE, key_cache=None, fsync: str = DEFAULT_FSYNC) -> list:
+    """files を archive_path にまとめ、追加したエントリー名を返す（エントリー名はファイル名）
+
+    append=True なら既存のアーカイブの末尾に追加する（既存のエントリーは書き換えない。同じ名前は force=True なら置き換え）。
+    新しく作る場合は一時ファイルに書いてから置き換える。
+    """
+    check_fsync_policy(fsync)
+    names = [os.path.basename(path) for path in files]
+    for name in names:
+        check_entry_name(name)
+    duplicated = sorted({name for name in names if names.count(name) > 1})
+    if duplicated:
+        raise ValueError(f"同じ名前のファイルは1つのアーカイブに入れられません: {', '.join(duplicated)}")
+
+    def add_all(archive):
+        for path, name in zip(files, names):
+            with open(path, "rb") as src:
+                archive.add(name, src, mtime=os.fstat(src.fileno()).st_mtime, segment_size=segment_size, replace=force)
+        archive.commit()
+
+    if not append:
+        if os.path.exists(archive_path) and not force:
+            raise ValueError(f"[!] 出力先ファイル '{archive_path}' は既に存在します。--append で追加、--force で作り直せます。")
+        with AtomicOutput(archive_path, fsync=fsync) as f:
+            add_all(Archive(f, password, key_cache, create=True))
+        return names
+
+    with open(archive_path, "r+b") as f:
+        archive = Archive(f, password, key_cache, sync=fsync != "none")
+        end = f.seek(0, os.SEEK_END)
+        try:
+            add_all(archive)
+        except BaseException:
+            # ヘッダーは前の索引を指したままなので、書きかけの末尾を切り捨てれば元どおり
+            f.truncate(end)
+            raise
+    return names
+
+
+def unpack_archive(archive_path: str, password: str, output_dir: str, names: list = None, force: bool = False, key_cache=None, threads: int = 1, fsync: str = DEFAULT_FSYNC) -> list:
+    """アーカイブのエントリー（names を渡せばそれだけ）を output_dir に展開し、保存先の一覧を返す"""
+    check_fsync_policy(fsync)
+    with open(archive_path, "rb") as f:
+        archive = Archive(f, password, key_cache)
+        names = list(archive.entries) if names is None else names
+        for name in names:
+            archive.entry(name)  # 書き始める前に、すべての名前があることを確かめる
+        os.makedirs(output_dir, exist_ok=True)
+        outputs = []
+        for name in names:
+            output_path = os.path.join(output_dir, check_entry_name(name))
+            if os.path.exists(output_path) and not force:
+                raise ValueError(f"[!] 出力ファイル '{output_path}' は既に存在します。--force を指定して上書きできます。")
+            with AtomicOutput(output_path, archive.entry(name)["plain_size"], fsync=fsync) as out:
+                archive.read_into(name, out, threads=threads)
+            mtime = archive.entry(name)["mtime"]
+            if mtime is not None:
+                os.utime(output_path, (mtime, mtime))
+            outputs.append(output_path)
+    return outputs
+
+
+def inspect_archive(archive_path: str, password: str = None, key_cache=None) -> dict:
+    """アーカイブのヘッダー（password を渡せば索引のエントリー一覧も）を辞書で返す"""
+    with open(archive_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        info = {"file": archive_path, "archive": True, "version": ARCHIVE_VERSION_1[0], "file_size": file_size, "entries": None}
+        if password is None:
+            info["index_size"] = _read_header(f)["index_length"]
+            return info
+        archive = Archive(f, password, key_cache)
+        info["index_size"] = archive.header["index_length"]
+        info["entries"] = [{"name": entry["name"], "size": entry["plain_size"], "mtime": entry["mtime"]} for entry in archive.entries.values()]
+    return info
@@ -3,17 +3,404 @@ import argparse
 import getpass
 import glob
 import os
-from colorama import init, Fore
-from .encryptor import encrypt_pdf
-from .decryptor import decrypt_pdf
+import sys
 from . import __version__
 from .logo import ASCII_LOGO
 
-# 初期化
-init(autoreset=True)
+# pypdf・cryptography・colorama は使う処理の中で読み込む（--version / --help の起動を軽くする）
+_fore = None
 
-def process_files_one_by_one(files, mode, force, passwords, remove=False, output=None, encrypt_metadata=True):
-    # パスワードリストをファイル数分用意し、1つずつ処理する
+# バッチ実行中に導出したマスター鍵のキャッシュ（ワーカープロセスごとに1つ、初回の処理で作る）
+_key_cache = None
+
+def load_colors():
+    """colorama を初期化して Fore を返す（読み込みは初回のみ）"""
+    global _fore
+    if _fore is None:
+        from colorama import init, Fore
+        init(autoreset=True)
+        _fore = Fore
+    return _fore
+
+def get_key_cache():
+    """このプロセスの鍵キャッシュを返す"""
+    global _key_cache
+    if _key_cache is None:
+        from .utils import KeyCache
+        _key_cache = KeyCache()
+    return _key_cache
+
+def usable_cpu_count() -> int:
+    """このプロセスが使えるCPU数"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def parse_size(value: str) -> int:
+    """'1048576' / '512K' / '4M' のようなサイズ指定をバイト数に変換"""
+    units = {"K": 1024, "M": 1024 * 1024, "G": 1024 * 1024 * 1024}
+    value = value.strip().upper().rstrip("B")
+    try:
+        if value and value[-1] in units:
+            return int(value[:-1]) * units[value[-1]]
+        return int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"サイズの指定が不正です: {value}")
+
+def compression_arg(value: str) -> str:
+    """--compress の指定（'zlib' / 'zlib:9' / 'zstd:3'）を確かめてそのまま返す"""
+    from .compress import parse_compression
+    try:
+        parse_compression(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value
+
+def process_one_file(mode, file, password, force, remove=False, output=None, threads=1, stats=False, profile=None, fsync="file", defer=None, **options):
+    """1ファイルを処理し、(エラーメッセージ, 計測結果, プロファイル) を返す（プロセスプールのワーカーからも呼ばれる）
+
+    profile にディレクトリを渡すと cProfile の結果をその中のファイルに書き、そのパスを返す。
+    defer を渡すと出力の同期と置き換えをそちらに任せる（pipeline の writer 段。remove はその後で呼び出し側が行う）。
+    """
+    file_stats = None
+    if stats:
+        from .stats import Stats
+        file_stats = Stats(file)
+    profiler = None
+    if profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    error = None
+    try:
+        # 暗号化処理（パスワード強度の確認は親プロセスで済ませている）
+        if mode == 'encrypt' or mode == 'enc':
+            from .encryptor import encrypt_pdf
+            encrypt_pdf(file, password, output_path=output, force=force, skip_strength_check=True, key_cache=get_key_cache(), threads=threads, stats=file_stats, fsync=fsync, defer=defer, **options)
+        # 復号処理
+        elif mode == 'decrypt' or mode == 'dec':
+            from .decryptor import decrypt_pdf
+            decrypt_pdf(file, password, output_path=output, force=force, key_cache=get_key_cache(), threads=threads, stats=file_stats, fsync=fsync, defer=defer)
+        # ページの取り出し
+        elif mode == 'extract':
+            from .decryptor import extract_pages
+            extract_pages(file, password, options["pages"], output_path=output, force=force, key_cache=get_key_cache(), fsync=fsync, defer=defer)
+        # パスワードの付け替え（鍵ブロックだけをその場で書き換える）
+        elif mode == 'rekey':
+            from .envelope import rekey_veil
+            rekey_veil(file, password, options["new_password"], kdf_salt=options.get("kdf_salt"), key_cache=get_key_cache(), fsync=fsync)
+            print(f"[+] Rekeyed: {file}")
+        if remove:
+            remove_input(file)
+    except Exception as e:
+        error = str(e) or type(e).__name__
+
+    # プロファイルはワーカーから返せるよう親プロセスが用意したディレクトリに書き出し、親プロセスでまとめる
+    profile_path = None
+    if profiler is not None:
+        import tempfile
+        profiler.disable()
+        fd, profile_path = tempfile.mkstemp(prefix="pdfveil-", suffix=".prof", dir=profile)
+        os.close(fd)
+        profiler.dump_stats(profile_path)
+    return error, file_stats.to_dict() if file_stats else None, profile_path
+
+def remove_input(file):
+    os.remove(file)
+    print(f"[i] 元のPDF '{file}' を削除しました。")
+
+def process_pipelined(tasks, mode, remove=False, output=None, prefetch=2, **options):
+    """1プロセスで、先読み・計算・書き込みを重ねて順に処理する（pipeline.py を参照、tasks は (ファイル, パスワード, force)）"""
+    from .pipeline import Prefetcher, Writer
+    outcomes = []
+    with Prefetcher([file for file, _, _ in tasks], prefetch) as prefetcher, Writer(prefetch) as writer:
+        for file, password, force in tasks:
+            prefetcher.wait(file)
+            # 置き換え・成功の表示は writer 段で順に行う。--force なしなら置き換えの時点でも出力先がないか確かめるので、
+            # -o で同じ出力先を指定しても、先のファイルの置き換えを待っている間に後のファイルが上書きすることはない
+            defer = lambda commit, file=file: writer.submit(file, commit)
+            error, file_stat, profile_path = process_one_file(mode, file, password, force, output=output, defer=defer, **options)
+            if error is None and remove:
+                # 出力の置き換えが済んでから削除する（置き換えに失敗したら削除しない）
+                writer.submit(file, lambda file=file: remove_input(file))
+            outcomes.append((file, error, file_stat, profile_path))
+    # 書き込み段のエラーは全ファイルの処理が終わってから分かる
+    return [(file, error or writer.errors.get(file), file_stat, profile_path) for file, error, file_stat, profile_path in outcomes]
+
+def warm_up_worker():
+    """常駐ワーカーで重いモジュールを先に読み込む（最初のファイルを待たせない）"""
+    import signal
+    # Ctrl+C・SIGTERM は親プロセスが受け、処理中のファイルを終えてからワーカーを止める
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    from . import encryptor  # noqa: F401
+
+def watch_and_encrypt(directory, password, output_dir=None, remove=False, force=False, jobs=1, settle=0.5, polling=False, interval=1.0, stop=None, **options):
+    """directory を監視し、置かれたPDFを常駐のワーカープロセスで暗号化する（stop がセットされるか Ctrl+C まで）"""
+    from concurrent.futures import ProcessPoolExecutor
+    from .watch import watch_directory
+
+    def report(path, future):
+        try:
+            error = future.result()[0]
+        except Exception as e:  # ワーカープロセス自体の異常終了など
+            error = str(e) or type(e).__name__
+        if error is not None:
+            print(f"[!] エラー: {path}: {error}")
+
+    with ProcessPoolExecutor(max_workers=jobs, initializer=warm_up_worker) as pool:
+        # ワーカーを先に起動しておく
+        for _ in range(jobs):
+            pool.submit(int)
+
+        def handle(path):
+            output = os.path.join(output_dir, os.path.basename(path)) if output_dir else None
+            future = pool.submit(process_one_file, "encrypt", path, password, force, remove=remove, output=output, **options)
+            future.add_done_callback(lambda future, path=path: report(path, future))
+
+        print(f"[i] 監視を開始しました: {directory}（Ctrl+C で終了）")
+        try:
+            watch_directory(directory, handle, settle=settle, polling=polling, interval=interval, stop=stop)
+        except KeyboardInterrupt:
+            print("[i] 監視を終了します（処理中のファイルが終わるまで待ちます）。")
+
+def run_server(socket_path, host, port, jobs, max_queue, max_body):
+    """ローカルサービスを起動し、Ctrl+C まで待ち受ける（serve.py を参照）"""
+    import signal
+    from .serve import close_server, make_server
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt  # systemd などからの SIGTERM でも Ctrl+C と同じく後始末する
+
+    signal.signal(signal.SIGTERM, stop)
+    server = make_server(socket_path, host, port or 0, jobs, max_queue, max_body)
+    where = socket_path or "http://{}:{}".format(*server.server_address[:2])
+    print(f"[i] 待ち受けを開始しました: {where}（ワーカー {jobs}、待ち上限 {max_queue}、本文の上限 {max_body} バイト、Ctrl+C で終了）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[i] 待ち受けを終了します。")
+    finally:
+        close_server(server)
+
+def run_stdio(mode, file, output, password, force=False, remove=False, stats=None, fsync="file", **options):
+    """入力か出力が '-'（標準入力・標準出力）の1件を stream API で処理する
+
+    出力を汚さないよう、表示はすべて標準エラー出力に出す。失敗したら終了コード 1 で終わる。
+    """
+    import contextlib
+    from .output import AtomicOutput, StreamOutput
+    from .stats import Stats
+    label = "<stdin>" if file == "-" else file
+    file_stats = Stats(label) if stats is not None else None
+    try:
+        with contextlib.ExitStack() as stack:
+            src = sys.stdin.buffer if file == "-" else stack.enter_context(open(file, "rb"))
+            if output == "-":
+                dst = StreamOutput(sys.stdout.buffer)
+            else:
+                if os.path.exists(output) and not force:
+                    raise ValueError(f"出力先ファイル '{output}' は既に存在します。--force を指定して上書きできます。")
+                dst = stack.enter_context(AtomicOutput(output, fsync=fsync, stats=file_stats))
+            if mode == "encrypt":
+                from .encryptor import encrypt_stream
+                encrypt_stream(src, dst, password, key_cache=get_key_cache(), stats=file_stats, **options)
+            else:
+                from .decryptor import decrypt_stream
+                decrypt_stream(src, dst, password, key_cache=get_key_cache(), stats=file_stats, warn=lambda message: print(f"[!] {message}", file=sys.stderr), **options)
+            dst.flush()
+        if remove and file != "-":
+            os.remove(file)
+    except Exception as e:
+        print(f"[!] エラー: {label}: {str(e) or type(e).__name__}", file=sys.stderr)
+        exit(1)
+
+    done = "Encrypted" if mode == "encrypt" else "Decrypted"
+    print(f"[+] {done}: {label} -> {'<stdout>' if output == '-' else output}", file=sys.stderr)
+    if file_stats is not None:
+        print_stats([file_stats.to_dict()], stats)
+
+def ask_password(target):
+    """パスワードを尋ねる（空なら終了）"""
+    password = getpass.getpass(f"🔑 Enter password for {target}: ")
+    if not password:
+        print("[!] パスワードが必要です。")
+        exit(1)
+    return password
+
+def run_archive_command(args, names=None):
+    """pack / unpack / アーカイブに対する extract を実行する（archive.py を参照）"""
+    from .archive import pack_files, unpack_archive
+    Fore = load_colors()
+    archive = args.veilpdf[0] if args.command == "extract" else args.archive
+    try:
+        if args.command == "pack":
+            files = []
+            for pattern in args.inputpdf:
+                matched = glob.glob(pattern)
+                if not matched:
+                    print(f"[!] 指定されたファイル '{pattern}' が見つかりません。")
+                    exit(1)
+                files.extend(matched)
+            password = args.password or ask_password(archive)
+            if not args.append:
+                # 新しいアーカイブは encrypt と同じく弱いパスワードを確認する（追加時は既存のパスワードと一致すればよい）
+                from .utils import confirm_password_strength
+                password = confirm_password_strength(password, archive)
+            packed = pack_files(archive, files, password, append=args.append, force=args.force, segment_size=args.segment_size,
+                                key_cache=get_key_cache(), fsync=args.fsync)
+            print(Fore.GREEN + f"[+] {len(packed)} 件を{'追加' if args.append else '格納'}しました: {archive}")
+        else:
+            if not os.path.isfile(archive):
+                print(f"[!] 指定されたファイル '{archive}' が見つかりません。")
+                exit(1)
+            password = args.password if isinstance(args.password, str) else (args.password or [None])[0]
+            password = password or ask_password(archive)
+            if args.command == "unpack":
+                output_dir = args.output_dir or os.path.splitext(archive)[0]
+            else:
+                output_dir = args.output or os.path.dirname(archive) or "."
+            outputs = unpack_archive(archive, password, output_dir, names=names, force=args.force, key_cache=get_key_cache(),
+                                     threads=getattr(args, "threads", 1), fsync=args.fsync)
+            if names is None:
+                print(Fore.GREEN + f"[+] {len(outputs)} 件を展開しました: {output_dir}")
+            else:
+                for output_path in outputs:
+                    print(Fore.GREEN + f"[+] Extracted and saved to: {output_path}")
+    except Exception as e:
+        print(Fore.RED + f"[!] {archive}: {e}")
+        exit(1)
+
+def encryption_options(args) -> str:
+    """.veil の中身を変える暗号化の設定を、マニフェストで比べるための文字列にする"""
+    options = []
+    if args.no_encrypt_metadata:
+        options.append("no-encrypt-metadata")
+    if args.single_kdf or args.batch_key:
+        options.append("single-kdf")
+    if args.raw:
+        options.append("raw")
+    if args.paged:
+        options.append(f"paged:{args.unit_pages}")
+    if args.envelope:
+        options.append("envelope")
+    if args.compress:
+        from .compress import parse_compression
+        options.append("compress:%s:%d" % parse_compression(args.compress))
+    options.append(f"segment-size:{args.segment_size}")
+    return ",".join(options)
+
+def plan_incremental(args, files, password_for=None):
+    """マニフェストを読み、(マニフェスト, 暗号化するPDF, 上書きしてよいPDF) を返す（manifest.py を参照）
+
+    password_for を渡すと、パスワードが前回と変わったPDFも暗号化し直す。
+    """
+    from .encryptor import _encrypted_output_path
+    from .manifest import Manifest
+    try:
+        manifest = Manifest.load(args.incremental)
+        targets, overwrite = manifest.plan(files, lambda file: _encrypted_output_path(file, args.output, True), jobs=max(1, args.jobs),
+                                           options=encryption_options(args), password_for=password_for)
+    except (OSError, ValueError) as e:
+        print(f"[!] マニフェスト '{args.incremental}' を使えません: {e}")
+        exit(1)
+    print(f"[i] {len(files)} 件中 {len(files) - len(targets)} 件は前回から変わっていないので飛ばします（マニフェスト: {args.incremental}）")
+    return manifest, targets, overwrite
+
+def print_summary(results):
+    """バッチ処理の結果をまとめて表示"""
+    Fore = load_colors()
+    failures = [(file, error) for file, error in results if error is not None]
+    print(f"[i] 完了: 成功 {len(results) - len(failures)} 件 / 失敗 {len(failures)} 件")
+    for file, error in failures:
+        print(Fore.RED + f"  [!] {file}: {error}")
+
+def print_stats(file_stats, stats_format):
+    """計測結果（ファイルごと・合計）を標準エラー出力に表示"""
+    import json
+    from .stats import Stats, format_stats
+    total = Stats()
+    for data in file_stats:
+        total.merge(data)
+    if stats_format == "json":
+        print(json.dumps({"files": file_stats, "total": total.to_dict()}, ensure_ascii=False), file=sys.stderr)
+        return
+    for data in file_stats:
+        print(format_stats(data), file=sys.stderr)
+    if len(file_stats) > 1:
+        print(format_stats(total.to_dict()), file=sys.stderr)
+
+def save_profile(profile_paths, destination):
+    """ファイルごとのプロファイルを1つにまとめて pstats 形式で保存"""
+    import pstats
+    merged = pstats.Stats(*profile_paths)
+    merged.dump_stats(destination)
+    print(f"[i] プロファイルを保存しました: {destination}（python -m pstats {destination} で確認できます）")
+
+def format_info(info) -> str:
+    """inspect_veil の結果を人が読める形にする"""
+    lines = [f"[i] {info['file']}"]
+    lines.append(f"    バージョン        : {info['version']}")
+    lines.append(f"    フラグ            : {', '.join(info['flags']) or '-'}")
+    if "segment_size" in info:
+        lines.append(f"    セグメントサイズ  : {info['segment_size']} バイト")
+    if "compression" in info:
+        lines.append(f"    圧縮              : {info['compression']}")
+    lines.append(f"    本体              : {info['body_size']} バイト（ファイル全体 {info['file_size']} バイト）")
+    state = "暗号化" if info["metadata_encrypted"] else "平文"
+    verified = "検証済み" if info["verified"] else "未検証"
+    lines.append(f"    メタデータ        : {state}、{info['metadata_size']} バイト（{verified}）")
+    if info["pdf_header"]:
+        lines.append(f"    PDFヘッダー       : {info['pdf_header']}")
+    for key, value in (info["metadata"] or {}).items():
+        lines.append(f"    {key:<18}: {value}")
+    return "\n".join(lines)
+
+def format_archive_info(info) -> str:
+    """inspect_archive の結果を人が読める形にする"""
+    lines = [f"[i] {info['file']}"]
+    lines.append(f"    種類              : アーカイブ（バージョン {info['version']}）")
+    lines.append(f"    索引              : {info['index_size']} バイト（ファイル全体 {info['file_size']} バイト）")
+    if info["entries"] is None:
+        lines.append("    エントリー        : 未検証（--password で一覧を表示）")
+    else:
+        lines.append(f"    エントリー        : {len(info['entries'])} 件")
+        for entry in info["entries"]:
+            lines.append(f"      {entry['name']}  {entry['size']} バイト")
+    return "\n".join(lines)
+
+def show_info(files, password=None, as_json=False):
+    """.veil ファイルのヘッダーとメタデータ（アーカイブならエントリーの一覧）を表示（本体は読まない）"""
+    from .archive import inspect_archive, is_archive
+    from .decryptor import inspect_veil
+    reports = []
+    for file in files:
+        try:
+            inspect = inspect_archive if is_archive(file) else inspect_veil
+            reports.append(inspect(file, password, key_cache=get_key_cache()))
+        except Exception as e:
+            reports.append({"file": file, "error": str(e) or type(e).__name__})
+
+    if as_json:
+        import json
+        print(json.dumps(reports, ensure_ascii=False, indent=2))
+    else:
+        Fore = load_colors()
+        for info in reports:
+            if "error" in info:
+                print(Fore.RED + f"[!] {info['file']}: {info['error']}")
+            else:
+                print(format_archive_info(info) if info.get("archive") else format_info(info))
+    if any("error" in info for info in reports):
+        exit(1)
+
+def process_files_one_by_one(files, mode, force, passwords, remove=False, output=None, jobs=1, stats=None, profile=None, prefetch=2, overwrite=frozenset(), **options):
+    # パスワードリストをファイル数分用意し、ファイルごとに処理する
+    # （jobs > 1 ならプロセスプールで並列、1 なら prefetch ファイル先まで読み込み・書き込みを重ねる）
+    # overwrite の入力は --force がなくても出力を上書きする（--incremental で前回自分が作った .veil）
+    tasks = []
+    confirmed = {}  # 弱いパスワードの確認は同じパスワードにつき1回だけ（入力 -> 実際に使うパスワード）
     for idx, file in enumerate(files):
         password = passwords[idx]  # 既にリストでパスワードを取得しているため、ここではリストから取得
         if not password:
@@ -25,60 +412,202 @@ def process_files_one_by_one(files, mode, force, passwords, remove=False, output
         if not matched_files:
             print(f"[!] 指定されたファイル '{file}' が見つかりません。")
             continue
-        
-        try:
-            # 暗号化処理
-            if mode == 'encrypt' or mode == 'enc':
-                encrypt_pdf(matched_files[0], password, output_path=output, force=force, encrypt_metadata=encrypt_metadata)
-                if remove:
-                    os.remove(matched_files[0])
-                    print(f"[i] 元のPDF '{matched_files[0]}' を削除しました。")
-        
-            # 復号処理
-            elif mode == 'decrypt' or mode == 'dec':
-                decrypt_pdf(matched_files[0], password, output_path=output, force=force)
-                if remove:
-                    os.remove(matched_files[0])
-                    print(f"[i] 元のPDF '{matched_files[0]}' を削除しました。")
-        except Exception as e:
-            print(f"[!] エラー: {e}")
-            continue
+
+        # ワーカーでは入力を受け付けられないので、強度の確認はここで行う
+        if mode == 'encrypt' or mode == 'enc':
+            if password not in confirmed:
+                from .utils import confirm_password_strength
+                confirmed[password] = confirm_password_strength(password, matched_files[0])
+            password = confirmed[password]
+        tasks.append((matched_files[0], password, force or file in overwrite))
+
+    # --output 指定時は出力先が1つなので並列にしない
+    if output or len(tasks) <= 1:
+        jobs = 1
+
+    results = []
+    file_stats = []
+    profile_paths = []
+
+    def collect(file_stat, profile_path):
+        if file_stat is not None:
+            file_stats.append(file_stat)
+        if profile_path is not None:
+            profile_paths.append(profile_path)
+
+    profile_dir = None
+    if profile is not None:
+        import tempfile
+        # ワーカーはファイルごとのプロファイルをここに書く（失敗・中断しても最後にディレクトリごと消す）
+        profile_dir = tempfile.mkdtemp(prefix="pdfveil-profile-")
+    options.update(stats=stats is not None, profile=profile_dir)
+    try:
+        if jobs <= 1 and prefetch > 0 and len(tasks) > 1:
+            for file, error, file_stat, profile_path in process_pipelined(tasks, mode, remove=remove, output=output, prefetch=prefetch, **options):
+                if error is not None:
+                    print(f"[!] エラー: {file}: {error}")
+                results.append((file, error))
+                collect(file_stat, profile_path)
+        elif jobs <= 1:
+            for file, password, file_force in tasks:
+                error, file_stat, profile_path = process_one_file(mode, file, password, file_force, remove=remove, output=output, **options)
+                if error is not None:
+                    print(f"[!] エラー: {error}")
+                results.append((file, error))
+                collect(file_stat, profile_path)
+        else:
+            from concurrent.futures import ProcessPoolExecutor, as_completed
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                futures = {
+                    pool.submit(process_one_file, mode, file, password, file_force, remove=remove, output=output, **options): file
+                    for file, password, file_force in tasks
+                }
+                for future in as_completed(futures):
+                    file = futures[future]
+                    try:
+                        error, file_stat, profile_path = future.result()
+                        collect(file_stat, profile_path)
+                    except Exception as e:  # ワーカープロセス自体の異常終了など
+                        error = str(e) or type(e).__name__
+                    if error is not None:
+                        print(f"[!] エラー: {file}: {error}")
+                    results.append((file, error))
+
+        if _key_cache is not None:
+            _key_cache.clear()
+        if len(tasks) > 1:
+            print_summary(results)
+        if stats is not None and file_stats:
+            print_stats(file_stats, stats)
+        if profile is not None and profile_paths:
+            save_profile(profile_paths, profile)
+    finally:
+        if profile_dir is not None:
+            import shutil
+            shutil.rmtree(profile_dir, ignore_errors=True)
+    return results
+
+def run_stdio_command(args, mode, inputs):
+    """encrypt / decrypt で '-' が指定されたときの引数の確認とパスワードの取得"""
+    def fail(message):
+        print(f"[!] {message}", file=sys.stderr)
+        exit(1)
+
+    if len(inputs) != 1:
+        fail("'-'（標準入力・標準出力）を使うときはファイルを1つだけ指定してください。")
+    file = inputs[0]
+    if file == "-" and sys.stdin.isatty():
+        fail("標準入力が端末です。パイプかリダイレクトでデータを渡してください。")
+    if file != "-" and not os.path.isfile(file):
+        fail(f"指定されたファイル '{file}' が見つかりません。")
+    output = args.output or "-"
+    if output != "-" and mode == "encrypt":
+        output = os.path.splitext(output)[0] + ".veil"
+    if output == "-" and sys.stdout.isatty():
+        fail("端末には出力できません。-o でファイルを指定するか、リダイレクトしてください。")
+    if args.password and len(args.password) > 1:
+        fail("'-' を使うときはパスワードを1つだけ指定してください。")
+    # getpass は端末（/dev/tty）から読むので、標準入力のデータとは混ざらない
+    password = args.password[0] if args.password else getpass.getpass(f"🔑 Enter password for {file}: ")
+    if not password:
+        fail("パスワードが必要です。")
+
+    options = dict(threads=args.threads, fsync=args.fsync, stats=args.stats)
+    if mode == "encrypt":
+        from .utils import generate_salt, is_strong_password
+        # 標準入力・標準出力を使うので、弱いパスワードの確認はせず警告だけ出す
+        if not is_strong_password(password):
+            print("[!] パスワードが強力ではありません（'-' を使うときは確認せずに続けます）。", file=sys.stderr)
+        options.update(encrypt_metadata=not args.no_encrypt_metadata, single_kdf=args.single_kdf,
+                       kdf_salt=generate_salt() if args.batch_key else None, raw=args.raw, paged=args.paged, envelope=args.envelope,
+                       compression=args.compress, unit_pages=args.unit_pages, segment_size=args.segment_size)
+    run_stdio(mode, file, output, password, force=args.force, remove=args.remove, **options)
 
 def run_cli():
     # ArgumentParserの設定
     parser = argparse.ArgumentParser(
         prog="pdfveil",
-        description=Fore.CYAN + "🔐 PDFをAES-GCMで安全に暗号化・復号するCLIツール" + Fore.RESET,
+        description="🔐 PDFをAES-GCMで安全に暗号化・復号するCLIツール",
         formatter_class=argparse.RawTextHelpFormatter,  # より読みやすいヘルプ表示
         add_help=False  # デフォルトの --help を無効にする
     )
     
     # カスタム --help フラグ
-    parser.add_argument("--help", action="store_true", help=Fore.GREEN + "カスタムヘルプを表示" + Fore.RESET)
+    # （この時点では colorama を読み込まないので、ここの説明は色なし。表示はカスタムヘルプで行う）
+    parser.add_argument("--help", action="store_true", help="カスタムヘルプを表示")
     
     # --version フラグ
-    parser.add_argument("--version", action="store_true", help=Fore.GREEN + "バージョン情報を表示" + Fore.RESET)
+    parser.add_argument("--version", action="store_true", help="バージョン情報を表示")
     
     # 一旦 version フラグのみチェック（この時点ではサブコマンドは無視）
     args, remaining_args = parser.parse_known_args()
     
+    # --version フラグが指定された場合
+    if args.version:
+        print(ASCII_LOGO)
+        print(f"📦 Version: {__version__}")
+        return
+
+    Fore = load_colors()
+
     # --help フラグが指定された場合
     if args.help:
         # カスタムメッセージ表示
         print(ASCII_LOGO)
         print("pdfveil version " + __version__)
         print(Fore.YELLOW + "\n使用方法:")
-        print(Fore.YELLOW + "  pdfveil encrypt <入力PDFファイル> [--password <パスワード>] [--output <保存先ファイル名>] [--force] [--remove] [--no-encrypt-metadata]")
-        print(Fore.YELLOW + "  pdfveil decrypt <暗号化されたファイル> [--password <パスワード>] [--output <保存先ファイル名>] [--force] [--remove]")
+        print(Fore.YELLOW + "  pdfveil encrypt <入力PDFファイル> [--password <パスワード>] [--output <保存先ファイル名>] [--force] [--remove] [--incremental [MANIFEST]] [--no-encrypt-metadata] [--single-kdf] [--batch-key] [--raw] [--envelope] [--compress CODEC[:LEVEL]] [--jobs N] [--threads N] [--prefetch N] [--segment-size SIZE] [--paged] [--unit-pages N] [--fsync MODE] [--stats [text|json]] [--profile FILE]")
+        print(Fore.YELLOW + "  pdfveil decrypt <暗号化されたファイル> [--password <パスワード>] [--output <保存先ファイル名>] [--force] [--remove] [--jobs N] [--threads N] [--prefetch N] [--fsync MODE] [--stats [text|json]] [--profile FILE]")
+        print(Fore.YELLOW + "  pdfveil extract <暗号化されたファイル> --pages <ページ> [--password <パスワード>] [--output <保存先ファイル名>] [--force] [--fsync MODE]")
+        print(Fore.YELLOW + "  pdfveil extract <アーカイブ> <名前>... [--password <パスワード>] [--output <保存先フォルダー>] [--force] [--fsync MODE]")
+        print(Fore.YELLOW + "  pdfveil info <暗号化されたファイル> [--password <パスワード>] [--json]")
+        print(Fore.YELLOW + "  pdfveil rekey <暗号化されたファイル> [--password <パスワード>] [--new-password <新しいパスワード>] [--batch-key] [--jobs N] [--fsync MODE]")
+        print(Fore.YELLOW + "  pdfveil pack <アーカイブ> <入力PDFファイル>... [--password <パスワード>] [--append] [--force] [--segment-size SIZE] [--fsync MODE]")
+        print(Fore.YELLOW + "  pdfveil unpack <アーカイブ> [--password <パスワード>] [--output-dir <フォルダー>] [--force] [--threads N] [--fsync MODE]")
+        print(Fore.YELLOW + "  pdfveil serve (--socket <パス> | --port <ポート>) [--host <アドレス>] [--jobs N] [--max-queue N] [--max-body SIZE]")
+        print(Fore.YELLOW + "  pdfveil watch <フォルダー> [--password <パスワード>] [--output-dir <フォルダー>] [--remove] [--jobs N] [--settle SECONDS] [--poll] [--interval SECONDS] [--batch-key]")
         print(Fore.YELLOW + "\nコマンド:")
         print(Fore.YELLOW + "  encrypt, enc  PDFを暗号化")
         print(Fore.YELLOW + "  decrypt, dec  PDFを復号")
+        print(Fore.YELLOW + "  extract       指定したページだけを復号して取り出す（アーカイブなら指定した名前のPDFを取り出す）")
+        print(Fore.YELLOW + "  info          ヘッダーとメタデータを表示（本体は復号しない、アーカイブならエントリーの一覧）")
+        print(Fore.YELLOW + "  rekey         --envelope で暗号化したファイルのパスワードを付け替える（鍵ブロックだけを書き換える）")
+        print(Fore.YELLOW + "  pack          複数のPDFを1つの暗号化アーカイブにまとめる（鍵導出は1回、--append で追加）")
+        print(Fore.YELLOW + "  unpack        アーカイブのPDFをすべて展開する")
+        print(Fore.YELLOW + "  watch         フォルダーを監視し、置かれたPDFを常駐のワーカーで暗号化")
+        print(Fore.YELLOW + "  serve         Unix ドメインソケットか localhost の HTTP で暗号化・復号を受け付ける")
         print(Fore.YELLOW + "\n引数:")
         print(Fore.YELLOW + "  --password, -p <パスワード>      暗号化/復号に使用するパスワード")
-        print(Fore.YELLOW + "  --output, -o <保存先ファイル名>  保存先のファイル名")
+        print(Fore.YELLOW + "  --output, -o <保存先ファイル名>  保存先のファイル名（encrypt / decrypt で - なら標準出力）")
+        print(Fore.YELLOW + "  -（入力ファイルとして）          encrypt / decrypt で標準入力から読む（1ファイルのみ、表示は標準エラー出力）")
         print(Fore.YELLOW + "  --force, -f                      既存ファイルを強制上書き")
         print(Fore.YELLOW + "  --remove                         処理後に元のファイルを削除")
+        print(Fore.YELLOW + "  --incremental [MANIFEST]         encrypt で前回から変わっていないPDFを飛ばす（記録: MANIFEST、既定: .pdfveil-manifest.json）")
+        print(Fore.YELLOW + "  --jobs, -j <N>                   並列に処理するプロセス数（省略時: 使用可能なCPU数）")
+        print(Fore.YELLOW + "  --threads <N>                    1ファイルの本体を並列に暗号化/復号するスレッド数（既定: 1）")
+        print(Fore.YELLOW + "  --prefetch <N>                   --jobs 1 のバッチで先読みするファイル数（読み込み・計算・書き込みを重ねる、0 で無効、既定: 2）")
+        print(Fore.YELLOW + "  --segment-size <SIZE>            本体を区切るセグメントのサイズ（例: 4M、既定: 1M）")
         print(Fore.YELLOW + "  --no-encrypt-metadata            メタデータを暗号化しない")
+        print(Fore.YELLOW + "  --single-kdf                     鍵導出(PBKDF2)を1回にまとめて高速化する")
+        print(Fore.YELLOW + "  --batch-key                      同じパスワードのファイル群で鍵導出を1回だけ行う（encrypt / watch / rekey）")
+        print(Fore.YELLOW + "  --raw                            PDFを解析せず元のファイルをそのまま暗号化（復号でバイト単位に一致）")
+        print(Fore.YELLOW + "  --envelope                       ランダムなデータ鍵で暗号化し、データ鍵だけをパスワードで包む（rekey で付け替えられる）")
+        print(Fore.YELLOW + "  --compress <CODEC[:LEVEL]>       本体を圧縮してから暗号化（zlib[:0-9]、zstandard があれば zstd[:1-22]、--paged とは併用不可）")
+        print(Fore.YELLOW + "  --new-password <パスワード>      rekey で設定する新しいパスワード（省略時は入力）")
+        print(Fore.YELLOW + "  --paged                          ページ単位で暗号化し、extract で必要なページだけ復号できるようにする")
+        print(Fore.YELLOW + "  --unit-pages <N>                 --paged で1つにまとめるページ数（既定: 1）")
+        print(Fore.YELLOW + "  --pages <ページ>                 extract で取り出すページ（例: 3-5、1,4,7-9、10-）")
+        print(Fore.YELLOW + "  --json                           info の結果をJSONで表示")
+        print(Fore.YELLOW + "  --append, -a                     pack で既存のアーカイブに追加する（格納済みのPDFは書き換えない）")
+        print(Fore.YELLOW + "  --output-dir <フォルダー>        watch で .veil を保存するフォルダー（省略時: PDFと同じフォルダー）、unpack の展開先（省略時: アーカイブ名のフォルダー）")
+        print(Fore.YELLOW + "  --settle <SECONDS>               watch で書き終えたとみなすまでの秒数（既定: 0.5）")
+        print(Fore.YELLOW + "  --socket <パス> / --port <ポート> serve で待ち受ける Unix ドメインソケット / HTTP のポート")
+        print(Fore.YELLOW + "  --max-queue <N>                  serve で実行中と待ちの合計の上限（超えたら 503、既定: 16）")
+        print(Fore.YELLOW + "  --max-body <SIZE>                serve で受け付ける本文の上限（超えたら 413、既定: 1G）")
+        print(Fore.YELLOW + "  --poll, --interval <SECONDS>     watch で inotify の代わりに一定間隔のスキャンを使う（既定: 1.0 秒）")
+        print(Fore.YELLOW + "  --fsync {none,file,full}         出力の同期方法（none: しない、file: 置き換え前に同期、full: ディレクトリも同期、既定: file）")
+        print(Fore.YELLOW + "  --stats [text|json]              段階ごとの所要時間とバイト数をファイルごと・合計で表示（標準エラー出力）")
+        print(Fore.YELLOW + "  --profile <FILE>                 cProfile の結果を pstats 形式で保存")
         print(Fore.YELLOW + "\nオプション:")
         print(Fore.YELLOW + "  --help          このヘルプを表示")
         print(Fore.YELLOW + "  --version       バージョン情報を表示")
@@ -87,14 +616,9 @@ def run_cli():
         print(Fore.CYAN + "  入力されたPDFファイルに対して、安全な暗号化を施し、パスワードを使って復号化します。")
         print(Fore.CYAN + "  このツールは、あなたのPDFのセキュリティを保護するために設計されています。\n")
         return
-    
-    # --version フラグが指定された場合
-    if args.version:
-        print(ASCII_LOGO)
-        print(f"📦 Version: {__version__}")
-        return
 
-    
+    from .stream import DEFAULT_SEGMENT_SIZE
+
     # サブコマンドの設定
     subparsers = parser.add_subparsers(dest="command", required=False)
 
@@ -107,12 +631,27 @@ def run_cli():
         description="🔐 指定されたPDFファイルをAES-GCMで暗号化します。",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    encrypt_parser.add_argument("inputpdf", help=Fore.YELLOW + "入力PDFファイルパス (複数指定可能、ワイルドカードも対応)" + Fore.RESET, nargs='+')
+    encrypt_parser.add_argument("inputpdf", help=Fore.YELLOW + "入力PDFファイルパス (複数指定可能、ワイルドカードも対応、- で標準入力)" + Fore.RESET, nargs='+')
     encrypt_parser.add_argument("-p" ,"--password", help=Fore.YELLOW + "暗号化に使うパスワード（1つ指定で共通、複数指定で個別対応）" + Fore.RESET, nargs='+')
-    encrypt_parser.add_argument("-o" ,"--output", help=Fore.YELLOW + "保存先ファイル名（省略時: .veil.pdf）" + Fore.RESET)
+    encrypt_parser.add_argument("-o" ,"--output", help=Fore.YELLOW + "保存先ファイル名（省略時: .veil.pdf、- で標準出力）" + Fore.RESET)
     encrypt_parser.add_argument("-f", "--force", action="store_true", help=Fore.YELLOW + "既存ファイルを強制上書きする" + Fore.RESET)
     encrypt_parser.add_argument("--remove", action="store_true", help=Fore.YELLOW + "暗号化後に元のPDFを削除する" + Fore.RESET)
+    encrypt_parser.add_argument("--incremental", nargs="?", const=".pdfveil-manifest.json", metavar="MANIFEST", help=Fore.YELLOW + "マニフェストに記録し、前回から変わっていないPDFを飛ばす（前回作った .veil は --force なしで上書き、既定: .pdfveil-manifest.json）" + Fore.RESET)
+    encrypt_parser.add_argument("-j", "--jobs", type=int, default=usable_cpu_count(), help=Fore.YELLOW + "並列に処理するプロセス数（省略時: 使用可能なCPU数）" + Fore.RESET)
+    encrypt_parser.add_argument("--prefetch", type=int, default=2, help=Fore.YELLOW + "--jobs 1 のバッチで、暗号化中に先読みするファイル数（読み込み・書き込みを重ねる、0 で無効、既定: 2）" + Fore.RESET)
+    encrypt_parser.add_argument("--threads", type=int, default=1, help=Fore.YELLOW + "1ファイルの本体を並列に暗号化するスレッド数（大きなPDF向け、既定: 1）" + Fore.RESET)
+    encrypt_parser.add_argument("--stats", nargs="?", const="text", choices=["text", "json"], help=Fore.YELLOW + "段階ごと（parse / kdf / body / aes_gcm / compress / write）の所要時間とバイト数を標準エラー出力に表示" + Fore.RESET)
+    encrypt_parser.add_argument("--profile", metavar="FILE", help=Fore.YELLOW + "cProfile の結果を pstats 形式で FILE に保存（並列実行時は全ワーカーの合計）" + Fore.RESET)
+    encrypt_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "出力の同期方法（none: しない / file: 一時ファイルを置き換える前に同期 / full: ディレクトリも同期、既定: file）" + Fore.RESET)
+    encrypt_parser.add_argument("--segment-size", type=parse_size, default=DEFAULT_SEGMENT_SIZE, help=Fore.YELLOW + "本体を区切るセグメントのサイズ（例: 4M、既定: 1M）" + Fore.RESET)
     encrypt_parser.add_argument("--no-encrypt-metadata", action="store_true", help=Fore.YELLOW + "メタデータを暗号化しない" + Fore.RESET)
+    encrypt_parser.add_argument("--single-kdf", action="store_true", help=Fore.YELLOW + "鍵導出(PBKDF2)を1回にまとめ、HKDFでメタデータ用・本体用の鍵を作る" + Fore.RESET)
+    encrypt_parser.add_argument("--batch-key", action="store_true", help=Fore.YELLOW + "実行全体でPBKDF2のソルトを共有し、同じパスワードの鍵導出を1回にまとめる（--single-kdf を含む）" + Fore.RESET)
+    encrypt_parser.add_argument("--raw", action="store_true", help=Fore.YELLOW + "PDFを解析・再構築せず元のファイルをそのまま暗号化する（メタデータも暗号文に含まれる）" + Fore.RESET)
+    encrypt_parser.add_argument("--envelope", action="store_true", help=Fore.YELLOW + "ランダムなデータ鍵で暗号化し、データ鍵だけをパスワードで包む（pdfveil rekey で本体を読まずにパスワードを付け替えられる）" + Fore.RESET)
+    encrypt_parser.add_argument("--compress", metavar="CODEC[:LEVEL]", type=compression_arg, help=Fore.YELLOW + "本体の平文を圧縮してから暗号化する（zlib / zlib:9、zstandard があれば zstd / zstd:19。復号は展開しながら書き出す。--paged とは併用不可）" + Fore.RESET)
+    encrypt_parser.add_argument("--paged", action="store_true", help=Fore.YELLOW + "ページ単位のPDFと索引に分けて暗号化し、extract で必要なページだけ復号できるようにする" + Fore.RESET)
+    encrypt_parser.add_argument("--unit-pages", type=int, default=1, help=Fore.YELLOW + "--paged で1つの単位にまとめるページ数（既定: 1）" + Fore.RESET)
 
     # 復号コマンド
     decrypt_parser = subparsers.add_parser(
@@ -122,13 +661,122 @@ def run_cli():
         description="🔓 .veil ファイルを復号して元のPDFに戻します。",
         formatter_class=argparse.RawTextHelpFormatter
     )
-    decrypt_parser.add_argument("veilpdf", help=Fore.YELLOW + "暗号化されたファイル（.veil.pdf）" + Fore.RESET, nargs='+')
+    decrypt_parser.add_argument("veilpdf", help=Fore.YELLOW + "暗号化されたファイル（.veil.pdf、- で標準入力）" + Fore.RESET, nargs='+')
     decrypt_parser.add_argument("-p", "--password", help=Fore.YELLOW + "復号に使うパスワード（1つ指定で共通、複数指定で個別対応）" + Fore.RESET, nargs='+')
-    decrypt_parser.add_argument("-o" ,"--output", help=Fore.YELLOW + "保存先ファイル名（省略時: .decrypted.pdf）" + Fore.RESET)
+    decrypt_parser.add_argument("-o" ,"--output", help=Fore.YELLOW + "保存先ファイル名（省略時: .decrypted.pdf、- で標準出力）" + Fore.RESET)
     decrypt_parser.add_argument("-f", "--force", action="store_true", help=Fore.YELLOW + "既存ファイルを強制上書きする" + Fore.RESET)
     decrypt_parser.add_argument("--remove", action="store_true", help=Fore.YELLOW + "復号後に .veil ファイルを削除する" + Fore.RESET)
+    decrypt_parser.add_argument("-j", "--jobs", type=int, default=usable_cpu_count(), help=Fore.YELLOW + "並列に処理するプロセス数（省略時: 使用可能なCPU数）" + Fore.RESET)
+    decrypt_parser.add_argument("--prefetch", type=int, default=2, help=Fore.YELLOW + "--jobs 1 のバッチで、復号中に先読みするファイル数（読み込み・書き込みを重ねる、0 で無効、既定: 2）" + Fore.RESET)
+    decrypt_parser.add_argument("--threads", type=int, default=1, help=Fore.YELLOW + "1ファイルの本体を並列に復号するスレッド数（大きなPDF向け、既定: 1）" + Fore.RESET)
+    decrypt_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "出力の同期方法（none: しない / file: 一時ファイルを置き換える前に同期 / full: ディレクトリも同期、既定: file）" + Fore.RESET)
+    decrypt_parser.add_argument("--stats", nargs="?", const="text", choices=["text", "json"], help=Fore.YELLOW + "段階ごと（parse / kdf / body / aes_gcm / compress / write）の所要時間とバイト数を標準エラー出力に表示" + Fore.RESET)
+    decrypt_parser.add_argument("--profile", metavar="FILE", help=Fore.YELLOW + "cProfile の結果を pstats 形式で FILE に保存（並列実行時は全ワーカーの合計）" + Fore.RESET)
 
     
+    # ページ取り出しコマンド
+    extract_parser = subparsers.add_parser(
+        "extract",
+        help=Fore.YELLOW + "指定したページだけを復号して取り出す" + Fore.RESET,
+        description="📄 .veil ファイルから指定したページだけを復号してPDFとして保存します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    extract_parser.add_argument("veilpdf", help=Fore.YELLOW + "暗号化されたファイル（.veil）、またはアーカイブと取り出すPDFの名前" + Fore.RESET, nargs='+')
+    extract_parser.add_argument("--pages", help=Fore.YELLOW + "取り出すページ（例: 3-5、1,4,7-9、10-、.veil では必須）" + Fore.RESET)
+    extract_parser.add_argument("-p", "--password", help=Fore.YELLOW + "復号に使うパスワード（1つ指定で共通、複数指定で個別対応）" + Fore.RESET, nargs='+')
+    extract_parser.add_argument("-o" ,"--output", help=Fore.YELLOW + "保存先ファイル名（省略時: .pages-<ページ>.pdf）、アーカイブでは保存先フォルダー（省略時: アーカイブと同じフォルダー）" + Fore.RESET)
+    extract_parser.add_argument("-f", "--force", action="store_true", help=Fore.YELLOW + "既存ファイルを強制上書きする" + Fore.RESET)
+    extract_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "出力の同期方法（none: しない / file: 一時ファイルを置き換える前に同期 / full: ディレクトリも同期、既定: file）" + Fore.RESET)
+
+    # ファイル情報の表示コマンド
+    info_parser = subparsers.add_parser(
+        "info",
+        help=Fore.YELLOW + "ヘッダーとメタデータを表示する（本体は復号しない）" + Fore.RESET,
+        description="🔎 .veil ファイルのヘッダーを表示します。パスワードを指定するとメタデータも復号・検証します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    info_parser.add_argument("veilpdf", help=Fore.YELLOW + "暗号化されたファイル（.veil）またはアーカイブ" + Fore.RESET, nargs='+')
+    info_parser.add_argument("-p", "--password", help=Fore.YELLOW + "メタデータ（アーカイブでは索引）の復号・検証に使うパスワード（省略時はヘッダーと平文のメタデータのみ）" + Fore.RESET)
+    info_parser.add_argument("--json", action="store_true", help=Fore.YELLOW + "結果をJSONで表示" + Fore.RESET)
+
+    # パスワード付け替えコマンド
+    rekey_parser = subparsers.add_parser(
+        "rekey",
+        help=Fore.YELLOW + "--envelope で暗号化したファイルのパスワードを付け替える" + Fore.RESET,
+        description="🔁 データ鍵を包み直し、ファイル先頭の鍵ブロック（76バイト）だけをその場で書き換えます。本体は読みません。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    rekey_parser.add_argument("veilpdf", help=Fore.YELLOW + "暗号化されたファイル（--envelope で作った .veil、複数指定可能、ワイルドカードも対応）" + Fore.RESET, nargs='+')
+    rekey_parser.add_argument("-p", "--password", help=Fore.YELLOW + "現在のパスワード（1つ指定で共通、複数指定で個別対応）" + Fore.RESET, nargs='+')
+    rekey_parser.add_argument("--new-password", help=Fore.YELLOW + "新しいパスワード（省略時は入力）" + Fore.RESET)
+    rekey_parser.add_argument("--batch-key", action="store_true", help=Fore.YELLOW + "新しいパスワードのPBKDF2ソルトを実行全体で共有し、鍵導出を1回にまとめる（速いが、1回の総当たりで全ファイルを試せる）" + Fore.RESET)
+    rekey_parser.add_argument("-j", "--jobs", type=int, default=usable_cpu_count(), help=Fore.YELLOW + "並列に処理するプロセス数（省略時: 使用可能なCPU数）" + Fore.RESET)
+    rekey_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "書き換えた鍵ブロックを同期するか（none 以外なら同期、既定: file）" + Fore.RESET)
+
+    # アーカイブ作成コマンド
+    pack_parser = subparsers.add_parser(
+        "pack",
+        help=Fore.YELLOW + "複数のPDFを1つの暗号化アーカイブにまとめる" + Fore.RESET,
+        description="📦 複数のPDFを1つのファイルに暗号化して格納します。鍵導出(PBKDF2)はアーカイブごとに1回です。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    pack_parser.add_argument("archive", help=Fore.YELLOW + "アーカイブのファイル名（例: docs.varc）" + Fore.RESET)
+    pack_parser.add_argument("inputpdf", help=Fore.YELLOW + "格納するPDFファイル（複数指定可能、ワイルドカードも対応、名前はファイル名）" + Fore.RESET, nargs='+')
+    pack_parser.add_argument("-p", "--password", help=Fore.YELLOW + "アーカイブのパスワード（省略時は入力）" + Fore.RESET)
+    pack_parser.add_argument("-a", "--append", action="store_true", help=Fore.YELLOW + "既存のアーカイブに追加する（格納済みのPDFは書き換えない）" + Fore.RESET)
+    pack_parser.add_argument("-f", "--force", action="store_true", help=Fore.YELLOW + "既存のアーカイブを作り直す（--append では同じ名前のPDFを置き換える）" + Fore.RESET)
+    pack_parser.add_argument("--segment-size", type=parse_size, default=DEFAULT_SEGMENT_SIZE, help=Fore.YELLOW + "PDFを区切るセグメントのサイズ（例: 4M、既定: 1M）" + Fore.RESET)
+    pack_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "出力の同期方法（none: しない / file: 一時ファイルを置き換える前・索引を切り替える前に同期 / full: ディレクトリも同期、既定: file）" + Fore.RESET)
+
+    # アーカイブ展開コマンド
+    unpack_parser = subparsers.add_parser(
+        "unpack",
+        help=Fore.YELLOW + "アーカイブのPDFをすべて展開する" + Fore.RESET,
+        description="📂 アーカイブに格納されたPDFをすべて復号してフォルダーに保存します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    unpack_parser.add_argument("archive", help=Fore.YELLOW + "アーカイブのファイル名" + Fore.RESET)
+    unpack_parser.add_argument("-p", "--password", help=Fore.YELLOW + "アーカイブのパスワード（省略時は入力）" + Fore.RESET)
+    unpack_parser.add_argument("-o", "--output-dir", help=Fore.YELLOW + "展開先のフォルダー（省略時: アーカイブ名から拡張子を除いたフォルダー）" + Fore.RESET)
+    unpack_parser.add_argument("-f", "--force", action="store_true", help=Fore.YELLOW + "既存ファイルを強制上書きする" + Fore.RESET)
+    unpack_parser.add_argument("--threads", type=int, default=1, help=Fore.YELLOW + "1つのPDFを並列に復号するスレッド数（既定: 1）" + Fore.RESET)
+    unpack_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "出力の同期方法（none: しない / file: 一時ファイルを置き換える前に同期 / full: ディレクトリも同期、既定: file）" + Fore.RESET)
+
+    # フォルダー監視コマンド
+    watch_parser = subparsers.add_parser(
+        "watch",
+        help=Fore.YELLOW + "フォルダーを監視し、置かれたPDFを暗号化する" + Fore.RESET,
+        description="👀 フォルダーを監視し、書き込みが終わったPDFを常駐のワーカーで暗号化します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    watch_parser.add_argument("directory", help=Fore.YELLOW + "監視するフォルダー" + Fore.RESET)
+    watch_parser.add_argument("-p", "--password", help=Fore.YELLOW + "暗号化に使うパスワード（省略時は起動時に入力）" + Fore.RESET)
+    watch_parser.add_argument("-o", "--output-dir", help=Fore.YELLOW + ".veil の保存先フォルダー（省略時: PDFと同じフォルダー）" + Fore.RESET)
+    watch_parser.add_argument("-f", "--force", action="store_true", help=Fore.YELLOW + "既存ファイルを強制上書きする" + Fore.RESET)
+    watch_parser.add_argument("--remove", action="store_true", help=Fore.YELLOW + "暗号化後に元のPDFを削除する" + Fore.RESET)
+    watch_parser.add_argument("-j", "--jobs", type=int, default=usable_cpu_count(), help=Fore.YELLOW + "常駐させるワーカープロセス数（省略時: 使用可能なCPU数）" + Fore.RESET)
+    watch_parser.add_argument("--settle", type=float, default=0.5, help=Fore.YELLOW + "大きさと更新時刻がこの秒数変わらなければ書き終えたとみなす（既定: 0.5）" + Fore.RESET)
+    watch_parser.add_argument("--poll", action="store_true", help=Fore.YELLOW + "inotify を使わず一定間隔のスキャンで監視する（NFS など）" + Fore.RESET)
+    watch_parser.add_argument("--interval", type=float, default=1.0, help=Fore.YELLOW + "スキャンの間隔（秒、既定: 1.0）" + Fore.RESET)
+    watch_parser.add_argument("--no-encrypt-metadata", action="store_true", help=Fore.YELLOW + "メタデータを暗号化しない" + Fore.RESET)
+    watch_parser.add_argument("--batch-key", action="store_true", help=Fore.YELLOW + "監視中はPBKDF2のソルトを共有し、鍵導出をワーカーごとに1回にまとめる" + Fore.RESET)
+    watch_parser.add_argument("--fsync", choices=["none", "file", "full"], default="file", help=Fore.YELLOW + "出力の同期方法（none: しない / file: 一時ファイルを置き換える前に同期 / full: ディレクトリも同期、既定: file）" + Fore.RESET)
+
+    # ローカルサービスコマンド
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help=Fore.YELLOW + "Unix ドメインソケットか localhost の HTTP で暗号化・復号を受け付ける" + Fore.RESET,
+        description="🛰 POST /encrypt・/decrypt を常駐のワーカーで処理するローカルサービスを起動します。",
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    listen_group = serve_parser.add_mutually_exclusive_group(required=True)
+    listen_group.add_argument("--socket", help=Fore.YELLOW + "待ち受ける Unix ドメインソケットのパス" + Fore.RESET)
+    listen_group.add_argument("--port", type=int, help=Fore.YELLOW + "待ち受ける HTTP のポート" + Fore.RESET)
+    serve_parser.add_argument("--host", default="127.0.0.1", help=Fore.YELLOW + "HTTP で待ち受けるアドレス（既定: 127.0.0.1）" + Fore.RESET)
+    serve_parser.add_argument("-j", "--jobs", type=int, default=usable_cpu_count(), help=Fore.YELLOW + "常駐させるワーカープロセス数（省略時: 使用可能なCPU数）" + Fore.RESET)
+    serve_parser.add_argument("--max-queue", type=int, default=16, help=Fore.YELLOW + "実行中と待ちの合計の上限。超えたリクエストには 503 を返す（既定: 16）" + Fore.RESET)
+    serve_parser.add_argument("--max-body", type=parse_size, default=parse_size("1G"), help=Fore.YELLOW + "受け付ける本文の上限（例: 256M）。超えたリクエストには 413 を返す（既定: 1G）" + Fore.RESET)
+
     # 最終的に引数をすべて再解析
     args = parser.parse_args()
         
@@ -140,6 +788,55 @@ def run_cli():
         print("  python main.py decrypt <暗号化されたファイル> --password <パスワード>")
         exit(1)
 
+    # serve はファイルを受け取らず、パスワードはリクエストごとに受け取る
+    if args.command == "serve":
+        run_server(args.socket, args.host, args.port, max(1, args.jobs), max(1, args.max_queue), max(1, args.max_body))
+        return
+
+    # watch はフォルダーを1つ受け取り、パスワードを1回だけ尋ねる
+    if args.command == "watch":
+        if not os.path.isdir(args.directory):
+            print(f"[!] 指定されたフォルダー '{args.directory}' が見つかりません。")
+            exit(1)
+        if args.output_dir:
+            os.makedirs(args.output_dir, exist_ok=True)
+        password = args.password or getpass.getpass(f"🔑 Enter password for {args.directory}: ")
+        if not password:
+            print("[!] パスワードが必要です。")
+            exit(1)
+        from .utils import confirm_password_strength, generate_salt
+        password = confirm_password_strength(password, args.directory)
+        watch_and_encrypt(args.directory, password, output_dir=args.output_dir, remove=args.remove, force=args.force, jobs=max(1, args.jobs),
+                          settle=args.settle, polling=args.poll, interval=args.interval, encrypt_metadata=not args.no_encrypt_metadata,
+                          kdf_salt=generate_salt() if args.batch_key else None, fsync=args.fsync)
+        return
+
+    # pack / unpack はアーカイブ1つを扱い、パスワードを1回だけ尋ねる
+    if args.command in ["pack", "unpack"]:
+        run_archive_command(args)
+        return
+
+    # extract の最初のファイルがアーカイブなら、残りは取り出すPDFの名前
+    if args.command == "extract" and os.path.isfile(args.veilpdf[0]):
+        from .archive import is_archive
+        if is_archive(args.veilpdf[0]):
+            if len(args.veilpdf) < 2:
+                print("[!] アーカイブから取り出すPDFの名前を指定してください。")
+                exit(1)
+            run_archive_command(args, names=args.veilpdf[1:])
+            return
+    if args.command == "extract" and not args.pages:
+        print("[!] エラー: --pages で取り出すページを指定してください。")
+        exit(1)
+
+    # '-' は標準入力・標準出力（パイプの途中で使う。1ファイルだけ、確認の入力はしない）
+    if args.command in ["encrypt", "enc", "decrypt", "dec"]:
+        mode = "encrypt" if args.command in ["encrypt", "enc"] else "decrypt"
+        inputs = args.inputpdf if mode == "encrypt" else args.veilpdf
+        if "-" in inputs or args.output == "-":
+            run_stdio_command(args, mode, inputs)
+            return
+
     # ワイルドカードによる複数ファイルを処理
     all_files = []
     for file in args.inputpdf if args.command in ["encrypt", "enc"] else args.veilpdf:
@@ -148,22 +845,43 @@ def run_cli():
     if not all_files:
         print(f"[!] 指定されたファイルが見つかりません。")
         exit(1)
-    
+
+    # info はパスワードを尋ねない（指定されたときだけメタデータを検証する）
+    if args.command == "info":
+        show_info(all_files, args.password, args.json)
+        return
+
+    # --incremental: 前回から変わっていないPDFを除く（パスワードも変わったものだけ尋ねる）
+    # -p で渡されたパスワードは前回と照合し、違えば暗号化し直す（尋ねたパスワードは照合できないので記録だけする）
+    targets = all_files
+    manifest = None
+    overwrite = frozenset()
+    if args.command in ["encrypt", "enc"] and args.incremental:
+        password_for = None
+        if args.password and len(args.password) in (1, len(all_files)):
+            given = dict(zip(all_files, args.password * len(all_files) if len(args.password) == 1 else args.password))
+            password_for = given.get
+        manifest, targets, overwrite = plan_incremental(args, all_files, password_for)
+        if not targets:
+            manifest.save(args.fsync)
+            return
+
     # パスワード処理
     passwords = []
     if args.password:
         if len(args.password) == 1:
             # 一つさけ指定 -> 全ファイルに共有パスワード
-            passwords = args.password * len(all_files)
+            passwords = args.password * len(targets)
         elif len(args.password) == len(all_files):
             # ファイル数と一致 -> 個別パスワード
-            passwords = args.password
+            by_file = dict(zip(all_files, args.password))
+            passwords = [by_file[file] for file in targets]
         else:
             print(f"[!] エラー: パスワードの数 ({len(args.password)}) がファイル数 ({len(all_files)}) と一致しません。")
             exit(1)
     else:
         # パスワード未指定 -> ユーザーから入力
-        for file in all_files:
+        for file in targets:
             password = getpass.getpass(f"🔑 Enter password for {file}: ")
             if not password:
                 print("[!] パスワードが必要です。")
@@ -174,6 +892,26 @@ def run_cli():
     # サブコマンド実行
     if args.command in ["encrypt", "enc"]:
         encrypt_metadata = not args.no_encrypt_metadata  # no-encrypt-metadata が指定された場合は False
-        process_files_one_by_one(all_files, "encrypt", args.force, passwords, remove=args.remove, output=args.output, encrypt_metadata=encrypt_metadata)
+        # --batch-key: この実行で共通のPBKDF2ソルトを1つ作り、ファイルごとの鍵はHKDFで分ける
+        from .utils import generate_salt
+        kdf_salt = generate_salt() if args.batch_key else None
+        results = process_files_one_by_one(targets, "encrypt", args.force, passwords, remove=args.remove, output=args.output, jobs=args.jobs, overwrite=overwrite, encrypt_metadata=encrypt_metadata, single_kdf=args.single_kdf, kdf_salt=kdf_salt, raw=args.raw, paged=args.paged, unit_pages=args.unit_pages, envelope=args.envelope, compression=args.compress, threads=args.threads, prefetch=args.prefetch, segment_size=args.segment_size, fsync=args.fsync, stats=args.stats, profile=args.profile)
+        if manifest is not None:
+            # 成功したものだけ記録する（失敗したものは次回もう一度暗号化する）
+            manifest.record(results, password_for=dict(zip(targets, passwords)).get)
+            manifest.save(args.fsync)
     elif args.command in ["decrypt", "dec"]:
-        process_files_one_by_one(all_files, "decrypt", args.force, passwords, remove=args.remove, output=args.output)
+        process_files_one_by_one(all_files, "decrypt", args.force, passwords, remove=args.remove, output=args.output, jobs=args.jobs, threads=args.threads, prefetch=args.prefetch, fsync=args.fsync, stats=args.stats, profile=args.profile)
+    elif args.command == "extract":
+        process_files_one_by_one(all_files, "extract", args.force, passwords, output=args.output, fsync=args.fsync, pages=args.pages)
+    elif args.command == "rekey":
+        new_password = args.new_password or getpass.getpass("🔑 Enter new password: ")
+        if not new_password:
+            print("[!] 新しいパスワードが必要です。")
+            exit(1)
+        from .utils import confirm_password_strength, generate_salt
+        new_password = confirm_password_strength(new_password, "新しいパスワード")
+        # 新しいPBKDF2ソルトはファイルごとに作る。--batch-key なら実行全体で共通にし、新しい鍵の導出をワーカーごとに1回にまとめる
+        # 書き換えるのは先頭の76バイトだけなので、先読み（prefetch）はしない
+        process_files_one_by_one(all_files, "rekey", False, passwords, jobs=args.jobs, prefetch=0, fsync=args.fsync, new_password=new_password,
+                                 kdf_salt=generate_salt() if args.batch_key else None)
@@ -0,0 +1,153 @@
+# pdfveil/compress.py
+# 暗号化前の本体の圧縮（--compress zlib[:LEVEL] / zstd[:LEVEL]、flag 0x20）
+# 暗号文は圧縮できないので、本体の平文を暗号化の前に圧縮する。
+# ヘッダーの segment_size の直後に codec(1)（1: zlib、2: zstd）を置く。レベルは展開に不要なので記録しない。
+# 復号では認証済みのセグメントを順に展開して書き出す（全体をメモリに載せない）。
+# zstd は zstandard パッケージがあるときだけ使える。
+# 平文の位置でシークする --paged とは併用できない。
+
+import zlib
+from .stats import timed
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODECS = {"zlib": CODEC_ZLIB, "zstd": CODEC_ZSTD}
+CODEC_NAMES = {codec: name for name, codec in CODECS.items()}
+DEFAULT_LEVELS = {"zlib": 6, "zstd": 3}
+LEVEL_RANGES = {"zlib": (0, 9), "zstd": (1, 22)}
+MAX_OUTPUT_CHUNK = 4 * 1024 * 1024  # 展開で一度に取り出す上限（圧縮率の極端なデータでメモリを使い切らない）
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ValueError("zstd を使うには zstandard パッケージが必要です（pip install zstandard）")
+    return zstandard
+
+
+def parse_compression(value: str) -> tuple:
+    """'zlib' / 'zlib:9' / 'zstd:3' のような指定を (コーデック名, レベル) に変換"""
+    name, _, level = value.strip().lower().partition(":")
+    if name not in CODECS:
+        raise ValueError(f"未対応の圧縮方式です: {name}（zlib / zstd）")
+    try:
+        level = int(level) if level else DEFAULT_LEVELS[name]
+    except ValueError:
+        raise ValueError(f"圧縮レベルの指定が不正です: {value}")
+    low, high = LEVEL_RANGES[name]
+    if not low <= level <= high:
+        raise ValueError(f"{name} の圧縮レベルは {low}〜{high} で指定してください: {level}")
+    if name == "zstd":
+        _zstandard()
+    return name, level
+
+
+class CompressingWriter:
+    """書き込まれた平文を圧縮して dst に流すファイル風オブジェクト
+
+    tell は圧縮前の位置を返すので、PdfWriter.write() にそのまま渡せる。
+    close() で圧縮の残りを書き出す（dst は閉じない）。
+    stats を渡すと圧縮の時間と平文のバイト数を compress に記録する。
+    """
+
+    def __init__(self, dst, codec: str, level: int, stats=None):
+        self._dst = dst
+        if codec == "zlib":
+            self._compressor = zlib.compressobj(level)
+        else:
+            self._compressor = _zstandard().ZstdCompressor(level=level).compressobj()
+        self._position = 0
+        self._stats = stats
+        self.closed = False
+
+    def write(self, data) -> int:
+        size = memoryview(data).nbytes
+        compressed = timed(self._stats, "compress", size, self._compressor.compress, data)
+        if compressed:
+            self._dst.write(compressed)
+        self._position += size
+        return size
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._dst.write(timed(self._stats, "compress", 0, self._compressor.flush))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def _iter_zlib(chunks, stats):
+    decompressor = zlib.decompressobj()
+    for chunk in chunks:
+        data = chunk
+        while data:
+            # 出力を MAX_OUTPUT_CHUNK ずつ取り出し、残りの入力は unconsumed_tail に残る
+            plaintext = timed(stats, "compress", 0, decompressor.decompress, data, MAX_OUTPUT_CHUNK)
+            if plaintext:
+                yield plaintext
+            data = decompressor.unconsumed_tail
+    plaintext = decompressor.flush()
+    if plaintext:
+        yield plaintext
+    if not decompressor.eof:
+        raise ValueError("圧縮された本体が途中で切れています")
+
+
+class _ChunkReader:
+    # 断片のイテレーターを stream_reader に渡せる read(size) にする（断片は使い回されるのでコピーして返す）
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._chunk = memoryview(b"")
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._chunk:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._chunk = memoryview(chunk)
+        if size < 0:
+            size = len(self._chunk)
+        data = bytes(self._chunk[:size])
+        self._chunk = self._chunk[size:]
+        return data
+
+
+def _iter_zstd(chunks, stats):
+    # decompressobj は1回の出力に上限がないので、stream_reader から MAX_OUTPUT_CHUNK ずつ取り出す
+    # （stream_reader は切れたフレームを検出しないが、本体の切り詰めや付け足しは最終セグメントの認証で先に検出される）
+    zstandard = _zstandard()
+    reader = zstandard.ZstdDecompressor().stream_reader(_ChunkReader(chunks), read_across_frames=False)
+    try:
+        while True:
+            plaintext = timed(stats, "compress", 0, reader.read, MAX_OUTPUT_CHUNK)
+            if not plaintext:
+                break
+            yield plaintext
+    except zstandard.ZstdError as e:
+        raise ValueError(f"本体を展開できません: {e}")
+
+
+def iter_decompressed(chunks, codec: int, stats=None):
+    """圧縮された本体の断片 chunks を順に展開して返す"""
+    if codec == CODEC_ZLIB:
+        iterator = _iter_zlib(chunks, stats)
+    elif codec == CODEC_ZSTD:
+        iterator = _iter_zstd(chunks, stats)
+    else:
+        raise ValueError(f"未対応の圧縮方式です: {codec}")
+    try:
+        yield from iterator
+    except zlib.error as e:
+        raise ValueError(f"本体を展開できません: {e}")
@@ -3,61 +3,331 @@ import struct
 import sys
 import hmac
 import hashlib
+import re
+import shutil
+import tempfile
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from .utils import derive_key
+from .utils import derive_file_keys, derive_meta_key
+from .format import MAGIC, VERSION_1, VERSION_2, FLAG_META_ENCRYPTED, FLAG_SINGLE_KDF, FLAG_RAW, FLAG_PAGED, FLAG_ENVELOPE, FLAG_COMPRESSED, FLAG_NAMES, KNOWN_FLAGS, body_aad
+from .compress import CODEC_NAMES, iter_decompressed
+from .envelope import KEY_BLOCK, envelope_keys, unwrap_data_key
+from .stream import DEFAULT_SEGMENT_SIZE, NONCE_PREFIX_SIZE, SegmentReader, cipher_update, decrypted_body_size, iter_decrypted_segments, read_full, read_full_into, segment_buffer, stream_size
+from .mmapio import MappedOutput, can_map_output, map_input, decrypt_mapped
+from .stats import Stats, TimedWriter, timed
+from .paged import build_pages_pdf, parse_page_ranges, read_page_index
+from .output import AtomicOutput, DEFAULT_FSYNC, check_fsync_policy, preallocate, print_after_commit
 from io import BytesIO
 from pypdf import PdfReader, PdfWriter
+from pypdf.generic import DictionaryObject, NameObject, create_string_object
 
-def decrypt_pdf(input_path: str, password: str, output_path: str = None, force: bool = False, skip_strength_check=False):
+# pypdf でメタデータを書き戻すときは、このサイズまでメモリ上で組み立てる
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+# 増分更新のためにトレーラーを探す本体末尾の範囲
+TRAILER_SEARCH_SIZE = 4096
+
+def _read_header_field(f, size: int) -> bytes:
+    # ヘッダーの1項目を読み切る（途中で終わっていれば無効なファイル）
+    data = read_full(f, size)
+    if len(data) != size:
+        raise ValueError("無効なVEILファイル: ヘッダーが途中で切れています")
+    return data
+
+def read_metadata_section(f, encrypt_metadata: bool) -> dict:
+    """メタデータ部を読み込む（検証・復号は open_metadata_section で行う）"""
+    if encrypt_metadata:
+        # [meta_salt(16)][meta_iv(12)][meta_len(4)][meta_ciphertext(?)][meta_tag(16)]
+        salt = _read_header_field(f, 16)
+        iv = _read_header_field(f, 12)
+        length = struct.unpack(">I", _read_header_field(f, 4))[0]
+        return {"encrypted": True, "salt": salt, "iv": iv, "data": _read_header_field(f, length), "tag": _read_header_field(f, 16)}
+    # [meta_salt(16)][meta_len(4)][meta_plaintext(?)][meta_hmac(32)]
+    salt = _read_header_field(f, 16)
+    length = struct.unpack(">I", _read_header_field(f, 4))[0]
+    return {"encrypted": False, "salt": salt, "data": _read_header_field(f, length), "tag": _read_header_field(f, 32)}
+
+def open_metadata_section(section: dict, meta_key: bytes) -> bytes:
+    """メタデータ部を復号（平文の場合はHMACを検証）して返す"""
+    if section["encrypted"]:
+        cipher = Cipher(algorithms.AES(meta_key), modes.GCM(section["iv"], section["tag"]))
+        decryptor = cipher.decryptor()
+        try:
+            return decryptor.update(section["data"]) + decryptor.finalize()
+        except InvalidTag:
+            raise ValueError("メタデータの認証に失敗しました。パスワードが間違っているか、ファイルが破損しています。")
+
+    expected_tag = hmac.new(meta_key, section["data"], hashlib.sha256).digest()
+    if not hmac.compare_digest(section["tag"], expected_tag):
+        raise ValueError("メタデータのHMAC検証に失敗しました。パスワードが間違っている可能性があります。")
+    return section["data"]
+
+def read_veil_header(f) -> dict:
+    """.veil のヘッダーとメタデータ部を読み込む（鍵の導出・検証はしない）
+
+    version 2 では nonce_prefix / segment_size と、本体の先頭位置 body_offset（シークできなければ None）も返す。
+    圧縮したもの（flag 0x20）は codec も返す（それ以外は None）。
+    version 2 では本体の各セグメントで認証するヘッダー body_aad も返す。
+    """
+    magic = read_full(f, 4)
+    if magic != MAGIC:
+        raise ValueError("無効なVEILファイル: magicヘッダーが見つかりません")
+
+    version = _read_header_field(f, 1)
+    if version not in (VERSION_1, VERSION_2):
+        raise ValueError(f"未対応のバージョン: {version.hex()}")
+
+    flag = _read_header_field(f, 1)[0]
+    if flag & ~KNOWN_FLAGS[version]:
+        # 新しい形式のファイルを古い形式として読み違えないよう、知らないビットは拒否する
+        raise ValueError(f"無効なVEILファイル: 未対応のフラグです（0x{flag:02x}）")
+    header = {
+        "version": version,
+        "flag": flag,
+        "encrypt_metadata": bool(flag & FLAG_META_ENCRYPTED),
+        "single_kdf": version != VERSION_1 and bool(flag & FLAG_SINGLE_KDF),
+        "envelope": version != VERSION_1 and bool(flag & FLAG_ENVELOPE),
+    }
+    if header["envelope"]:
+        # 包んだデータ鍵（AAD は先頭6バイト）
+        header["key_block"] = _read_header_field(f, KEY_BLOCK.size)
+        header["key_block_aad"] = magic + version + bytes([flag])
+    # --- メタデータ部（鍵はまだ導出せず読み込むだけ）---
+    header["meta_section"] = read_metadata_section(f, header["encrypt_metadata"])
+    header["body_salt"] = _read_header_field(f, 16)
+    if version == VERSION_2:
+        header["nonce_prefix"] = _read_header_field(f, NONCE_PREFIX_SIZE)
+        header["segment_size"] = struct.unpack(">I", _read_header_field(f, 4))[0]
+        header["codec"] = _read_header_field(f, 1)[0] if flag & FLAG_COMPRESSED else None
+        if header["codec"] is not None and flag & FLAG_PAGED:
+            raise ValueError("無効なVEILファイル: ページ単位の本体は圧縮できません")
+        header["body_aad"] = body_aad(flag, header["meta_section"]["salt"], header["body_salt"], header["nonce_prefix"],
+                                      header["segment_size"], header["codec"])
+        header["body_offset"] = f.tell() if f.seekable() else None  # パイプでは位置が分からない
+    return header
+
+def derive_veil_keys(header: dict, password: str, key_cache=None) -> tuple:
+    """ヘッダーのソルト（エンベロープ形式では包んだデータ鍵）から (meta_key, body_key) を導出"""
+    if header["envelope"]:
+        data_key = unwrap_data_key(header["key_block"], password, header["key_block_aad"], key_cache)
+        return envelope_keys(data_key, header["body_salt"])
+    return derive_file_keys(password, header["meta_section"]["salt"], header["body_salt"], header["single_kdf"], key_cache=key_cache)
+
+def inspect_veil(input_path: str, password: str = None, key_cache=None) -> dict:
+    """ヘッダーとメタデータ部だけを読み、ファイルの情報を辞書で返す（本体は読まない）
+
+    password を渡すとメタデータ用の鍵だけを導出し、メタデータを復号・検証する。
+    パスワードなしでも平文のメタデータは表示できるが、HMAC は検証されない。
+    """
     with open(input_path, "rb") as f:
-        magic = f.read(4)
-        if magic != b"VEIL":
-            raise ValueError("無効なVEILファイル: magicヘッダーが見つかりません")
-        
-        version = f.read(1)
-        if version != b"\x01":
-            raise ValueError(f"未対応のバージョン: {version.hex()}")
-
-        flag = f.read(1)
-
-        encrypt_metadata = flag == b'\x01'
-
-        # --- メタデータ処理 ---
-        meta_data = b""
-        if encrypt_metadata:
-            meta_salt = f.read(16)
-            metadata_iv = f.read(12)
-            metadata_len = struct.unpack(">I", f.read(4))[0]
-            metadata_ciphertext = f.read(metadata_len)
-            metadata_tag = f.read(16)
-            meta_key = derive_key(password, meta_salt, mode='dec', file=input_path, skip_strength_check=skip_strength_check)
-
-            cipher = Cipher(algorithms.AES(meta_key), modes.GCM(metadata_iv, metadata_tag))
-            decryptor = cipher.decryptor()
-            meta_data = decryptor.update(metadata_ciphertext) + decryptor.finalize()
+        file_size = os.fstat(f.fileno()).st_size
+        header = read_veil_header(f)
+        section = header["meta_section"]
+        info = {
+            "file": input_path,
+            "version": header["version"][0],
+            "flags": [name for bit, name in FLAG_NAMES if header["flag"] & bit],
+            "metadata_encrypted": header["encrypt_metadata"],
+            "metadata_size": len(section["data"]),
+            "file_size": file_size,
+        }
+        if header["version"] == VERSION_1:
+            f.seek(12, os.SEEK_CUR)  # iv
+            info["body_size"] = struct.unpack(">I", f.read(4))[0] + 16
+        else:
+            info["segment_size"] = header["segment_size"]
+            info["body_size"] = file_size - header["body_offset"]
+            if header["codec"] is not None:
+                info["compression"] = CODEC_NAMES.get(header["codec"], str(header["codec"]))
+
+        meta_data = None
+        if password is not None and header["envelope"]:
+            meta_data = open_metadata_section(section, derive_veil_keys(header, password, key_cache)[0])
+        elif password is not None:
+            meta_key = derive_meta_key(password, section["salt"], header["body_salt"], header["single_kdf"], key_cache=key_cache)
+            meta_data = open_metadata_section(section, meta_key)
+        elif not section["encrypted"]:
+            meta_data = section["data"]
+    info["verified"] = password is not None
+
+    # raw モードではメタデータ部は空（/Info は本体の中）
+    info["pdf_header"] = None
+    info["metadata"] = None
+    if meta_data:
+        info["pdf_header"] = meta_data.split(b"\n", 1)[0].decode("utf-8", errors="replace")
+        try:
+            info["metadata"] = {str(key): str(value) for key, value in parse_info_dict(meta_data).items()}
+        except ValueError:
+            pass
+    return info
+
+def _segment_reader(f, header: dict, body_key: bytes, stats=None) -> SegmentReader:
+    # 本体の任意の範囲を読めるようにする（本体はファイル末尾まで）
+    size = stream_size(f)
+    if size is None:
+        raise ValueError("ページ単位の .veil を読むにはシーク可能な入力が必要です。")
+    return SegmentReader(f, body_key, header["nonce_prefix"], header["segment_size"], header["body_offset"], size - header["body_offset"], stats=stats, aad=header["body_aad"])
+
+def decrypt_pdf(input_path: str, password: str, output_path: str = None, force: bool = False, skip_strength_check=False, key_cache=None, threads: int = 1, use_mmap: bool = True, stats: Stats = None, fsync: str = DEFAULT_FSYNC, defer=None):
+    """.veil を復号してPDFとして保存する（出力は一時ファイルに書いてから置き換える）
+
+    復号そのものは decrypt_stream が行う（オプションの意味も decrypt_stream を参照）。
+    fsync は "none" / "file" / "full"（pdfveil.output を参照）。
+    defer を渡すと、出力の同期と置き換えを defer(関数) に任せる（pdfveil.pipeline の writer 段）。
+    """
+    check_fsync_policy(fsync)
+    output_path = _decrypted_output_path(input_path, output_path, force)
+    if stats is None:
+        stats = Stats(input_path)  # 呼び出し側が不要なら記録して捨てる
+    with open(input_path, "rb") as f:
+        # 認証に失敗しても出力先には何も残らない
+        with AtomicOutput(output_path, fsync=fsync, stats=stats, defer=defer, overwrite=force) as out:
+            decrypt_stream(f, out, password, key_cache=key_cache, threads=threads, use_mmap=use_mmap, stats=stats, warn=_print_warning)
+
+    print_after_commit(f"[+] Decrypted and saved to: {output_path}", defer)
+
+def decrypt_bytes(data: bytes, password: str, **options) -> bytes:
+    """.veil のバイト列を復号し、PDFのバイト列を返す（オプションは decrypt_stream と同じ）"""
+    out = BytesIO()
+    decrypt_stream(BytesIO(data), out, password, **options)
+    return out.getvalue()
+
+def decrypt_stream(src, dst, password: str, key_cache=None, threads: int = 1, use_mmap: bool = True, stats: Stats = None, warn=None) -> int:
+    """src（.veil を読めるファイルオブジェクト）を復号して dst にPDFを書き、書いたバイト数を返す
+
+    確認・表示・一時ファイルは使わない。パスワードが違う・改ざんされている場合は ValueError。
+    src はパイプでもよい（version 2 の本体はセグメントごとに読み、メモリは一定。--paged のものだけ全体を読み込む）。
+    圧縮した本体（--compress）は認証済みのセグメントを順に展開しながら書き出す。
+    dst がシークできない場合は pdfveil.output.StreamOutput で包むこと。
+    認証は本体を書きながら行うので、失敗したときは dst に書きかけの内容が残る（捨てるのは呼び出し側）。
+    dst は書いた内容を読み直せること（ごく一部のPDFで /Info を pypdf で戻すため）。
+    同じ key_cache を渡せば、同じパスワード・ソルトのPBKDF2は1回で済む。
+    threads > 1 なら version 2 の本体をスレッドプールで並列に復号する。
+    use_mmap=True なら入出力が通常ファイルのとき mmap で割り当て、出力先へ直接復号する。
+    stats を渡すと段階ごとの所要時間とバイト数を記録する（pdfveil.stats を参照）。
+    warn を渡すと、メタデータを戻せなかったときなどに warn(メッセージ) を呼ぶ（復号は続ける）。
+    """
+    if stats is None:
+        stats = Stats()
+    input_size = stream_size(src)
+    if input_size is not None:
+        stats.count("input", input_size)
+    with stats.stage("parse"):
+        header = read_veil_header(src)
+    flag = header["flag"]
+    encrypt_metadata = header["encrypt_metadata"]
+
+    # --- 本体データ処理 ---
+    with stats.stage("kdf"):
+        meta_key, body_key = derive_veil_keys(header, password, key_cache=key_cache)
+    with stats.stage("metadata"):
+        meta_data = open_metadata_section(header["meta_section"], meta_key)
 
+    source_map = None
+    output_size = None
+    if header["version"] == VERSION_1:
+        iv = src.read(12)
+        cipher_len = struct.unpack(">I", src.read(4))[0]
+        if input_size is None:
+            # 2回読むので、シークできない入力（パイプ）は本体をメモリに読み込む
+            src = BytesIO(read_full(src, cipher_len + 16))
+        # 本体は1つのGCMでタグは末尾にあるので、先に全体を認証してから読み直して書き出す
+        # （未認証の平文を dst に出さない。どちらも区切って読むので暗号文全体はメモリに載せない）
+        body_start = src.tell()
+        tag = _verify_v1_body(src, body_key, iv, cipher_len, stats)
+        src.seek(body_start)
+        write_body = _body_from_chunks(_iter_v1_body(src, body_key, iv, cipher_len, tag, stats), stats)
+        output_size = len(meta_data) + cipher_len
+    elif flag & FLAG_PAGED:
+        if input_size is None:
+            # 索引は本体の末尾にあるので、シークできない入力（パイプ）は本体をメモリに読み込む
+            src = BytesIO(src.read())
+            header = dict(header, body_offset=0)
+        # ページ単位のユニットを索引の順に読み、1つのPDFにまとめ直す（PdfWriter で書き直すので大きさは分からない）
+        paged_body = _segment_reader(src, header, body_key, stats)
+    else:
+        nonce_prefix = header["nonce_prefix"]
+        segment_size = header["segment_size"]
+        body_offset = header["body_offset"]
+        if header["codec"] is not None:
+            # 圧縮した本体は認証済みのセグメントを展開しながら流す（展開後の大きさは分からないので確保も mmap もしない）
+            segments = iter_decrypted_segments(src, body_key, nonce_prefix, segment_size, threads=threads, stats=stats, aad=header["body_aad"])
+            write_body = _body_from_chunks(iter_decompressed(segments, header["codec"], stats), stats)
         else:
-            meta_salt = f.read(16)
-            metadata_len = struct.unpack(">I", f.read(4))[0]
-            meta_data = f.read(metadata_len)
-            hmac_tag = f.read(32)
-            meta_key = derive_key(password, meta_salt, mode='dec', file=input_path, skip_strength_check=skip_strength_check)
-            expected_tag = hmac.new(meta_key, meta_data, hashlib.sha256).digest()
-            if not hmac.compare_digest(hmac_tag, expected_tag):
-                raise ValueError("メタデータのHMAC検証に失敗しました。パスワードが間違っている可能性があります。")
-
-        # --- 本体データ処理 ---
-        body_salt = f.read(16)
-        iv = f.read(12)
-        cipher_len = struct.unpack(">I", f.read(4))[0]
-        ciphertext = f.read(cipher_len)
-        tag = f.read(16)
-
-        body_key = derive_key(password, body_salt, mode='dec', file=input_path, skip_strength_check=skip_strength_check)
-        cipher = Cipher(algorithms.AES(body_key), modes.GCM(iv, tag))
-        decryptor = cipher.decryptor()
-        pdf_body = decryptor.update(ciphertext) + decryptor.finalize()
+            if input_size is not None:
+                # 出力はメタデータ + 本体（平文のメタデータは増分更新として追記するので、おおよその大きさ）
+                output_size = len(meta_data) + decrypted_body_size(input_size - body_offset, segment_size)
+            source_map = map_input(src) if use_mmap and can_map_output(dst) else None
+            if source_map is not None:
+                # 入力・出力とも mmap で割り当て、出力先へ直接復号する
+                write_body = _body_from_map(source_map, body_offset, body_key, nonce_prefix, segment_size, threads, stats, header["body_aad"])
+            else:
+                # 認証済みのセグメントから順に出力へ流す
+                write_body = _body_from_chunks(iter_decrypted_segments(src, body_key, nonce_prefix, segment_size, threads=threads, stats=stats, aad=header["body_aad"]), stats)
+
+    try:
+        if output_size is not None:
+            timed(stats, "write", 0, preallocate, dst, output_size)
+        start = dst.tell()
+        if flag & FLAG_RAW:
+            # 元ファイルをそのまま暗号化したもの -> そのまま書き出す
+            write_body(dst)
+        elif flag & FLAG_PAGED:
+            _write_paged_pdf(dst, paged_body, meta_data, stats, warn)
+        else:
+            _write_decrypted_pdf(dst, write_body, meta_data, encrypt_metadata, stats, warn)
+        written = dst.tell() - start
+        stats.count("output", written)
+        return written
+    finally:
+        if source_map is not None:
+            source_map.close()
+
+def extract_pages(input_path: str, password: str, pages: str, output_path: str = None, force: bool = False, skip_strength_check=False, key_cache=None, fsync: str = DEFAULT_FSYNC, defer=None) -> str:
+    """pages（'3-5' や '1,4,7-9'）のページだけをPDFとして保存し、保存先を返す
+
+    --paged で暗号化したファイルなら、索引と必要なページを含むセグメントだけを復号する。
+    それ以外のファイルは全体を復号してからページを選ぶ。
+    fsync / defer は decrypt_pdf と同じ。
+    """
+    check_fsync_policy(fsync)
+    if not output_path:
+        output_path = os.path.splitext(input_path)[0] + ".pages-" + re.sub(r"[^0-9-]+", "_", pages) + ".pdf"
+    output_path = _decrypted_output_path(input_path, output_path, force)
 
+    with open(input_path, "rb") as f:
+        header = read_veil_header(f)
+        if header["version"] == VERSION_2 and header["flag"] & FLAG_PAGED:
+            meta_key, body_key = derive_veil_keys(header, password, key_cache=key_cache)
+            meta_data = open_metadata_section(header["meta_section"], meta_key)
+            body = _segment_reader(f, header, body_key)
+            page_count, entries = read_page_index(body.read, body.size)
+            writer = build_pages_pdf(body.read, entries, parse_page_ranges(pages, page_count))
+            writer.add_metadata(_info_from_metadata(meta_data, _print_warning))
+            _save_writer(writer, output_path, fsync, defer, force)
+            print_after_commit(f"[+] Extracted pages {pages} to: {output_path}", defer)
+            return output_path
+
+        print("[i] ページ単位で暗号化されていないため、全体を復号してからページを取り出します（--paged で暗号化すると必要な部分だけ復号できます）。")
+        f.seek(0)
+        # 復号したPDFは SPOOL_MAX_SIZE まではメモリ上に置く
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as decrypted:
+            decrypt_stream(f, decrypted, password, key_cache=key_cache, warn=_print_warning)
+            decrypted.seek(0)
+            reader = PdfReader(decrypted)
+            writer = PdfWriter()
+            for page in parse_page_ranges(pages, len(reader.pages)):
+                writer.add_page(reader.pages[page])
+            if reader.metadata:
+                writer.add_metadata(reader.metadata)
+            _save_writer(writer, output_path, fsync, defer, force)
+    print_after_commit(f"[+] Extracted pages {pages} to: {output_path}", defer)
+    return output_path
+
+def _save_writer(writer, output_path, fsync, defer, force):
+    with AtomicOutput(output_path, fsync=fsync, defer=defer, overwrite=force) as out:
+        writer.write(out)
+
+def _decrypted_output_path(input_path, output_path, force):
     # --- 出力ファイル名決定 ---
     if not output_path:
         base = os.path.splitext(input_path)[0]
@@ -65,43 +335,166 @@ def decrypt_pdf(input_path: str, password: str, output_path: str = None, force:
 
     if os.path.exists(output_path) and not force:
         raise ValueError(f"[!] 出力ファイル '{output_path}' は既に存在します。--force を指定して上書きできます。")
+    return output_path
+
+def _iter_v1_chunks(src, decryptor, cipher_len, stats):
+    # version 1 の本体を DEFAULT_SEGMENT_SIZE ずつ読み、同じバッファに復号して返す
+    chunk = bytearray(min(cipher_len, DEFAULT_SEGMENT_SIZE))
+    view = memoryview(chunk)
+    out = segment_buffer(len(chunk))
+    remaining = cipher_len
+    while remaining:
+        n = read_full_into(src, view[:min(remaining, len(chunk))])
+        if not n:
+            raise ValueError("暗号化された本体が途中で切れています")
+        yield timed(stats, "aes_gcm", n, cipher_update, decryptor, view[:n], out)
+        remaining -= n
+
+def _finalize_v1(decryptor, tag, stats):
+    try:
+        timed(stats, "aes_gcm", 0, decryptor.finalize_with_tag, tag)
+    except (InvalidTag, ValueError):
+        raise ValueError("本体の認証に失敗しました。パスワードが間違っているか、ファイルが破損しています。")
+
+def _verify_v1_body(src, body_key, iv, cipher_len, stats) -> bytes:
+    # 平文は捨てながら本体全体を復号してタグ（暗号文の直後）を検証し、タグを返す
+    decryptor = Cipher(algorithms.AES(body_key), modes.GCM(iv)).decryptor()
+    for _ in _iter_v1_chunks(src, decryptor, cipher_len, stats):
+        pass
+    tag = read_full(src, 16)
+    _finalize_v1(decryptor, tag, stats)
+    return tag
 
-    # --- PDFの再構築 ---
-    # 1. ボディをPDFとしてロード
-    body_reader = PdfReader(BytesIO(pdf_body))
-    writer = PdfWriter()
+def _iter_v1_body(src, body_key, iv, cipher_len, tag, stats):
+    # 認証済みの本体をもう一度復号して返す（読み直しの間に変わっていないかも確かめる）
+    decryptor = Cipher(algorithms.AES(body_key), modes.GCM(iv)).decryptor()
+    yield from _iter_v1_chunks(src, decryptor, cipher_len, stats)
+    _finalize_v1(decryptor, tag, stats)
 
-    for page in body_reader.pages:
-        writer.add_page(page)
+def _body_from_chunks(body_chunks, stats):
+    # 復号済みの平文を順に書き出し、(本体の長さ, 末尾) を返す関数を作る
+    def write_body(out):
+        out = TimedWriter(out, stats)
+        body_length = 0
+        tail = b""
+        with stats.stage("body"):
+            for chunk in body_chunks:
+                out.write(chunk)
+                body_length += len(chunk)
+                tail = (tail + chunk[-TRAILER_SEARCH_SIZE:])[-TRAILER_SEARCH_SIZE:]
+        return body_length, tail
+    return write_body
 
-    # 2. メタデータ再追加
+def _body_from_map(source_map, body_offset, body_key, nonce_prefix, segment_size, threads, stats, aad):
+    # 割り当てた入力から、最終サイズで割り当てた出力へ直接復号する関数を作る
+    def write_body(out):
+        offset = out.tell()
+        with stats.stage("body"), memoryview(source_map) as view, view[body_offset:] as ciphertext:
+            body_length = decrypted_body_size(len(ciphertext), segment_size)
+            with MappedOutput(out, body_length, offset=offset) as mapped:
+                with stats.stage("aes_gcm", len(ciphertext)):
+                    decrypt_mapped(body_key, nonce_prefix, ciphertext, mapped.view, segment_size, threads, aad)
+                tail = bytes(mapped.view[-TRAILER_SEARCH_SIZE:])
+        out.seek(offset + body_length)
+        return body_length, tail
+    return write_body
+
+def _write_paged_pdf(out, body, meta_data, stats, warn=None):
+    # 全ページのユニットを復号して1つのPDFにまとめ、/Info を戻す
+    page_count, entries = read_page_index(body.read, body.size)
+    with stats.stage("body"):
+        writer = build_pages_pdf(body.read, entries, range(page_count))
+    with stats.stage("metadata"):
+        writer.add_metadata(_info_from_metadata(meta_data, warn))
+    with stats.stage("body"):
+        writer.write(TimedWriter(out, stats))
+
+def _print_warning(message: str):
+    print(f"[!] {message}")
+
+def _info_from_metadata(meta_data: bytes, warn=None) -> dict:
+    # 解析できなければ /Info なしで復元する
+    try:
+        return parse_info_dict(meta_data)
+    except Exception as e:
+        if warn is not None:
+            warn(f"メタデータの解析に失敗しましたが、PDF本体は復元できます: {e}")
+        return {}
+
+def _write_decrypted_pdf(out, write_body, meta_data, encrypt_metadata, stats, warn=None):
+    """復号した本体をpypdfで再構築せずに書き出し、メタデータを戻す"""
+    # 本体は暗号化時に PdfWriter が書き出した正しいPDFなので、そのまま使える
     if encrypt_metadata:
-        # 暗号化されていた場合 -> ヘッダーとInfoオブジェクトを復元
-        with open(output_path, "wb") as f:
-            f.write(meta_data)
-            buffer = BytesIO()
-            writer.write(buffer)
-            f.write(buffer.getvalue())
-    else:
-        # 平文で含まれていた場合 -> PdfWriter のAPIで設定
-        from pypdf.generic import NameObject, create_string_object
+        # 暗号化されていた場合 -> ヘッダーとInfoオブジェクトを先頭に復元
+        out.write(meta_data)
+        write_body(out)
+        return
+
+    # 平文で含まれていた場合 -> 本体の後ろに /Info を差し替える増分更新を追記
+    body_length, tail = write_body(out)
+
+    with stats.stage("metadata"):
+        info_dict = _info_from_metadata(meta_data, warn)
+        if not info_dict:
+            return
+
         try:
-            header_end = meta_data.index(b"\n<<")
-            meta_dict_raw = meta_data[header_end+1:-len(">>\nendobj\n")]
-            lines = meta_dict_raw.split(b"\n")
-            info_dict = {}
-            for line in lines:
-                if b"(" in line and b")" in line:
-                    key, val = line.split(b"(", 1)
-                    key = key.strip().decode("utf-8")
-                    val = val.rstrip(b")").decode("utf-8")
-                    info_dict[NameObject(key)] = create_string_object(val)
-
-            writer.add_metadata(info_dict)
-        except Exception as e:
-            print(f"[!] メタデータの解析に失敗しましたが、PDF本体は復元できます: {e}")
-
-        with open(output_path, "wb") as f:
-            writer.write(f)
-
-    print(f"[+] Decrypted and saved to: {output_path}")
\ No newline at end of file
+            out.write(build_info_update(tail, body_length, info_dict))
+        except ValueError:
+            # 末尾からトレーラーを読めない本体だけ pypdf で書き直す
+            _merge_metadata_with_pypdf(out, info_dict)
+
+def parse_info_dict(meta_data: bytes) -> dict:
+    """extract_info_object_source が作った /Info オブジェクトを辞書に戻す"""
+    header_end = meta_data.index(b"\n<<")
+    meta_dict_raw = meta_data[header_end+1:-len(">>\nendobj\n")]
+    lines = meta_dict_raw.split(b"\n")
+    info_dict = {}
+    for line in lines:
+        if b"(" in line and b")" in line:
+            key, val = line.split(b"(", 1)
+            key = key.strip().decode("utf-8")
+            val = val.rstrip(b")").decode("utf-8")
+            info_dict[NameObject(key)] = create_string_object(val)
+    return info_dict
+
+def build_info_update(tail: bytes, body_length: int, info_dict: dict) -> bytes:
+    """本体末尾のトレーラーを元に、/Info を追加する増分更新（追記部分）を組み立てる"""
+    startxref = re.search(rb"startxref\s+(\d+)\s+%%EOF\s*$", tail)
+    trailer_at = tail.rfind(b"trailer")
+    if not startxref or trailer_at < 0:
+        raise ValueError("本体のトレーラーが見つかりません")
+    trailer = tail[trailer_at:startxref.start()]
+    size = re.search(rb"/Size\s+(\d+)", trailer)
+    root = re.search(rb"/Root\s+(\d+\s+\d+\s+R)", trailer)
+    if not size or not root:
+        raise ValueError("本体のトレーラーに /Size または /Root がありません")
+    file_id = re.search(rb"/ID\s*(\[[^\]]*\])", trailer)
+
+    info_id = int(size.group(1))
+    info_stream = BytesIO()
+    DictionaryObject(info_dict).write_to_stream(info_stream)
+
+    update = BytesIO()
+    update.write(b"\n")
+    info_offset = body_length + update.tell()
+    update.write(f"{info_id} 0 obj\n".encode() + info_stream.getvalue() + b"\nendobj\n")
+    xref_offset = body_length + update.tell()
+    update.write(f"xref\n0 1\n0000000000 65535 f \n{info_id} 1\n{info_offset:010d} 00000 n \n".encode())
+    update.write(f"trailer\n<<\n/Size {info_id + 1}\n/Root ".encode() + root.group(1))
+    update.write(f"\n/Info {info_id} 0 R\n/Prev {startxref.group(1).decode()}\n".encode())
+    if file_id:
+        update.write(b"/ID " + file_id.group(1) + b"\n")
+    update.write(f">>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+    return update.getvalue()
+
+def _merge_metadata_with_pypdf(out, info_dict):
+    out.seek(0)
+    writer = PdfWriter(clone_from=PdfReader(out))
+    writer.add_metadata(info_dict)
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buffer:
+        writer.write(buffer)
+        buffer.seek(0)
+        out.seek(0)
+        out.truncate()
+        shutil.copyfileobj(buffer, out)
@@ -3,11 +3,18 @@ import os
 import struct
 import hmac
 import hashlib
-import getpass
 from pypdf import PdfReader, PdfWriter
 from pypdf.generic import IndirectObject
 from io import BytesIO
-from .utils import generate_salt, derive_key, is_strong_password
+from .utils import generate_salt, derive_file_keys, confirm_password_strength
+from .format import MAGIC, VERSION_2, FLAG_META_ENCRYPTED, FLAG_SINGLE_KDF, FLAG_RAW, FLAG_PAGED, FLAG_ENVELOPE, FLAG_COMPRESSED, body_aad
+from .compress import CODECS, CompressingWriter, parse_compression
+from .envelope import envelope_keys, generate_data_key, wrap_data_key
+from .stream import SegmentWriter, DEFAULT_SEGMENT_SIZE, generate_nonce_prefix, check_segment_size, copy_into, encrypted_body_size, stream_size
+from .mmapio import MappedOutput, can_map_output, map_input, encrypt_mapped
+from .stats import Stats, TimedWriter, timed
+from .paged import DEFAULT_UNIT_PAGES, write_paged_body
+from .output import AtomicOutput, DEFAULT_FSYNC, check_fsync_policy, preallocate, print_after_commit, write_vectored
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 def extract_info_object_source(reader: PdfReader, info_ref: IndirectObject) -> bytes:
@@ -24,18 +31,15 @@ def extract_info_object_source(reader: PdfReader, info_ref: IndirectObject) -> b
 
     return "\n".join(content_lines).encode("utf-8")
 
-def extract_pdf_metadata(file_path: str) -> bytes:
-    """PDFのヘッダーとメタデータ部分をバイナリで取り出す"""
-    
-    # 1. ヘッダーだけ先に取得
-    with open(file_path, "rb") as f:
-        header = f.readline().decode("utf-8", errors="ignore").strip()
-        header_bytes = (header + "\n").encode("utf-8")
+def read_pdf_header(f) -> bytes:
+    """開いたPDFの先頭行（%PDF-x.y）を取り出し、読み込み位置を先頭に戻す"""
+    f.seek(0)
+    header = f.readline().decode("utf-8", errors="ignore").strip()
+    f.seek(0)
+    return (header + "\n").encode("utf-8")
 
-    # 2. PdfReaderにパスを直接渡す（内部で開いてくれる）
-    reader = PdfReader(file_path)
-
-    # 3. Infoオブジェクトを取得
+def extract_metadata_from_reader(reader: PdfReader, header_bytes: bytes) -> bytes:
+    """解析済みの PdfReader からヘッダー + /Info オブジェクトを組み立てる"""
     info_ref = reader.trailer.get("/Info")
     if not info_ref:
         raise ValueError("このPDFには/Infoオブジェクトが存在しません")
@@ -44,8 +48,23 @@ def extract_pdf_metadata(file_path: str) -> bytes:
 
     return header_bytes + metadata_obj
 
-def extract_body_without_metadata(input_path: str) -> bytes:
-    reader = PdfReader(input_path)
+def extract_document(f):
+    """開いたPDFを1回だけ解析し、(ヘッダー + /Info, PdfReader) を返す
+
+    返した PdfReader は f から遅延読み込みするため、本体を書き出すまで f を閉じないこと。
+    """
+    header_bytes = read_pdf_header(f)
+    reader = PdfReader(f)
+    return extract_metadata_from_reader(reader, header_bytes), reader
+
+def extract_pdf_metadata(file_path: str) -> bytes:
+    """PDFのヘッダーとメタデータ部分をバイナリで取り出す"""
+    with open(file_path, "rb") as f:
+        meta_data, _ = extract_document(f)
+    return meta_data
+
+def write_body_from_reader(reader: PdfReader, stream):
+    """/Info を除いたPDF本体を stream（write と tell を持つオブジェクト）に書き出す"""
     writer = PdfWriter()
 
     for page in reader.pages:
@@ -60,57 +79,181 @@ def extract_body_without_metadata(input_path: str) -> bytes:
     if hasattr(writer, "_info"):
         writer._info = None  # 強制的にInfo参照を消す
 
-    
+    writer.write(stream)
+
+def write_body_without_metadata(input_path: str, stream):
+    """/Info を除いたPDF本体を stream に書き出す"""
+    with open(input_path, "rb") as f:
+        write_body_from_reader(PdfReader(f), stream)
 
+def extract_body_without_metadata(input_path: str) -> bytes:
     # メモリ上で保存
     buffer = BytesIO()
-    writer.write(buffer)
+    write_body_without_metadata(input_path, buffer)
     body_data =  buffer.getvalue()
     
     modified_pdf_data = body_data
     
     return modified_pdf_data
 
-def encrypt_pdf(input_path: str, password: str, output_path: str = None, force: bool = False, skip_strength_check=False, encrypt_metadata=True):
-    """PDFファイルをAES-GCMで暗号化し、.veilとして保存"""
+def encrypt_pdf(input_path: str, password: str, output_path: str = None, force: bool = False, skip_strength_check=False, encrypt_metadata=True, segment_size: int = DEFAULT_SEGMENT_SIZE, single_kdf: bool = False, kdf_salt: bytes = None, key_cache=None, raw: bool = False, threads: int = 1, use_mmap: bool = True, stats: Stats = None, paged: bool = False, unit_pages: int = DEFAULT_UNIT_PAGES, envelope: bool = False, compression: str = None, fsync: str = DEFAULT_FSYNC, defer=None):
+    """PDFファイルをAES-GCMで暗号化し、.veilとして保存
+
+    暗号化そのものは encrypt_stream が行う（オプションの意味も encrypt_stream を参照）。
+    skip_strength_check=False なら弱いパスワードをこのまま使うか確認する。
+    出力は一時ファイルに書いてから置き換える。fsync は "none" / "file" / "full"（pdfveil.output を参照）。
+    defer を渡すと、出力の同期と置き換えを defer(関数) に任せる（pdfveil.pipeline の writer 段）。
+    """
     
     if not input_path.lower().endswith(".pdf"):
         raise ValueError(f"[!] 入力ファイルはPDF (.pdf) 形式である必要があります。")
-    
-    # 1. PDFを読み込み
-    with open(input_path, "rb") as f:
-        body_data = extract_body_without_metadata(input_path)
-        meta_data = extract_pdf_metadata(input_path)
+    check_fsync_policy(fsync)
+    output_path = _encrypted_output_path(input_path, output_path, force)
+    if stats is None:
+        stats = Stats(input_path)  # 呼び出し側が不要なら記録して捨てる
 
-    # 2. ソルト & 鍵生成
-    body_salt = generate_salt()
-    meta_salt = generate_salt()
-    
     # パスワードチェック（1回だけ）
-    if not skip_strength_check and not is_strong_password(password):
-        while True:
-            user_response = input(f"[!] {input_path}に設定したパスワードが強力ではありませんが、このまま暗号化しますか？ (Yes/No): ").strip().lower()
-            if user_response == 'yes':
-                break
-            elif user_response == 'no':
-                password = getpass.getpass("🔑 Enter password: ")
-                if is_strong_password(password):
-                    break
-                else:
-                    print("[!] 強力なパスワードが必要です。再度入力してください。")
+    if not skip_strength_check:
+        password = confirm_password_strength(password, input_path)
+
+    with open(input_path, "rb") as source:
+        # 一時ファイルに書き、書き終えたら出力先に置き換える（失敗したら出力先には何も残らない）
+        with AtomicOutput(output_path, fsync=fsync, stats=stats, defer=defer, overwrite=force) as f:
+            encrypt_stream(source, f, password, encrypt_metadata=encrypt_metadata, segment_size=segment_size, single_kdf=single_kdf,
+                           kdf_salt=kdf_salt, key_cache=key_cache, raw=raw, threads=threads, use_mmap=use_mmap, stats=stats,
+                           paged=paged, unit_pages=unit_pages, envelope=envelope, compression=compression)
+
+    print_after_commit(f"[+] Encrypted and saved to: {output_path}", defer)
+
+def encrypt_bytes(data: bytes, password: str, **options) -> bytes:
+    """PDFのバイト列を暗号化し、.veil のバイト列を返す（オプションは encrypt_stream と同じ）"""
+    out = BytesIO()
+    encrypt_stream(BytesIO(data), out, password, **options)
+    return out.getvalue()
+
+def encrypt_stream(src, dst, password: str, encrypt_metadata=True, segment_size: int = DEFAULT_SEGMENT_SIZE, single_kdf: bool = False, kdf_salt: bytes = None, key_cache=None, raw: bool = False, threads: int = 1, use_mmap: bool = True, stats: Stats = None, paged: bool = False, unit_pages: int = DEFAULT_UNIT_PAGES, envelope: bool = False, compression: str = None) -> int:
+    """src（PDFを読めるファイルオブジェクト）を暗号化して dst に .veil を書き、書いたバイト数を返す
+
+    確認・表示・一時ファイルは使わない（パスワードの強度も確かめない）。
+    src はパイプでもよい。raw=True なら先頭から順に読むだけでメモリは一定、
+    それ以外は pypdf がシークしながら読むので、シークできない入力は全体をメモリに読み込む。
+    dst は順に書くだけ（シークできない場合は pdfveil.output.StreamOutput で包むこと）。
+    kdf_salt を渡すとバッチ内で共通のPBKDF2ソルトとして使う（single_kdf が有効になる）。
+    同じ key_cache を渡せば、同じパスワード・ソルトのPBKDF2は1回で済む。
+    raw=True ならpypdfを通さず元のバイト列をそのまま暗号化する（メタデータも暗号文の中）。
+    threads > 1 なら本体のセグメントをスレッドプールで並列に暗号化する。
+    use_mmap=True なら raw モードの入出力が通常ファイルのとき mmap で割り当て、本体をヒープにコピーせず暗号化する。
+    stats を渡すと段階ごとの所要時間とバイト数を記録する（pdfveil.stats を参照）。
+    paged=True なら unit_pages ページずつ別のPDFにして索引を付け、extract_pages で必要なページだけ復号できるようにする。
+    envelope=True ならランダムなデータ鍵で暗号化し、データ鍵だけをパスワードで包む（pdfveil.envelope.rekey_veil で付け替えられる）。
+    compression（'zlib' / 'zlib:9' / 'zstd:3' など）を渡すと本体の平文を圧縮してから暗号化する（pdfveil.compress を参照）。
+    """
+    check_segment_size(segment_size)
+    if raw and paged:
+        raise ValueError("[!] --raw と --paged は同時に指定できません。")
+    if compression and paged:
+        raise ValueError("[!] --compress と --paged は同時に指定できません。")
+    compression = parse_compression(compression) if compression else None
+    if envelope:
+        single_kdf = False  # PBKDF2 はデータ鍵を包む1回だけ（kdf_salt はその共通ソルトになる）
+    elif kdf_salt is not None:
+        single_kdf = True
+    if stats is None:
+        stats = Stats()
+
+    options = dict(password=password, encrypt_metadata=encrypt_metadata, segment_size=segment_size, single_kdf=single_kdf,
+                   kdf_salt=kdf_salt, key_cache=key_cache, raw=raw, paged=paged, envelope=envelope, stats=stats,
+                   codec=CODECS[compression[0]] if compression else None)
+    input_size = stream_size(src)  # パイプなら None
+    if input_size is not None:
+        stats.count("input", input_size)
+        position = src.tell()
+    if raw:
+        # 本体の平文は入力そのものなので、圧縮しなければ出力の最終サイズが先に分かる
+        if input_size is not None and compression is None:
+            options["body_size"] = input_size - position
+        # 1. 解析せず、元のファイルをそのまま本体にする（割り当てられれば mmap で直接暗号化）
+        source_map = map_input(src) if use_mmap and compression is None and input_size is not None and position == 0 and can_map_output(dst) else None
+        if source_map is not None:
+            with source_map:
+                return _encrypt_document(dst, b"", _mapped_body(source_map, segment_size, threads, stats), **options)
+        return _encrypt_document(dst, b"", _streamed_body(lambda stream: copy_into(src, stream, segment_size), segment_size, threads, stats, compression), **options)
+
+    if input_size is None:
+        # pypdf は入力をシークしながら読むので、パイプはメモリに読み込む（ディスクには書かない）
+        src = BytesIO(src.read())
+        stats.count("input", len(src.getbuffer()))
+
+    # 1. PDFを1回だけ解析し、ヘッダー・/Info と本体の両方に使う
+    # （PdfWriter の出力サイズは書き終えるまで分からないので、出力はストリームで書く）
+    with stats.stage("parse"):
+        meta_data, reader = extract_document(src)
+    if paged:
+        write_plaintext = lambda stream: write_paged_body(reader, stream, unit_pages)
+    else:
+        write_plaintext = lambda stream: write_body_from_reader(reader, stream)
+    return _encrypt_document(dst, meta_data, _streamed_body(write_plaintext, segment_size, threads, stats, compression), **options)
+
+def _streamed_body(write_plaintext, segment_size, threads, stats, compression=None):
+    # 平文を書き出す関数から、SegmentWriter 経由で（compression があれば圧縮してから）本体を暗号化して書く関数を作る
+    def write_body(f, body_key, nonce_prefix, aad):
+        with SegmentWriter(TimedWriter(f, stats), body_key, nonce_prefix, segment_size, threads=threads, stats=stats, aad=aad) as body_writer:
+            if compression is None:
+                write_plaintext(body_writer)
             else:
-                print("[!] 'Yes' か 'No' を入力してください。")
+                with CompressingWriter(body_writer, *compression, stats=stats) as compressor:
+                    write_plaintext(compressor)
+    return write_body
 
+def _mapped_body(source_map, segment_size, threads, stats):
+    # 割り当てた入力を、最終サイズで割り当てた出力へ直接暗号化して書く関数を作る
+    def write_body(f, body_key, nonce_prefix, aad):
+        with memoryview(source_map) as src:
+            with MappedOutput(f, encrypted_body_size(len(src), segment_size), offset=f.tell()) as out:
+                with stats.stage("aes_gcm", len(src)):
+                    encrypt_mapped(body_key, nonce_prefix, src, out.view, segment_size, threads, aad)
+        f.seek(0, os.SEEK_END)
+    return write_body
 
-    body_key = derive_key(password, body_salt, mode='enc', file=input_path, skip_strength_check=True)
-    meta_key = derive_key(password, meta_salt, mode='enc', file=input_path, skip_strength_check=True)
+def _encrypted_output_path(input_path, output_path, force):
+    # --- 出力ファイル名決定（拡張子は .veil にする）---
+    if output_path is None:
+        if input_path.lower().endswith(".pdf"):
+            base = input_path[:-4]
+        else:
+            base = os.path.splitext(input_path)[0]
+        output_path = base
+    else:
+        output_path = os.path.splitext(output_path)[0]  # 拡張子除去
+
+    output_path += ".veil"
+
+    if os.path.exists(output_path) and not force:
+        raise ValueError(f"[!] 出力先ファイル '{output_path}' は既に存在します。--force を指定して上書きできます。")
+    return output_path
+
+def _encrypt_document(f, meta_data, write_body, password, encrypt_metadata, segment_size, single_kdf, kdf_salt, key_cache, raw, paged, envelope, stats, codec=None, body_size=None):
+    # 1バイトのフラグをセット（0x01: メタデータ暗号化, 0x02: PBKDF2を1回にまとめる, 0x04: 元ファイルそのまま, 0x08: ページ単位, 0x10: エンベロープ, 0x20: 圧縮）
+    flag = bytes([(FLAG_META_ENCRYPTED if encrypt_metadata else 0) | (FLAG_SINGLE_KDF if single_kdf else 0) | (FLAG_RAW if raw else 0) | (FLAG_PAGED if paged else 0) | (FLAG_ENVELOPE if envelope else 0) | (FLAG_COMPRESSED if codec else 0)])
+
+    # 2. ソルト & 鍵生成（バッチモードではPBKDF2用のソルトを共有し、body_salt だけファイルごと）
+    body_salt = generate_salt()
+    key_block = []
+    if envelope:
+        # ランダムなデータ鍵から鍵を作り、データ鍵だけをパスワードで包む（メタデータ部のソルトは使わないので0）
+        data_key = generate_data_key()
+        with stats.stage("kdf"):
+            key_block = [wrap_data_key(data_key, password, kdf_salt if kdf_salt is not None else generate_salt(), MAGIC + VERSION_2 + flag, key_cache)]
+        meta_key, body_key = envelope_keys(data_key, body_salt)
+        meta_salt = bytes(16)
+    else:
+        meta_salt = kdf_salt if kdf_salt is not None else generate_salt()
+        with stats.stage("kdf"):
+            meta_key, body_key = derive_file_keys(password, meta_salt, body_salt, single_kdf, key_cache=key_cache)
 
     # 3. IV生成（GCM推奨：12バイト）
     metadata_iv = b""
-    iv = os.urandom(12)  # AES-GCMではIVは12バイトが推奨されている
-    
-    # 1バイトのフラグをセット（0x01: メタデータあり, 0x00: メタデータなし）
-    flag = b'\x01' if encrypt_metadata else b'\x00'
+    nonce_prefix = generate_nonce_prefix()  # 本体はセグメントごとに nonce_prefix + カウンタ
     
     # 4. メタデータの暗号化
     metadata_ciphertext = b""
@@ -124,58 +267,37 @@ def encrypt_pdf(input_path: str, password: str, output_path: str = None, force:
         metadata_length = len(metadata_ciphertext) # メタデータのバイト長
         packed_length = struct.pack(">I", metadata_length) # 4バイト符号なし整数(ビッグエンディアン)
         
-    # 5. AES-GCMで暗号化
-    cipher = Cipher(algorithms.AES(body_key), modes.GCM(iv))
-    encryptor = cipher.encryptor()
-    ciphertext = encryptor.update(body_data) + encryptor.finalize()
-    tag = encryptor.tag  # 認証タグ（16バイト）
-
-    # 6. 暗号化ファイルに [salt][iv][metadata][ciphertext][tag] を保存
-    if output_path is None:
-        if input_path.lower().endswith(".pdf"):
-            base = input_path[:-4]
-        else:
-            base = os.path.splitext(input_path)[0]
-        output_path = base
+    # 5. [header][metadata][body segments] を書き込む
+    # [magic(4)][version(1)][flag(1)][key_block(76, envelope のみ)][metadata(?)][body_salt(16)][nonce_prefix(7)][segment_size(4)][codec(1, 圧縮のみ)][segments(?)]
+    header = [MAGIC, VERSION_2, flag] + key_block  # VEIL マーカー、バージョン、フラグ、包んだデータ鍵
+    if encrypt_metadata:
+        #[magic(4)][flag(1)][meta_salt(16)][meta_iv(12)][meta_length(4)][metadata_ciphertext(?)][meta_tag(16)][salt(16)][iv(12)][cipher_length(4)][ciphertext(?)][tag(16)]
+        header += [meta_salt, metadata_iv, packed_length, metadata_ciphertext, metadata_tag]
     else:
-        output_path = os.path.splitext(output_path)[0]  # 拡張子除去
+        meta_length = len(meta_data)
+        # HMACを使って整合性チェック用タグを生成（meta_keyでHMAC）
+        hmac_tag = hmac.new(meta_key, meta_data, hashlib.sha256).digest()  # 長さは32バイト
+        header += [meta_salt, struct.pack(">I", meta_length), meta_data, hmac_tag]
+    header += [body_salt, nonce_prefix, struct.pack(">I", segment_size)]
+    if codec:
+        header.append(bytes([codec]))
+    header_size = sum(len(part) for part in header)
 
-    output_path += ".veil"
+    # 最終サイズが分かるとき（raw）は先に確保する
+    if body_size is not None:
+        timed(stats, "write", 0, preallocate, f, header_size + encrypted_body_size(body_size, segment_size))
 
-    if os.path.exists(output_path) and not force:
-        raise ValueError(f"[!] 出力先ファイル '{output_path}' は既に存在します。--force を指定して上書きできます。")
+    # ヘッダーとメタデータ部は1回の writev で書く
+    start = f.tell()
+    timed(stats, "write", header_size, write_vectored, f, header)
 
-    with open(output_path, "wb") as f:
-        # [magic(4)][flag(1)][meta_length(4)][metadata_raw(?)][salt(16)][iv(12)][cipher_length(4)][ciphertext(?)][tag(16)]
-        f.write(b"VEIL")  # Add VEIl marker
-        f.write(b"\x01")  # Add Version marker
-        f.write(flag)
-        if encrypt_metadata:
-            #[magic(4)][flag(1)][meta_salt(16)][meta_iv(12)][meta_length(4)][metadata_ciphertext(?)][meta_tag(16)][salt(16)][iv(12)][cipher_length(4)][ciphertext(?)][tag(16)]
-            f.write(meta_salt)
-            f.write(metadata_iv)
-            f.write(packed_length)
-            f.write(metadata_ciphertext)
-            f.write(metadata_tag)
-        else:
-            f.write(meta_salt)
-            meta_length = len(meta_data)
-            f.write(struct.pack(">I", meta_length))
-            f.write(meta_data)
-            
-            # HMACを使って整合性チェック用タグを生成（meta_keyでHMAC）
-            hmac_tag = hmac.new(meta_key, meta_data, hashlib.sha256).digest()
-            f.write(hmac_tag)  # 長さは32バイト
-        f.write(body_salt)
-        f.write(iv)
-        cipher_length = len(ciphertext)
-        data_packed_length = struct.pack(">I", cipher_length)
-        f.write(data_packed_length)
-        f.write(ciphertext)
-        f.write(tag)
-
-
-    print(f"[+] Encrypted and saved to: {output_path}")
+    # 6. 本体（PdfWriter の出力 or 元ファイル）をセグメント暗号化して書き込む（各セグメントでヘッダーも認証する）
+    aad = body_aad(flag[0], meta_salt, body_salt, nonce_prefix, segment_size, codec)
+    with stats.stage("body"):
+        write_body(f, body_key, nonce_prefix, aad)
+    written = f.tell() - start
+    stats.count("output", written)
+    return written
 
 """
 .veil file format (version 1):
@@ -185,4 +307,27 @@ def encrypt_pdf(input_path: str, password: str, output_path: str = None, force:
     else:
         [meta_salt(16)][meta_len(4)][meta_plaintext(?)][meta_hmac(32)]
     [body_salt(16)][iv(12)][cipher_len(4)][ciphertext(?)][tag(16)]
+
+.veil file format (version 2):
+[magic(4)="VEIL"][version(1)=0x02][flag(1)]
+    [metadata: version 1 と同じ]
+    [body_salt(16)][nonce_prefix(7)][segment_size(4)]
+    [segment_0(segment_size+16)]...[segment_n(< segment_size+16)]  <- EOFまで
+    各セグメントは [ciphertext][tag(16)]、nonce = nonce_prefix + counter(4) + last(1)
+    各セグメントの AAD = [magic][version][flag][meta_salt(16)][body_salt(16)][nonce_prefix(7)][segment_size(4)][codec(1, 圧縮のみ)]
+    flag に未知のビットがあるファイルは読まない
+    最終セグメントの平文は必ず segment_size 未満（0バイトも可）
+    flag & 0x02 (single KDF) の場合:
+        master = PBKDF2(password, meta_salt)
+        meta_key = HKDF(master, salt=body_salt, info="pdfveil meta key")
+        body_key = HKDF(master, salt=body_salt, info="pdfveil body key")
+    flag & 0x04 (raw) の場合:
+        metadata は空、本体は元のPDFファイルのバイト列そのもの（/Info も暗号文の中）
+    flag & 0x08 (paged) の場合:
+        本体の平文は [unit_0]...[unit_n][index][index_size(4)]（ページ単位のPDFと索引、paged.py を参照）
+    flag & 0x10 (envelope) の場合:
+        flag の直後に [kek_salt(16)][wrap_nonce(12)][wrapped_dek(32)][wrap_tag(16)]（envelope.py を参照）
+        meta_key / body_key はランダムなデータ鍵から HKDF で導出し、meta_salt は使わない（0）
+    flag & 0x20 (compressed) の場合:
+        segment_size の直後に [codec(1)]（1: zlib、2: zstd）、本体の平文はその形式で圧縮したもの（compress.py を参照）
 """
@@ -0,0 +1,82 @@
+# pdfveil/envelope.py
+# エンベロープ暗号化（--envelope、flag 0x10）とパスワードの付け替え（pdfveil rekey）
+# メタデータと本体はランダムなデータ鍵（DEK）から作った鍵で暗号化し、DEK だけをパスワードから導出した鍵（KEK）で包む。
+# [magic(4)][version(1)=0x02][flag(1)][kek_salt(16)][wrap_nonce(12)][wrapped_dek(32)][wrap_tag(16)][metadata]...
+#   KEK = PBKDF2(password, kek_salt)
+#   wrapped_dek = AES-GCM(KEK, wrap_nonce, DEK)、AAD は先頭6バイト（magic + version + flag）
+#   meta_key = HKDF(DEK, salt=body_salt, info="pdfveil meta key")
+#   body_key = HKDF(DEK, salt=body_salt, info="pdfveil body key")
+# 鍵ブロックは6バイト目からの固定長なので、rekey はこの76バイトだけをその場で書き換える（本体は読まない）。
+# DEK 自体は変わらないので、古いパスワードで DEK を取り出した人は引き続き復号できる（DEK を替えるには暗号化し直す）。
+
+import os
+import struct
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from .format import MAGIC, VERSION_2, FLAG_ENVELOPE
+from .output import DEFAULT_FSYNC, check_fsync_policy
+from .stream import read_full
+from .utils import BODY_KEY_INFO, META_KEY_INFO, PBKDF2_ITERATIONS, derive_key, derive_subkey, generate_salt
+
+KEY_BLOCK_OFFSET = len(MAGIC) + 2  # magic + version + flag の直後
+KEY_BLOCK = struct.Struct(">16s12s32s16s")  # kek_salt, wrap_nonce, wrapped_dek, wrap_tag
+DATA_KEY_SIZE = 32
+
+
+def generate_data_key() -> bytes:
+    """ランダムなデータ鍵（AES-256）を生成"""
+    return os.urandom(DATA_KEY_SIZE)
+
+
+def _derive_kek(password: str, kek_salt: bytes, key_cache=None) -> bytes:
+    derive = lambda: derive_key(password, kek_salt, iterations=PBKDF2_ITERATIONS)
+    return key_cache.get_or_derive(password, kek_salt, PBKDF2_ITERATIONS, derive) if key_cache is not None else derive()
+
+
+def wrap_data_key(data_key: bytes, password: str, kek_salt: bytes, aad: bytes, key_cache=None) -> bytes:
+    """データ鍵をパスワードから導出した鍵で包み、鍵ブロック（76バイト）を返す"""
+    nonce = os.urandom(12)
+    encryptor = Cipher(algorithms.AES(_derive_kek(password, kek_salt, key_cache)), modes.GCM(nonce)).encryptor()
+    encryptor.authenticate_additional_data(aad)
+    wrapped = encryptor.update(data_key) + encryptor.finalize()
+    return KEY_BLOCK.pack(kek_salt, nonce, wrapped, encryptor.tag)
+
+
+def unwrap_data_key(key_block: bytes, password: str, aad: bytes, key_cache=None) -> bytes:
+    """鍵ブロックからデータ鍵を取り出す"""
+    if len(key_block) != KEY_BLOCK.size:
+        raise ValueError("鍵ブロックが途中で切れています")
+    kek_salt, nonce, wrapped, tag = KEY_BLOCK.unpack(key_block)
+    decryptor = Cipher(algorithms.AES(_derive_kek(password, kek_salt, key_cache)), modes.GCM(nonce, tag)).decryptor()
+    decryptor.authenticate_additional_data(aad)
+    try:
+        return decryptor.update(wrapped) + decryptor.finalize()
+    except InvalidTag:
+        raise ValueError("データ鍵の認証に失敗しました。パスワードが間違っているか、ファイルが破損しています。")
+
+
+def envelope_keys(data_key: bytes, body_salt: bytes) -> tuple:
+    """データ鍵から (meta_key, body_key) を導出"""
+    return derive_subkey(data_key, body_salt, META_KEY_INFO), derive_subkey(data_key, body_salt, BODY_KEY_INFO)
+
+
+def rekey_veil(path: str, password: str, new_password: str, kdf_salt: bytes = None, key_cache=None, fsync: str = DEFAULT_FSYNC):
+    """エンベロープ形式の .veil の鍵ブロックだけを new_password で包み直す（本体・メタデータは書き換えない）
+
+    kdf_salt を渡すと新しいPBKDF2ソルトとして使う（まとめて付け替えるとき、同じ key_cache と合わせて導出を1回にする）。
+    鍵ブロックは1セクター内の76バイトを1回で上書きし、fsync が "none" でなければ同期する。
+    """
+    check_fsync_policy(fsync)
+    with open(path, "r+b") as f:
+        prefix = read_full(f, KEY_BLOCK_OFFSET)
+        if prefix[:len(MAGIC)] != MAGIC or len(prefix) < KEY_BLOCK_OFFSET:
+            raise ValueError("無効なVEILファイル: magicヘッダーが見つかりません")
+        if prefix[len(MAGIC):len(MAGIC) + 1] != VERSION_2 or not prefix[-1] & FLAG_ENVELOPE:
+            raise ValueError("エンベロープ形式（--envelope）のファイルではありません。復号して --envelope で暗号化し直してください。")
+        data_key = unwrap_data_key(read_full(f, KEY_BLOCK.size), password, prefix, key_cache)
+        key_block = wrap_data_key(data_key, new_password, kdf_salt if kdf_salt is not None else generate_salt(), prefix, key_cache)
+        f.seek(KEY_BLOCK_OFFSET)
+        f.write(key_block)
+        f.flush()
+        if fsync != "none":
+            os.fsync(f.fileno())
@@ -0,0 +1,44 @@
+# pdfveil/format.py
+# .veil ファイル・アーカイブのマジック・バージョン・フラグ定義（レイアウトは encryptor.py 末尾を参照）
+
+import struct
+
+MAGIC = b"VEIL"
+
+VERSION_1 = b"\x01"  # 本体を1つのGCMで暗号化（読み込みのみ対応）
+VERSION_2 = b"\x02"  # 本体をセグメント分割して暗号化
+
+# flag はビットフィールド（version 1 では 0x00 / 0x01 のみ）
+FLAG_META_ENCRYPTED = 0x01  # メタデータを暗号化して格納
+FLAG_SINGLE_KDF = 0x02  # PBKDF2は meta_salt で1回だけ、メタデータ・本体の鍵は body_salt を使ったHKDFで導出
+FLAG_RAW = 0x04  # pypdfを通さず元のPDFファイルをそのまま本体として暗号化（メタデータ部は空）
+FLAG_PAGED = 0x08  # 本体をページ単位のPDFに分けて索引を付ける（必要なページだけ復号できる、paged.py を参照）
+FLAG_ENVELOPE = 0x10  # ランダムなデータ鍵で暗号化し、データ鍵だけをパスワードで包む（rekey で付け替えられる、envelope.py を参照）
+FLAG_COMPRESSED = 0x20  # 本体の平文を暗号化の前に圧縮（segment_size の直後に codec(1)、compress.py を参照）
+
+# info コマンドなどで表示するフラグ名
+FLAG_NAMES = (
+    (FLAG_META_ENCRYPTED, "meta_encrypted"),
+    (FLAG_SINGLE_KDF, "single_kdf"),
+    (FLAG_RAW, "raw"),
+    (FLAG_PAGED, "paged"),
+    (FLAG_ENVELOPE, "envelope"),
+    (FLAG_COMPRESSED, "compressed"),
+)
+
+# バージョンごとに使えるフラグ（それ以外のビットが立っていれば、より新しい形式か破損として拒否する）
+KNOWN_FLAGS = {VERSION_1: FLAG_META_ENCRYPTED, VERSION_2: sum(bit for bit, _ in FLAG_NAMES)}
+
+
+def body_aad(flag: int, meta_salt: bytes, body_salt: bytes, nonce_prefix: bytes, segment_size: int, codec=None) -> bytes:
+    """version 2 の本体の各セグメントで認証するヘッダー（フラグ・ソルト・nonce_prefix・segment_size・codec）
+
+    包んだデータ鍵（rekey で書き換わる）とメタデータ部（それぞれのタグで認証済み）は含めない。
+    """
+    return (MAGIC + VERSION_2 + bytes([flag]) + meta_salt + body_salt + nonce_prefix + struct.pack(">I", segment_size)
+            + (bytes([codec]) if codec is not None else b""))
+
+
+# 複数のPDFをまとめたアーカイブ（レイアウトは archive.py 冒頭を参照）
+ARCHIVE_MAGIC = b"VARC"
+ARCHIVE_VERSION_1 = b"\x01"
@@ -0,0 +1,149 @@
+# pdfveil/manifest.py
+# 差分実行（pdfveil encrypt --incremental）のマニフェスト
+# 入力ごとに {大きさ, 更新時刻, 内容のSHA-256, 作った .veil とその大きさ・更新時刻} を JSON で記録し、
+# 次の実行では変わっていない入力を飛ばす。
+#   1. 大きさ・更新時刻が前回と同じで、.veil も前回のまま -> 読まずに飛ばす
+#   2. 大きさは同じで更新時刻だけ違う -> 内容のハッシュを計算し、前回と同じなら飛ばす（touch やコピーし直し）
+#   3. それ以外（新しい入力、内容の変更、.veil が消えた・変わった、暗号化の設定やパスワードが変わった） -> 暗号化する
+# 暗号化の設定（--raw / --envelope / --compress など）は options の文字列として入力ごとに記録する。
+# パスワードは、マニフェストに1つ置くソルトでPBKDF2した鍵のHMAC（password）として記録する
+# （パスワードの種類ごとに1回の導出で済み、マニフェストからパスワードを総当たりするにも1回ごとにPBKDF2が要る）。
+# ハッシュは1MiBずつ読みながら計算し、複数のファイルをスレッドで並列に計算する（hashlib は計算中にGILを解放する）。
+
+import hashlib
+import hmac
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from .output import AtomicOutput
+from .utils import derive_key, generate_salt
+
+MANIFEST_VERSION = 1
+DEFAULT_MANIFEST = ".pdfveil-manifest.json"
+HASH_CHUNK_SIZE = 1024 * 1024
+PASSWORD_TAG_INFO = b"pdfveil manifest password"
+
+
+def file_digest(path: str) -> str:
+    """ファイルの内容のSHA-256（16進）を、バッファを使い回しながら読んで計算する"""
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _output_state(path: str):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+class Manifest:
+    """差分実行のマニフェスト（入力の絶対パス -> 前回の記録）"""
+
+    def __init__(self, path: str, entries: dict = None, password_salt: bytes = None):
+        self.path = path
+        self.entries = entries if entries is not None else {}
+        self.password_salt = password_salt if password_salt is not None else generate_salt()
+        self._pending = {}  # 今回暗号化する入力 -> 暗号化前に取った記録（成功したら entries に入れる）
+        self._password_tags = {}  # この実行で導出したパスワード -> password（同じパスワードは1回だけ導出する）
+
+    @classmethod
+    def load(cls, path: str) -> "Manifest":
+        """path のマニフェストを読む（なければ空）"""
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != MANIFEST_VERSION:
+            raise ValueError(f"未対応のマニフェストのバージョンです: {data.get('version')}")
+        salt = data.get("password_salt")
+        return cls(path, data["entries"], bytes.fromhex(salt) if salt else None)
+
+    def password_tag(self, password: str) -> str:
+        """パスワードの照合用の値（マニフェストのソルトでPBKDF2した鍵のHMAC、16進）"""
+        if password not in self._password_tags:
+            key = derive_key(password, self.password_salt, skip_strength_check=True)
+            self._password_tags[password] = hmac.new(key, PASSWORD_TAG_INFO, hashlib.sha256).hexdigest()
+        return self._password_tags[password]
+
+    def plan(self, files: list, output_for, jobs: int = 1, options: str = "", password_for=None) -> tuple:
+        """files のうち暗号化が必要なもの（順序は元のまま）と、前回自分が作った出力を上書きしてよい入力の集合を返す
+
+        output_for(file) は file の出力先のパス。ハッシュは jobs 個のスレッドで並列に計算する。
+        options は暗号化の設定を表す文字列で、前回と違えば暗号化し直す。
+        password_for(file) を渡すとパスワードも照合し、前回と違えば暗号化し直す
+        （渡さなければ照合しない。そのときは record に password_for を渡して記録する）。
+        """
+        states = {}
+        to_hash = []
+        for file in files:
+            key = os.path.abspath(file)
+            st = os.stat(file)
+            output = os.path.abspath(output_for(file))
+            states[file] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "output": output, "options": options}
+            password = password_for(file) if password_for is not None else None
+            if password is not None:
+                states[file]["password"] = self.password_tag(password)
+            entry = self.entries.get(key)
+            if entry is not None and self._is_unchanged(entry, states[file]) and entry["mtime_ns"] == st.st_mtime_ns:
+                continue  # 読まずに飛ばせる
+            to_hash.append(file)
+
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            digests = dict(zip(to_hash, pool.map(file_digest, to_hash)))
+
+        changed = []
+        overwrite = set()
+        for file in to_hash:
+            key = os.path.abspath(file)
+            state = dict(states[file], sha256=digests[file])
+            entry = self.entries.get(key)
+            if entry is not None and self._is_unchanged(entry, state) and entry["sha256"] == state["sha256"]:
+                # 内容は同じなので更新時刻だけ記録し直す（次回は読まずに飛ばせる）
+                entry["mtime_ns"] = state["mtime_ns"]
+                continue
+            if entry is not None and entry["output"] == state["output"]:
+                overwrite.add(file)
+            self._pending[file] = state
+            changed.append(file)
+        return changed, overwrite
+
+    @staticmethod
+    def _is_unchanged(entry: dict, state: dict) -> bool:
+        # 入力の大きさ・出力先・暗号化の設定（分かればパスワードも）が同じで、出力が前回書いたときのまま残っている
+        return (entry["size"] == state["size"] and entry["output"] == state["output"]
+                and entry.get("options") == state["options"]
+                and ("password" not in state or entry.get("password") == state["password"])
+                and _output_state(entry["output"]) == (entry["output_size"], entry["output_mtime_ns"]))
+
+    def record(self, results: list, password_for=None):
+        """暗号化の結果 [(入力, エラー)] のうち成功したものを記録する
+
+        password_for(file) を渡すと、そのパスワードを照合用に記録する（plan で照合しなかった場合）。
+        """
+        for file, error in results:
+            state = self._pending.pop(file, None)
+            if error is not None or state is None:
+                continue
+            if password_for is not None:
+                state["password"] = self.password_tag(password_for(file))
+            output_state = _output_state(state["output"])
+            if output_state is None:
+                continue
+            state["output_size"], state["output_mtime_ns"] = output_state
+            self.entries[os.path.abspath(file)] = state
+
+    def save(self, fsync: str = "file"):
+        """マニフェストを一時ファイルに書いてから置き換える"""
+        data = json.dumps({"version": MANIFEST_VERSION, "password_salt": self.password_salt.hex(), "entries": self.entries}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        with AtomicOutput(self.path, len(data), fsync=fsync) as f:
+            f.write(data)
@@ -0,0 +1,112 @@
+# pdfveil/mmapio.py
+# mmap を使った本体の暗号化・復号
+# 1. 入力ファイルは読み取り専用で割り当て、memoryview のスライスをそのまま暗号処理に渡す
+# 2. 出力ファイルは最終サイズに伸ばしてから割り当て、update_into で直接書き込む
+# 出力サイズはセグメント数から計算できるので、ヒープ上に本体のコピーを作らずに済む
+
+import io
+import mmap
+import os
+import stat
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from .stream import TAG_SIZE, cipher_update, segment_nonce, decrypted_body_size
+
+
+def map_input(f):
+    """通常ファイルなら読み取り専用で割り当てる（割り当てられなければ None）"""
+    try:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode) or st.st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, io.UnsupportedOperation):
+        return None
+
+
+def can_map_output(f) -> bool:
+    """f を MappedOutput で割り当てられるか（読み書きできる通常ファイル）"""
+    try:
+        return stat.S_ISREG(os.fstat(f.fileno()).st_mode) and f.readable() and f.writable()
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return False
+
+
+def _segments(total_size: int, segment_size: int, in_step: int, out_step: int):
+    # (index, 入力オフセット, 出力オフセット, 平文長, 最終か) を順に返す
+    full_segments = total_size // segment_size
+    for index in range(full_segments):
+        yield index, index * in_step, index * out_step, segment_size, False
+    yield full_segments, full_segments * in_step, full_segments * out_step, total_size - full_segments * segment_size, True
+
+
+def _run(tasks, func, threads: int):
+    if threads <= 1:
+        for task in tasks:
+            func(*task)
+        return
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        # 結果を取り出して例外（認証失敗など）を伝える
+        for _ in pool.map(lambda task: func(*task), tasks):
+            pass
+
+
+def encrypt_mapped(key: bytes, nonce_prefix: bytes, src, dst, segment_size: int, threads: int = 1, aad: bytes = b""):
+    """src（平文）をセグメント暗号化して dst へ直接書き込む（dst は encrypted_body_size 以上、aad は seal_segment と同じ）"""
+    def encrypt_one(index, src_offset, dst_offset, length, last):
+        encryptor = Cipher(algorithms.AES(key), modes.GCM(segment_nonce(nonce_prefix, index, last))).encryptor()
+        if aad:
+            encryptor.authenticate_additional_data(aad)
+        # スライスは明示的に解放する（例外のトレースバックに残ると mmap を閉じられない）
+        with src[src_offset:src_offset + length] as data, dst[dst_offset:dst_offset + length] as out:
+            cipher_update(encryptor, data, out)
+        encryptor.finalize()
+        dst[dst_offset + length:dst_offset + length + TAG_SIZE] = encryptor.tag
+
+    _run(list(_segments(len(src), segment_size, segment_size, segment_size + TAG_SIZE)), encrypt_one, threads)
+
+
+def decrypt_mapped(key: bytes, nonce_prefix: bytes, src, dst, segment_size: int, threads: int = 1, aad: bytes = b""):
+    """src（暗号化された本体）を復号して dst へ直接書き込む（dst は decrypted_body_size 以上、aad は seal_segment と同じ）
+
+    認証前の平文が dst に書かれることがあるので、失敗したら出力ごと破棄すること。
+    """
+    plain_size = decrypted_body_size(len(src), segment_size)
+
+    def decrypt_one(index, src_offset, dst_offset, length, last):
+        tag = bytes(src[src_offset + length:src_offset + length + TAG_SIZE])
+        decryptor = Cipher(algorithms.AES(key), modes.GCM(segment_nonce(nonce_prefix, index, last), tag)).decryptor()
+        if aad:
+            decryptor.authenticate_additional_data(aad)
+        with src[src_offset:src_offset + length] as data, dst[dst_offset:dst_offset + length] as out:
+            cipher_update(decryptor, data, out)
+        try:
+            decryptor.finalize()
+        except InvalidTag:
+            raise ValueError("本体の認証に失敗しました。パスワードが間違っているか、ファイルが破損しています。")
+
+    _run(list(_segments(plain_size, segment_size, segment_size + TAG_SIZE, segment_size)), decrypt_one, threads)
+
+
+class MappedOutput:
+    """出力ファイルを size バイトに伸ばして書き込み用に割り当てる（with で使う）
+
+    view は memoryview。size が 0 のときは割り当てず空のバッファを使う。
+    """
+
+    def __init__(self, f, size: int, offset: int = 0):
+        f.flush()
+        f.truncate(offset + size)
+        self._map = mmap.mmap(f.fileno(), offset + size) if offset + size else None
+        self._view = memoryview(self._map) if self._map is not None else memoryview(bytearray())
+        self.view = self._view[offset:]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.view.release()
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
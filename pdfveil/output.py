@@ -0,0 +1,196 @@
+# pdfveil/output.py
+# 出力ファイルの書き込み
+# 1. 出力先と同じディレクトリの一時ファイルに書く（中断しても出力先に壊れたファイルを残さない）
+# 2. 最終サイズが分かっていれば posix_fallocate で確保しておく（断片化と書き込み中の容量不足を防ぐ）
+# 3. 書き終えたら fsync の方針に従って同期し、os.replace で出力先に置き換える
+#   fsync="none" : 同期しない（最速。電源断では中身が失われることがある）
+#   fsync="file" : 置き換える前に一時ファイルを同期する（既定）
+#   fsync="full" : さらに置き換えた後のディレクトリも同期する（置き換え自体も電源断に耐える）
+
+import io
+import os
+import tempfile
+from .stats import timed
+
+FSYNC_POLICIES = ("none", "file", "full")
+DEFAULT_FSYNC = "file"
+
+
+def check_fsync_policy(fsync: str):
+    if fsync not in FSYNC_POLICIES:
+        raise ValueError(f"fsync の指定が不正です: {fsync}（{' / '.join(FSYNC_POLICIES)} のいずれか）")
+
+
+def print_after_commit(message: str, defer=None):
+    """出力を置き換えた後で message を表示する（defer があれば writer 段で置き換えの後に表示する）"""
+    if defer is None:
+        print(message)
+    else:
+        defer(lambda: print(message))
+
+
+def has_fileno(f) -> bool:
+    """f が OS のファイル（fileno を持つ）か（BytesIO などは False）"""
+    try:
+        f.fileno()
+        return True
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+
+
+def write_vectored(f, parts):
+    """parts（bytes のリスト）を1回の writev でまとめて書く（書き切れなかった分は続けて書く）"""
+    if not hasattr(os, "writev") or not has_fileno(f):
+        f.write(b"".join(parts))
+        return
+    f.flush()  # バッファに残った分を先に書く
+    fd = f.fileno()
+    views = [memoryview(part) for part in parts if len(part)]
+    while views:
+        written = os.writev(fd, views)
+        while views and written >= len(views[0]):
+            written -= len(views.pop(0))
+        if views:
+            views[0] = views[0][written:]
+    # ファイルオブジェクトの位置を fd の位置に合わせる
+    f.seek(os.lseek(fd, 0, os.SEEK_CUR))
+
+
+class StreamOutput(io.RawIOBase):
+    """シークできない出力（標準出力・パイプ）に書くラッパー。書いたバイト数を tell() で返す
+
+    fileno は見せない（preallocate・writev・mmap を使わせず、順に write するだけにする）。
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self._stream = stream
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        size = memoryview(data).nbytes
+        self._stream.write(data)
+        self._position += size
+        return size
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        self._stream.flush()
+
+
+def _preallocate(fd: int, size: int) -> bool:
+    # 使えないOS・ファイルシステムでは何もしない
+    if not size or not hasattr(os, "posix_fallocate"):
+        return False
+    try:
+        os.posix_fallocate(fd, 0, size)
+        return True
+    except OSError:
+        return False
+
+
+def preallocate(f, size: int) -> bool:
+    """f の現在位置から size バイトを先に確保する（OS のファイルでなければ何もしない）"""
+    if not has_fileno(f):
+        return False
+    f.flush()
+    return _preallocate(f.fileno(), f.tell() + size)
+
+
+def _default_mode() -> int:
+    # open() で作った場合と同じ権限（mkstemp は 0600 で作る）
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+def _fsync_directory(path: str):
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AtomicOutput:
+    """path へ一時ファイル経由で書き、正常に抜けたら置き換える（with で使い、ファイルオブジェクトを受け取る）
+
+    size を渡すとその大きさを先に確保する（中で preallocate してもよい）。抜けたときの書き込み位置をファイルの末尾とする。
+    例外で抜けたときは一時ファイルを消し、path には手を付けない。
+    defer を渡すと、同期と置き換えは defer(関数) に任せる（pipeline の writer 段で別スレッドから実行する）。
+    overwrite=False なら、置き換える時点で path が既にあれば置き換えずに失敗する
+    （defer で置き換えを遅らせている間に、同じ出力先に先に書かれた場合など）。
+    """
+
+    def __init__(self, path: str, size: int = None, fsync: str = DEFAULT_FSYNC, stats=None, defer=None, overwrite: bool = True):
+        check_fsync_policy(fsync)
+        self.path = path
+        self.size = size
+        self.fsync = fsync
+        self.stats = stats
+        self.defer = defer
+        self.overwrite = overwrite
+        self.file = None
+        self._temp_path = None
+
+    def __enter__(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, self._temp_path = tempfile.mkstemp(prefix="." + os.path.basename(self.path) + ".", suffix=".tmp", dir=directory)
+        try:
+            if hasattr(os, "fchmod"):
+                os.fchmod(fd, _default_mode())
+            # 確保と同期の時間は stats の write に含める
+            if self.size:
+                timed(self.stats, "write", 0, _preallocate, fd, self.size)
+            self.file = os.fdopen(fd, "w+b")
+        except BaseException:
+            os.close(fd)
+            os.remove(self._temp_path)
+            raise
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._discard()
+            return False
+        try:
+            self.file.flush()
+            self.file.truncate(self.file.tell())  # 確保した大きさより短く書き終えた分を切り詰める
+        except BaseException:
+            self._discard()
+            raise
+        if self.defer is not None:
+            self.defer(self.commit)
+        else:
+            self.commit()
+        return False
+
+    def commit(self):
+        """一時ファイルを同期して出力先に置き換える（失敗したら一時ファイルを消す）"""
+        try:
+            timed(self.stats, "write", 0, self._commit)
+        except BaseException:
+            self._discard()
+            raise
+
+    def _commit(self):
+        if not self.overwrite and os.path.exists(self.path):
+            raise ValueError(f"[!] 出力先ファイル '{self.path}' は既に存在します。--force を指定して上書きできます。")
+        if self.fsync != "none":
+            os.fsync(self.file.fileno())
+        self.file.close()
+        os.replace(self._temp_path, self.path)
+        if self.fsync == "full":
+            _fsync_directory(os.path.dirname(os.path.abspath(self.path)))
+
+    def _discard(self):
+        self.file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
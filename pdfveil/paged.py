@@ -0,0 +1,92 @@
+# pdfveil/paged.py
+# ページ単位で取り出せる本体（flag & FLAG_PAGED）
+# 本体の平文は [unit_0][unit_1]...[unit_n][index][index_size(4)]
+#   unit  : unit_pages ページずつ PdfWriter で書き出した単独のPDF
+#   index : [page_count(4)][unit_count(4)] + ユニットごとに [first_page(4)][page_count(4)][offset(8)][length(8)]
+# 本体は通常どおりセグメント暗号化されるので、索引と必要なユニットを含むセグメントだけ復号すれば読める
+# （フォントなど複数ページで共有するリソースはユニットごとに複製される）
+
+import bisect
+import struct
+from io import BytesIO
+from pypdf import PdfReader, PdfWriter
+
+INDEX_HEADER = struct.Struct(">II")
+INDEX_ENTRY = struct.Struct(">IIQQ")
+INDEX_SIZE = struct.Struct(">I")
+DEFAULT_UNIT_PAGES = 1
+
+
+def write_paged_body(reader: PdfReader, stream, unit_pages: int = DEFAULT_UNIT_PAGES):
+    """reader のページを unit_pages ページずつ単独のPDFにして stream に書き、最後に索引を付ける"""
+    if unit_pages < 1:
+        raise ValueError(f"1ユニットのページ数が不正です: {unit_pages}")
+    page_count = len(reader.pages)
+    entries = []
+    for first in range(0, page_count, unit_pages):
+        writer = PdfWriter()
+        for page in reader.pages[first:first + unit_pages]:
+            writer.add_page(page)
+        # xref のオフセットはユニットの先頭からにする必要があるので、いったんメモリ上に書き出す
+        unit = BytesIO()
+        writer.write(unit)
+        entries.append((first, min(unit_pages, page_count - first), stream.tell(), unit.tell()))
+        stream.write(unit.getbuffer())
+
+    index = INDEX_HEADER.pack(page_count, len(entries)) + b"".join(INDEX_ENTRY.pack(*entry) for entry in entries)
+    stream.write(index)
+    stream.write(INDEX_SIZE.pack(len(index)))
+
+
+def read_page_index(read, body_size: int) -> tuple:
+    """本体末尾の索引を読み、(総ページ数, [(first_page, page_count, offset, length), ...]) を返す
+
+    read(start, length) は平文の指定範囲を返す関数（SegmentReader.read など）。
+    """
+    if body_size < INDEX_SIZE.size + INDEX_HEADER.size:
+        raise ValueError("ページ索引が見つかりません")
+    (index_size,) = INDEX_SIZE.unpack(read(body_size - INDEX_SIZE.size, INDEX_SIZE.size))
+    if not INDEX_HEADER.size <= index_size <= body_size - INDEX_SIZE.size:
+        raise ValueError("ページ索引が壊れています")
+    index = read(body_size - INDEX_SIZE.size - index_size, index_size)
+    page_count, unit_count = INDEX_HEADER.unpack_from(index)
+    if INDEX_HEADER.size + unit_count * INDEX_ENTRY.size != index_size:
+        raise ValueError("ページ索引が壊れています")
+    entries = [INDEX_ENTRY.unpack_from(index, INDEX_HEADER.size + i * INDEX_ENTRY.size) for i in range(unit_count)]
+    return page_count, entries
+
+
+def parse_page_ranges(spec: str, page_count: int) -> list:
+    """'3-5' / '1,4,7-9' / '10-'（末尾まで）のようなページ指定を0始まりのページ番号のリストにする"""
+    pages = []
+    for part in spec.split(","):
+        part = part.strip()
+        try:
+            if "-" in part:
+                start, end = part.split("-", 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"ページの指定が不正です: {spec}")
+        if not 1 <= start <= end <= page_count:
+            raise ValueError(f"ページの指定が範囲外です: {part}（全 {page_count} ページ）")
+        pages.extend(range(start - 1, end))
+    return pages
+
+
+def build_pages_pdf(read, entries, pages) -> PdfWriter:
+    """pages（0始まり）を含むユニットだけ復号し、そのページを順に並べた PdfWriter を返す"""
+    writer = PdfWriter()
+    starts = [entry[0] for entry in entries]
+    readers = {}
+    for page in pages:
+        unit = bisect.bisect_right(starts, page) - 1
+        first, count, offset, length = entries[unit]
+        if not first <= page < first + count:
+            raise ValueError("ページ索引が壊れています")
+        if unit not in readers:
+            readers[unit] = PdfReader(BytesIO(read(offset, length)))
+        writer.add_page(readers[unit].pages[page - first])
+    return writer
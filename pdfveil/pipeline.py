@@ -0,0 +1,99 @@
+# pdfveil/pipeline.py
+# 1プロセスでのバッチ処理を 読み込み → 計算 → 書き込み の3段に分け、ファイルをまたいで重ねて実行する
+#   reader  : 次に処理するファイルを先に読み、ページキャッシュに載せる（NFS などの読み込み待ちを隠す）
+#   compute : 解析・鍵導出・暗号化/復号（呼び出し側のスレッド）。出力は一時ファイルに書くところまで
+#   writer  : 一時ファイルの同期（fsync）と置き換え、--remove による入力の削除
+# 段の間は大きさに上限のあるキューでつなぎ、後ろの段が詰まれば前の段が待つ（先読みしすぎない）
+
+import os
+import queue
+import threading
+
+DEFAULT_PREFETCH = 2  # 何ファイル先まで読んでおくか（writer 段のキューの大きさにも使う）
+PREFETCH_CHUNK_SIZE = 1024 * 1024
+
+
+def prefetch_file(path: str, chunk_size: int = PREFETCH_CHUNK_SIZE):
+    """path を読み捨ててページキャッシュに載せる"""
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buffer = bytearray(chunk_size)
+        while f.readinto(buffer):
+            pass
+
+
+class Prefetcher:
+    """files を順に別スレッドで先読みする（最大 depth ファイル先まで、with で使う）"""
+
+    def __init__(self, files, depth: int = DEFAULT_PREFETCH):
+        self._files = list(files)
+        self._ready = queue.Queue(maxsize=max(1, depth))
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="pdfveil-reader", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._stopped.set()
+        # 待っている put を解放する
+        while self._thread.is_alive():
+            try:
+                self._ready.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+    def _run(self):
+        for file in self._files:
+            if self._stopped.is_set():
+                return
+            try:
+                prefetch_file(file)
+            except OSError:
+                pass  # 読めないファイルのエラーは compute 段で報告する
+            self._ready.put(file)
+
+    def wait(self, file: str):
+        """file の先読みが終わるまで待つ（files の順に呼ぶこと）"""
+        while self._ready.get() != file:
+            pass
+
+
+class Writer:
+    """出力の同期・置き換えなどを別スレッドで順に実行する（キューが埋まれば submit が待つ、with で使う）
+
+    失敗したファイルは errors に記録し、そのファイルの後続の処理（入力の削除など）は実行しない。
+    """
+
+    def __init__(self, size: int = DEFAULT_PREFETCH):
+        self.errors = {}
+        self._queue = queue.Queue(maxsize=max(1, size))
+        self._thread = threading.Thread(target=self._run, name="pdfveil-writer", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # 受け付けた処理はすべて終わらせる（一時ファイルを残さない）
+        self._queue.put(None)
+        self._thread.join()
+
+    def submit(self, file: str, func):
+        self._queue.put((file, func))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            file, func = item
+            if file in self.errors:
+                continue
+            try:
+                func()
+            except Exception as e:
+                self.errors[file] = str(e) or type(e).__name__
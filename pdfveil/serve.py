@@ -0,0 +1,450 @@
+# pdfveil/serve.py
+# ローカルの暗号化サービス（pdfveil serve）
+# Unix ドメインソケットか localhost の HTTP で待ち受け、常駐のワーカープロセスで暗号化・復号する。
+#   POST /encrypt  本文: PDF    -> .veil（クエリ: encrypt_metadata, single_kdf, raw, paged, envelope に 0/1）
+#   POST /decrypt  本文: .veil  -> PDF
+#   （curl -T などのために PUT も同じに扱う）
+#   GET  /health   待ち件数などのJSON
+# パスワードは X-Pdfveil-Password ヘッダーで渡す。
+# リクエストの本文（Content-Length か chunked、max_body まで）はパイプでワーカーに流し込み、ワーカーの出力もパイプで受け取って返す。
+# 本文も結果もディスクには書かない。本文を受け取り終える前に出てきた出力はメモリに溜め
+# （本文を送り終えるまで応答を読まないクライアントでも詰まらないように）、受け取り終えたら流しながら返す。
+# その時点で出力が終わっていれば Content-Length、まだなら chunked で返す。
+# chunked で返し始めた後に失敗したら（改ざんされた .veil の後ろのセグメントなど）、終わりの塊を送らずに切断する。
+# 実行中と待ちの合計が max_queue を超えたら 503 を返す（Retry-After 付き）。
+# 本文の途中で REQUEST_TIMEOUT 秒以上止まったクライアントには 408 を返して切断する（止まった接続が枠を持ち続けないように）。
+
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import socket
+import socketserver
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing.reduction import ForkingPickler
+from urllib.parse import parse_qs, urlsplit
+from . import __version__
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_MAX_QUEUE = 16
+DEFAULT_MAX_BODY = 1024 * 1024 * 1024  # リクエストの本文の上限（超えたら 413）
+CHUNK_SIZE = 1024 * 1024
+POLL_INTERVAL = 0.1  # ワーカーの出力を待つ間に、ワーカーが結果を送らずに終わっていないか確かめる間隔（秒）
+DRAIN_LIMIT = 64 * 1024 * 1024  # エラーを返す前に読み捨てる本文の上限（超えたら読まずに切断）
+REQUEST_TIMEOUT = 60  # 接続のソケットのタイムアウト（秒）。リクエストや本文の受信が止まったら諦める
+PASSWORD_HEADER = "X-Pdfveil-Password"
+# mode -> 受け付けるクエリ
+MODES = {
+    "encrypt": ("encrypt_metadata", "single_kdf", "raw", "paged", "envelope"),
+    "decrypt": (),
+}
+
+
+class _ConnectionReader(io.RawIOBase):
+    """親から送られてくる本文（空のメッセージで終わり）を読むファイル風オブジェクト"""
+
+    def __init__(self, conn):
+        super().__init__()
+        self._conn = conn
+        self._pending = memoryview(b"")
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if not self._pending and not self._eof:
+            try:
+                data = self._conn.recv_bytes()
+            except EOFError:
+                # 終わりの印を送らずに閉じた（本文が途中で切れた・上限を超えた）
+                raise ValueError("リクエストの本文が途中で切れています。")
+            if data:
+                self._pending = memoryview(data)
+            else:
+                self._eof = True
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+class _ConnectionWriter(io.RawIOBase):
+    """書かれたデータをそのまま親に送るファイル風オブジェクト（空のメッセージは終わりの印なので送らない）"""
+
+    def __init__(self, conn):
+        super().__init__()
+        self._conn = conn
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        size = memoryview(data).nbytes
+        if size:
+            self._conn.send_bytes(data)
+        return size
+
+
+def run_job(mode: str, request: bytes, response: bytes, password: str, options: dict):
+    """ワーカープロセスで1件を処理し、エラーメッセージ（成功なら None）を返す
+
+    request / response は親とつながった Connection を pickle したもの。本文を request から読み、結果を response に送る。
+    """
+    from .cli import get_key_cache
+    from .output import StreamOutput
+    request, response = ForkingPickler.loads(request), ForkingPickler.loads(response)
+    try:
+        # 確認や表示をしない stream API で処理する（入力も出力もシークできないパイプ）
+        src = io.BufferedReader(_ConnectionReader(request), CHUNK_SIZE)
+        dst = StreamOutput(io.BufferedWriter(_ConnectionWriter(response), CHUNK_SIZE))
+        if mode == "encrypt":
+            from .encryptor import encrypt_stream
+            encrypt_stream(src, dst, password, key_cache=get_key_cache(), **options)
+        else:
+            from .decryptor import decrypt_stream
+            decrypt_stream(src, dst, password, key_cache=get_key_cache())
+        dst.flush()
+        response.send_bytes(b"")  # 成功の印
+    except Exception as e:
+        return str(e) or type(e).__name__
+    finally:
+        request.close()
+        response.close()
+    return None
+
+
+def _job_error(future) -> str:
+    # ワーカーが結果を送らずに終わったときのエラーメッセージ
+    try:
+        return future.result() or "ワーカーが結果を返しませんでした。"
+    except Exception as e:
+        return str(e) or type(e).__name__
+
+
+def _receive(conn, future):
+    """ワーカーの次の出力を返す（b"" なら成功で終わり、None ならワーカーが失敗した）"""
+    while not conn.poll(POLL_INTERVAL):
+        # プールが壊れた場合などは Connection が閉じられないので、future も見る
+        if future.done() and not conn.poll():
+            return None
+    try:
+        return conn.recv_bytes()
+    except EOFError:
+        return None
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class Service:
+    """ワーカープロセスのプールと、待ち件数・本文の大きさの上限"""
+
+    def __init__(self, jobs: int = 1, max_queue: int = DEFAULT_MAX_QUEUE, max_body: int = DEFAULT_MAX_BODY):
+        from .cli import warm_up_worker
+        self.jobs = jobs
+        self.max_queue = max_queue
+        self.max_body = max_body
+        self.pending = 0
+        self._lock = threading.Lock()
+        self.pool = ProcessPoolExecutor(max_workers=jobs, initializer=warm_up_worker)
+        for _ in range(jobs):
+            self.pool.submit(int)  # ワーカーを先に起動しておく
+
+    @contextlib.contextmanager
+    def slot(self):
+        """実行中と待ちの合計が max_queue 未満なら1枠確保する（超えていれば 503）"""
+        with self._lock:
+            if self.pending >= self.max_queue:
+                raise HttpError(503, "混み合っています。しばらくしてから再試行してください。")
+            self.pending += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def submit(self, mode, password, options):
+        """ワーカーに1件を渡し、(future, 本文を送る Connection, 結果を受け取る Connection) を返す"""
+        request_reader, request_writer = multiprocessing.Pipe(duplex=False)
+        response_reader, response_writer = multiprocessing.Pipe(duplex=False)
+        # ワーカーに渡す端は pickle した時点で複製されるので、こちらの分はすぐ閉じる（ワーカーが閉じれば相手に EOF が届く）
+        request, response = bytes(ForkingPickler.dumps(request_reader)), bytes(ForkingPickler.dumps(response_writer))
+        request_reader.close()
+        response_writer.close()
+        future = self.pool.submit(run_job, mode, request, response, password, options)
+        return future, request_writer, response_reader
+
+    def close(self):
+        self.pool.shutdown()
+
+
+def _parse_flag(value: str) -> bool:
+    if value.lower() in ("1", "true", "yes", "on"):
+        return True
+    if value.lower() in ("0", "false", "no", "off"):
+        return False
+    raise HttpError(400, f"真偽値の指定が不正です: {value}")
+
+
+class RequestBody:
+    """リクエストの本文（Content-Length か chunked）を max_size まで塊ごとに読む"""
+
+    def __init__(self, rfile, headers, max_size: int):
+        self.rfile = rfile
+        self.max_size = max_size
+        self.chunked = "chunked" in headers.get("Transfer-Encoding", "").lower()
+        self.length = headers.get("Content-Length")
+        self.received = 0
+        self.finished = False
+        self.timed_out = False
+
+    def check(self):
+        """Content-Length で分かる誤り（なし・不正・上限超え）を読む前に確かめる"""
+        if not self.chunked:
+            self._content_length()
+
+    def _content_length(self) -> int:
+        if self.length is None:
+            raise HttpError(411, "Content-Length か chunked で本文を送ってください。")
+        try:
+            length = int(self.length)
+        except ValueError:
+            raise HttpError(400, f"Content-Length が不正です: {self.length}")
+        if length > self.max_size:
+            raise HttpError(413, f"本文が大きすぎます（上限: {self.max_size} バイト）。")
+        return length
+
+    def chunks(self):
+        """本文を CHUNK_SIZE 以下の塊で返す（受信が止まったら 408）"""
+        try:
+            yield from self._chunks()
+        except socket.timeout:
+            self.timed_out = True
+            raise HttpError(408, "本文の受信がタイムアウトしました。")
+
+    def _chunks(self):
+        if self.chunked:
+            while True:
+                try:
+                    size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                except ValueError:
+                    raise HttpError(400, "chunked の本文が不正です。")
+                if size == 0:
+                    # トレーラーを読み飛ばす
+                    while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                yield from self._read_exact(size)
+                self.rfile.readline()
+        else:
+            yield from self._read_exact(self._content_length())
+        self.finished = True
+
+    def _read_exact(self, size: int):
+        while size > 0:
+            chunk = self.rfile.read(min(size, CHUNK_SIZE))
+            if not chunk:
+                raise HttpError(400, "リクエストの本文が途中で切れています。")
+            self.received += len(chunk)
+            if self.received > self.max_size:
+                raise HttpError(413, f"本文が大きすぎます（上限: {self.max_size} バイト）。")
+            size -= len(chunk)
+            yield chunk
+
+    def drain(self):
+        """Content-Length の残りを読み捨てる（chunked や DRAIN_LIMIT を超える場合、タイムアウトした後は何もしない）"""
+        if self.finished or self.chunked or self.timed_out:
+            return
+        try:
+            remaining = int(self.length) - self.received
+        except (TypeError, ValueError):
+            return
+        if remaining > DRAIN_LIMIT:
+            return
+        try:
+            while remaining > 0:
+                chunk = self.rfile.read(min(remaining, CHUNK_SIZE))
+                if not chunk:
+                    return
+                remaining -= len(chunk)
+        except OSError:
+            pass
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 接続を使い回せるよう、応答には Content-Length か chunked を必ず付ける
+    server_version = f"pdfveil/{__version__}"
+    timeout = REQUEST_TIMEOUT  # StreamRequestHandler が接続のソケットに設定する
+    body = None  # POST の本文（GET には本文がない）
+
+    def do_GET(self):
+        if urlsplit(self.path).path != "/health":
+            return self._send_error(HttpError(404, "見つかりません。"))
+        service = self.server.service
+        self._send_json(200, {"status": "ok", "version": __version__, "jobs": service.jobs, "pending": service.pending,
+                              "max_queue": service.max_queue, "max_body": service.max_body})
+
+    def do_POST(self):
+        service = self.server.service
+        self.body = RequestBody(self.rfile, self.headers, service.max_body)
+        try:
+            url = urlsplit(self.path)
+            mode = url.path.strip("/")
+            if mode not in MODES:
+                raise HttpError(404, "見つかりません。")
+            password = self.headers.get(PASSWORD_HEADER)
+            if not password:
+                raise HttpError(400, f"{PASSWORD_HEADER} ヘッダーでパスワードを指定してください。")
+            options = {}
+            for name, values in parse_qs(url.query).items():
+                if name not in MODES[mode]:
+                    raise HttpError(400, f"未対応のオプションです: {name}")
+                options[name] = _parse_flag(values[-1])
+            self.body.check()
+            with service.slot():
+                self._run(service, mode, password, options)
+        except HttpError as e:
+            self._send_error(e)
+
+    do_PUT = do_POST
+
+    def _run(self, service, mode, password, options):
+        """本文をワーカーに流し込みながら、ワーカーの出力を返す"""
+        future, request, response = service.submit(mode, password, options)
+        self.feed_error = None
+        feeder = threading.Thread(target=self._feed, args=(request,), daemon=True)
+        feeder.start()
+        try:
+            # 本文を受け取り終えるまでの出力はメモリに溜める（失敗したらまだステータスを返せる）
+            pending = []
+            chunk = _receive(response, future)
+            while chunk and feeder.is_alive():
+                pending.append(chunk)
+                chunk = _receive(response, future)
+            feeder.join()
+            if self.feed_error is not None:
+                raise self.feed_error
+            if chunk is None:
+                raise HttpError(400, _job_error(future))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf" if mode == "decrypt" else "application/octet-stream")
+            if chunk == b"":
+                # 出力はもう終わっている
+                self.send_header("Content-Length", str(sum(len(data) for data in pending)))
+                self.end_headers()
+                for data in pending:
+                    self.wfile.write(data)
+                return
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            pending.append(chunk)
+            for data in pending:
+                self._write_chunk(data)
+            del pending
+            while True:
+                chunk = _receive(response, future)
+                if not chunk:
+                    break
+                self._write_chunk(chunk)
+            if chunk is None:
+                # 終わりの塊を送らずに切断し、クライアントに不完全な応答だと分かるようにする
+                self.close_connection = True
+                self.log_message("%s の途中で失敗したので切断します: %s", mode, _job_error(future))
+                return
+            self.wfile.write(b"0\r\n\r\n")
+        finally:
+            response.close()
+            feeder.join()
+
+    def _feed(self, request):
+        # 本文をワーカーに送り、最後に空のメッセージで終わりを知らせる
+        # （途中で失敗したら終わりの印を送らずに閉じるので、ワーカーは本文が切れたと分かる）
+        try:
+            for chunk in self.body.chunks():
+                request.send_bytes(chunk)
+            request.send_bytes(b"")
+        except HttpError as e:
+            self.feed_error = e
+        except OSError:
+            pass  # ワーカーが読むのをやめた（失敗した・.veil の終わりまで読んだ）
+        finally:
+            request.close()
+
+    def _write_chunk(self, data):
+        self.wfile.write(b"%x\r\n" % len(data))
+        self.wfile.write(data)
+        self.wfile.write(b"\r\n")
+
+    def _send_json(self, status, data, headers=()):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error: HttpError):
+        headers = [("Retry-After", "1")] if error.status == 503 else []
+        if self.body is not None and not self.body.finished:
+            # 送りかけの本文を読み捨ててから応答する（読まずに閉じるとクライアントには応答が届かない）
+            self.close_connection = True
+            headers.append(("Connection", "close"))
+            self.body.drain()
+        self._send_json(error.status, {"error": str(error)}, headers)
+
+    def address_string(self):
+        # Unix ドメインソケットではクライアントのアドレスがない
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "unix"
+
+    def log_message(self, format, *args):
+        sys.stderr.write(f"[i] {self.address_string()} {format % args}\n")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def server_bind(self):
+        # 前回の残りのソケットファイルを消し、所有者だけが接続できるようにする
+        if os.path.exists(self.server_address) and not os.path.isfile(self.server_address):
+            os.remove(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        os.chmod(self.server_address, 0o600)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def make_server(socket_path: str = None, host: str = DEFAULT_HOST, port: int = 0, jobs: int = 1, max_queue: int = DEFAULT_MAX_QUEUE,
+                max_body: int = DEFAULT_MAX_BODY):
+    """サーバーを作る（serve_forever で待ち受け、終わったら shutdown と close_server を呼ぶ）
+
+    socket_path を渡せば Unix ドメインソケット、なければ host:port の HTTP（port=0 なら空いているポート）。
+    max_body はリクエストの本文の上限（バイト）。
+    """
+    if socket_path is not None:
+        if not hasattr(socket, "AF_UNIX"):
+            raise ValueError("この環境では Unix ドメインソケットを使えません。--port を指定してください。")
+        server = UnixHTTPServer(socket_path, RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), RequestHandler)
+        server.daemon_threads = True
+    server.service = Service(jobs, max_queue, max_body)
+    return server
+
+
+def close_server(server):
+    server.server_close()
+    server.service.close()
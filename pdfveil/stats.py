@@ -0,0 +1,106 @@
+# pdfveil/stats.py
+# encrypt_pdf / decrypt_pdf の段階ごとの所要時間とバイト数を記録する（--stats 用）
+#   parse    : PDFの解析（復号ではヘッダー・メタデータ部の読み込み）
+#   kdf      : パスワードからの鍵導出
+#   body     : 本体の書き出し全体（pypdf の再構築・aes_gcm・write を含む）
+#   aes_gcm  : 本体の暗号化・復号（スレッド使用時は各スレッドの合計）
+#   compress : 本体の圧縮・展開（--compress のみ、バイト数は圧縮前）
+#   write    : 出力ファイルへの書き込み（mmap で書いた分は aes_gcm に含まれる）
+#   metadata : メタデータの書き戻し（復号のみ）
+
+import threading
+import time
+from contextlib import contextmanager
+
+STAGES = ("parse", "kdf", "body", "aes_gcm", "compress", "write", "metadata")
+
+
+class Stats:
+    """1ファイル分（または複数ファイルの合計）の段階ごとの秒数とバイト数"""
+
+    def __init__(self, file: str = None):
+        self.file = file
+        self.files = 1 if file else 0
+        self.seconds = {}
+        self.bytes = {}
+        self._lock = threading.Lock()  # スレッドプールの各スレッドからも記録する
+
+    def add(self, stage: str, seconds: float, nbytes: int = 0):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            if nbytes:
+                self.bytes[stage] = self.bytes.get(stage, 0) + nbytes
+
+    def count(self, name: str, nbytes: int):
+        """時間を伴わないバイト数（input / output など）を記録"""
+        with self._lock:
+            self.bytes[name] = self.bytes.get(name, 0) + nbytes
+
+    @contextmanager
+    def stage(self, name: str, nbytes: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, nbytes)
+
+    def merge(self, other: dict):
+        """to_dict() の結果を合計に加える（ワーカープロセスの結果を集計するため）"""
+        self.files += other["files"]
+        for stage, seconds in other["seconds"].items():
+            self.add(stage, seconds)
+        for name, nbytes in other["bytes"].items():
+            self.count(name, nbytes)
+
+    def to_dict(self) -> dict:
+        return {"file": self.file, "files": self.files, "seconds": dict(self.seconds), "bytes": dict(self.bytes)}
+
+
+class TimedWriter:
+    """write の時間とバイト数を stats の write に記録するファイルラッパー"""
+
+    def __init__(self, f, stats: Stats):
+        self._f = f
+        self._stats = stats
+
+    def write(self, data) -> int:
+        start = time.perf_counter()
+        written = self._f.write(data)
+        self._stats.add("write", time.perf_counter() - start, len(data))
+        return written
+
+    def __getattr__(self, name):
+        # tell / seek / flush / fileno / truncate などはそのまま渡す
+        return getattr(self._f, name)
+
+
+def timed(stats: Stats, stage: str, nbytes: int, func, *args):
+    """func(*args) の時間を stats に記録して結果を返す（stats が None なら計測しない）"""
+    if stats is None:
+        return func(*args)
+    start = time.perf_counter()
+    try:
+        return func(*args)
+    finally:
+        stats.add(stage, time.perf_counter() - start, nbytes)
+
+
+def format_stats(data: dict) -> str:
+    """to_dict() の結果を人が読める表にする"""
+    title = data["file"] or f"合計 ({data['files']} 件)"
+    lines = [f"[i] stats: {title}"]
+    for stage in STAGES:
+        if stage not in data["seconds"]:
+            continue
+        seconds = data["seconds"][stage]
+        line = f"    {stage:<9} {seconds:>9.3f} s"
+        nbytes = data["bytes"].get(stage)
+        if nbytes:
+            line += f" {nbytes / 1e6:>10.2f} MB"
+            if seconds > 0:
+                line += f" {nbytes / 1e6 / seconds:>9.1f} MB/s"
+        lines.append(line)
+    sizes = [f"{name} {data['bytes'][name] / 1e6:.2f} MB" for name in ("input", "output") if name in data["bytes"]]
+    if sizes:
+        lines.append("    " + " / ".join(sizes))
+    return "\n".join(lines)
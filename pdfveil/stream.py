@@ -0,0 +1,380 @@
+# pdfveil/stream.py
+# .veil version 2 の本体をセグメント単位で AES-GCM 暗号化・復号する
+# 1. 本体を segment_size ごとに分割
+# 2. 各セグメントを nonce = nonce_prefix(7) + counter(4) + last_flag(1) で暗号化
+# 3. 最終セグメントは必ず segment_size 未満（0バイトも可）にして終端を示す
+# 4. 各セグメントの GCM はヘッダー（フラグ・ソルト・nonce_prefix など、format.body_aad）を AAD として認証する
+# セグメントは独立に認証されるので、threads > 1 ならスレッドプールで並列に処理する
+# （AES-GCM の処理中は cryptography がGILを解放する）
+# 1スレッドのときは読み込み・暗号化・復号の出力バッファをセグメント間で使い回し（readinto / update_into）、
+# セグメントごとに新しいバイト列を作らない
+
+import io
+import os
+import stat
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from .stats import timed
+
+TAG_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+DEFAULT_SEGMENT_SIZE = 1024 * 1024  # 1 MiB
+MAX_SEGMENT_SIZE = 64 * 1024 * 1024  # 不正なヘッダーで巨大なバッファを確保しないための上限
+MAX_SEGMENTS = 0xFFFFFFFF
+UPDATE_INTO_SLACK = 15  # update_into が出力バッファに要求する余白（ブロック長 - 1）
+
+
+def generate_nonce_prefix() -> bytes:
+    """セグメント用のランダムなnonceプレフィックスを生成"""
+    return os.urandom(NONCE_PREFIX_SIZE)
+
+
+def check_segment_size(segment_size: int) -> int:
+    """セグメントサイズが扱える範囲か検証"""
+    if not 0 < segment_size <= MAX_SEGMENT_SIZE:
+        raise ValueError(f"不正なセグメントサイズです: {segment_size}")
+    return segment_size
+
+
+def segment_nonce(nonce_prefix: bytes, index: int, last: bool) -> bytes:
+    """セグメント番号と終端フラグから12バイトのnonceを組み立てる"""
+    if index > MAX_SEGMENTS:
+        raise ValueError("セグメント数が上限を超えました")
+    return nonce_prefix + struct.pack(">IB", index, 1 if last else 0)
+
+
+def segment_buffer(segment_size: int) -> bytearray:
+    """seal_segment / decrypt_segment の out に渡せる、1セグメント分の出力バッファを確保"""
+    return bytearray(segment_size + UPDATE_INTO_SLACK)
+
+
+def cipher_update(context, data, out=None):
+    """context.update(data) の結果を返す（out を渡すとそこへ直接書き、書いた範囲の memoryview を返す）"""
+    if out is None:
+        return context.update(data)
+    try:
+        n = context.update_into(data, out)
+    except ValueError:
+        # 古い cryptography は余白の要求が異なるので update で代用
+        result = context.update(data)
+        n = len(result)
+        out[:n] = result
+    return memoryview(out)[:n]
+
+
+def seal_segment(key: bytes, nonce_prefix: bytes, index: int, data, last: bool, out=None, aad: bytes = b"") -> tuple:
+    """1セグメントを暗号化し (ciphertext, tag(16)) を返す（連結のコピーをしない）
+
+    out（segment_buffer）を渡すと暗号文をそこへ書き、ciphertext はその memoryview になる。
+    aad はタグで一緒に認証するデータ（.veil ではヘッダー）。
+    """
+    encryptor = Cipher(algorithms.AES(key), modes.GCM(segment_nonce(nonce_prefix, index, last))).encryptor()
+    if aad:
+        encryptor.authenticate_additional_data(aad)
+    ciphertext = cipher_update(encryptor, data, out)
+    encryptor.finalize()
+    return ciphertext, encryptor.tag
+
+
+def encrypt_segment(key: bytes, nonce_prefix: bytes, index: int, data, last: bool, aad: bytes = b"") -> bytes:
+    """1セグメントを暗号化し [ciphertext][tag(16)] を返す"""
+    return b"".join(seal_segment(key, nonce_prefix, index, data, last, aad=aad))
+
+
+def decrypt_segment(key: bytes, nonce_prefix: bytes, index: int, data, last: bool, out=None, aad: bytes = b""):
+    """[ciphertext][tag(16)] を1セグメント分復号
+
+    out（segment_buffer）を渡すと平文をそこへ書き、その memoryview を返す（渡さなければ bytes）。
+    aad は暗号化のときと同じものを渡す。
+    """
+    if len(data) < TAG_SIZE:
+        raise ValueError("暗号化された本体が途中で切れています")
+    view = memoryview(data)  # タグを切り離すときに本体をコピーしない
+    ciphertext, tag = view[:-TAG_SIZE], bytes(view[-TAG_SIZE:])
+    decryptor = Cipher(algorithms.AES(key), modes.GCM(segment_nonce(nonce_prefix, index, last), tag)).decryptor()
+    if aad:
+        decryptor.authenticate_additional_data(aad)
+    plaintext = cipher_update(decryptor, ciphertext, out)
+    try:
+        decryptor.finalize()
+    except InvalidTag:
+        raise ValueError("本体の認証に失敗しました。パスワードが間違っているか、ファイルが破損しています。")
+    return plaintext
+
+
+def encrypted_body_size(plain_size: int, segment_size: int) -> int:
+    """平文 plain_size バイトを暗号化したときの本体（全セグメント）のサイズ"""
+    return plain_size + (plain_size // check_segment_size(segment_size) + 1) * TAG_SIZE
+
+
+def decrypted_body_size(cipher_size: int, segment_size: int) -> int:
+    """暗号化された本体のサイズから平文のサイズを求める"""
+    chunk_size = check_segment_size(segment_size) + TAG_SIZE
+    full_segments, remainder = divmod(cipher_size, chunk_size)
+    # 最終セグメントは必ず segment_size 未満なので、端数が TAG_SIZE 未満なら途中で切れている
+    if remainder < TAG_SIZE:
+        raise ValueError("暗号化された本体が途中で切れています")
+    return full_segments * segment_size + remainder - TAG_SIZE
+
+
+def read_full(f, size: int) -> bytes:
+    """EOFに達するまで size バイトを読み切る（パイプの短い読み込み対策）"""
+    data = f.read(size)
+    if len(data) == size or not data:
+        return data
+    chunks = [data]
+    remaining = size - len(data)
+    while remaining:
+        chunk = f.read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_full_into(f, buffer) -> int:
+    """EOFに達するまで buffer を埋め、読んだバイト数を返す（readinto がなければ read で代用）"""
+    view = memoryview(buffer)
+    filled = 0
+    readinto = getattr(f, "readinto", None)
+    while filled < len(view):
+        if readinto is not None:
+            n = readinto(view[filled:])
+        else:
+            data = f.read(len(view) - filled)
+            n = len(data)
+            view[filled:filled + n] = data
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def copy_into(src, dst, buffer_size: int) -> int:
+    """src を最後まで dst に書き写し、バイト数を返す（1つのバッファに readinto して使い回す）"""
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        n = read_full_into(src, buffer)
+        if n:
+            dst.write(view[:n])
+            total += n
+        if n < buffer_size:
+            return total
+
+
+def stream_size(f):
+    """ファイルオブジェクト全体の大きさ（通常ファイルでもシーク可能でもなければ None）"""
+    try:
+        st = os.fstat(f.fileno())
+        if stat.S_ISREG(st.st_mode):
+            return st.st_size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        pass
+    try:
+        if not f.seekable():
+            return None
+        position = f.tell()
+        size = f.seek(0, os.SEEK_END)
+        f.seek(position)
+        return size
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+
+
+class SegmentWriter:
+    """書き込まれた平文をセグメントごとに暗号化して dst に流すファイル風オブジェクト
+
+    PdfWriter.write() にそのまま渡せるよう write / tell / flush を持つ。
+    close() で最終セグメントを書き出すので、必ず close するか with で使うこと。
+    threads > 1 のときは暗号化をスレッドプールに任せ、書き込みはセグメント順を保つ。
+    stats を渡すと暗号化の時間とバイト数を aes_gcm に記録する。aad は各セグメントで認証するデータ。
+    """
+
+    def __init__(self, dst, key: bytes, nonce_prefix: bytes, segment_size: int = DEFAULT_SEGMENT_SIZE, threads: int = 1, stats=None, aad: bytes = b""):
+        self._dst = dst
+        self._key = key
+        self._nonce_prefix = nonce_prefix
+        self._aad = aad
+        self._segment_size = check_segment_size(segment_size)
+        self._buffer = bytearray()
+        self._index = 0
+        self._position = 0
+        self._pool = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        self._out = segment_buffer(self._segment_size) if self._pool is None else None  # 暗号文の出力先（書いたらすぐ使い回す）
+        self._pending = deque()  # 書き込み待ちの Future（セグメント順）
+        self._max_pending = threads * 2  # メモリ上に置くセグメント数の上限
+        self._stats = stats
+        self.closed = False
+
+    def write(self, data) -> int:
+        if self.closed:
+            raise ValueError("閉じられた SegmentWriter には書き込めません")
+        view = memoryview(data).cast("B")
+        written = len(view)
+        while view:
+            if not self._buffer and len(view) >= self._segment_size:
+                # 区切りに揃った満杯のセグメントはバッファに写さず、そのまま暗号化する
+                self._seal(view[:self._segment_size], last=False)
+                view = view[self._segment_size:]
+                continue
+            take = min(self._segment_size - len(self._buffer), len(view))
+            self._buffer += view[:take]
+            view = view[take:]
+            if len(self._buffer) == self._segment_size:
+                # 後続データの有無に関わらず満杯のセグメントは終端ではない
+                self._emit(last=False)
+        self._position += written
+        return written
+
+    def _emit(self, last: bool):
+        self._seal(self._buffer, last)
+        self._buffer.clear()
+
+    def _seal(self, data, last: bool):
+        if self._pool is None:
+            # その場で暗号化して書くので、呼び出し元のバッファも出力バッファもコピーせずに使える
+            self._write_sealed(timed(self._stats, "aes_gcm", len(data), seal_segment, self._key, self._nonce_prefix, self._index, data, last, self._out, self._aad))
+        else:
+            # スレッドに渡す間に書き換えられないよう、ここでだけコピーする
+            self._pending.append(self._pool.submit(timed, self._stats, "aes_gcm", len(data), seal_segment, self._key, self._nonce_prefix, self._index, bytes(data), last, None, self._aad))
+            while len(self._pending) >= self._max_pending:
+                self._write_sealed(self._pending.popleft().result())
+        self._index += 1
+
+    def _write_sealed(self, sealed):
+        ciphertext, tag = sealed
+        self._dst.write(ciphertext)
+        self._dst.write(tag)
+
+    def _drain(self):
+        while self._pending:
+            self._write_sealed(self._pending.popleft().result())
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            try:
+                self._emit(last=True)
+                self._drain()
+            finally:
+                self._shutdown()
+
+    def _shutdown(self):
+        self.closed = True
+        if self._pool is not None:
+            for future in self._pending:
+                future.cancel()
+            self._pending.clear()
+            self._pool.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown()
+
+
+def iter_decrypted_segments(src, key: bytes, nonce_prefix: bytes, segment_size: int = DEFAULT_SEGMENT_SIZE, threads: int = 1, stats=None, aad: bytes = b""):
+    """src から暗号化セグメントを順に読み、復号した平文を1セグメントずつ返す（aad は SegmentWriter と同じ）
+
+    threads <= 1 では入力・出力のバッファを使い回し、平文は memoryview で返す。
+    次のセグメントを取り出すと上書きされるので、その前に書き出すかコピーすること。
+    """
+    chunk_size = check_segment_size(segment_size) + TAG_SIZE
+    if threads <= 1:
+        chunk = bytearray(chunk_size)
+        view = memoryview(chunk)
+        out = segment_buffer(segment_size)
+        index = 0
+        while True:
+            n = read_full_into(src, chunk)
+            last = n < chunk_size
+            yield timed(stats, "aes_gcm", n, decrypt_segment, key, nonce_prefix, index, view[:n], last, out, aad)
+            if last:
+                return
+            index += 1
+
+    # 先読みしたセグメントをスレッドプールで復号し、順番どおりに返す
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        try:
+            index = 0
+            last = False
+            while not last:
+                chunk = read_full(src, chunk_size)
+                last = len(chunk) < chunk_size
+                pending.append(pool.submit(timed, stats, "aes_gcm", len(chunk), decrypt_segment, key, nonce_prefix, index, chunk, last, None, aad))
+                index += 1
+                while len(pending) >= threads * 2 or (last and pending):
+                    yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def decrypt_segments(src, dst, key: bytes, nonce_prefix: bytes, segment_size: int = DEFAULT_SEGMENT_SIZE, threads: int = 1, aad: bytes = b"") -> int:
+    """src の暗号化セグメントをすべて復号して dst に書き込み、平文のバイト数を返す"""
+    total = 0
+    for plaintext in iter_decrypted_segments(src, key, nonce_prefix, segment_size, threads, aad=aad):
+        dst.write(plaintext)
+        total += len(plaintext)
+    return total
+
+
+class SegmentReader:
+    """暗号化された本体から任意の範囲の平文を、必要なセグメントだけ復号して読む
+
+    src はシーク可能なファイル、body_offset は最初のセグメントの位置、cipher_size は本体全体の長さ。
+    直前に復号したセグメントを1つ保持するので、前から順に読めば各セグメントの復号は1回で済む。
+    aad は SegmentWriter と同じ。
+    """
+
+    def __init__(self, src, key: bytes, nonce_prefix: bytes, segment_size: int, body_offset: int, cipher_size: int, stats=None, aad: bytes = b""):
+        self._src = src
+        self._key = key
+        self._nonce_prefix = nonce_prefix
+        self._aad = aad
+        self._segment_size = check_segment_size(segment_size)
+        self._body_offset = body_offset
+        self._stats = stats
+        self.size = decrypted_body_size(cipher_size, segment_size)
+        self._last_index = cipher_size // (segment_size + TAG_SIZE)  # 最終セグメントの番号
+        self._cached_index = None
+        self._cached = b""
+
+    def _segment(self, index: int) -> bytes:
+        if index != self._cached_index:
+            chunk_size = self._segment_size + TAG_SIZE
+            self._src.seek(self._body_offset + index * chunk_size)
+            chunk = read_full(self._src, chunk_size)
+            self._cached = timed(self._stats, "aes_gcm", len(chunk), decrypt_segment, self._key, self._nonce_prefix, index, chunk, index == self._last_index, None, self._aad)
+            self._cached_index = index
+        return self._cached
+
+    def read(self, start: int, length: int) -> bytes:
+        """平文の start から length バイトを返す"""
+        if start < 0 or length < 0 or start + length > self.size:
+            raise ValueError("本体の範囲外を読み込もうとしました")
+        parts = []
+        while length > 0:
+            index, skip = divmod(start, self._segment_size)
+            segment = memoryview(self._segment(index))  # 切り出しはつなぐときの1回だけコピーする
+            take = min(length, len(segment) - skip)
+            parts.append(segment[skip:skip + take])
+            start += take
+            length -= take
+        return b"".join(parts)
@@ -2,41 +2,56 @@
 # 1. ソルトを生成（または受け取る）
 # 2. PBKDF2HMAC でパスワード → 鍵を生成
 # 3. 32バイト（AES-256）鍵を返す
+#    single_kdf の場合は PBKDF2 を1回だけ行い、HKDF でメタデータ用・本体用の鍵に分ける
+#    バッチ処理では KeyCache で同じ (パスワード, ソルト) のマスター鍵を使い回す
 
 import os
 import re
 import getpass
+import hashlib
+import threading
+from collections import OrderedDict
 from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
+META_KEY_INFO = b"pdfveil meta key"
+BODY_KEY_INFO = b"pdfveil body key"
+PBKDF2_ITERATIONS = 500_000  # 既定の反復回数（KeyCache のキーにも同じ値を使う）
+
 def is_strong_password(password: str) -> bool:
     """強力なパスワードかどうかを検証 (12文字以上、大小文字、数字、特殊文字を含む)"""
     return bool(re.match(r'^(?=.*[A-Z])(?=.*[a-z])(?=.*\d)(?=.*[!@#$%^&*])[A-Za-z\d!@#$%^&*]{12,}$', password))
 
+def confirm_password_strength(password: str, file: str) -> str:
+    """弱いパスワードならこのまま使うか確認し、最終的に使うパスワードを返す"""
+    if is_strong_password(password):
+        return password
+    while True:
+        user_response = input(f"[!] {file}に設定したパスワードが強力ではありませんが、このまま暗号化しますか？ (Yes/No): ").strip().lower()
+        if user_response == 'yes':
+            return password  # 暗号化を続行
+        elif user_response == 'no':
+            password = getpass.getpass("🔑 Enter password: ")
+            if is_strong_password(password):
+                return password  # 新しい強力なパスワードで再試行
+            else:
+                print("[!] 強力なパスワードが必要です。再度入力してください。")
+        else:
+            print("[!] 'Yes' か 'No' を入力してください。")
+
 def generate_salt(length: int = 16) -> bytes:
     """ランダムなソルトを生成"""
     return os.urandom(length)
 
-def derive_key(password: str, salt: bytes, mode: str, file: str, skip_strength_check=False, iterations: int = 500_000) -> bytes:
-    """パスワードとソルトからAES鍵（32バイト）を導出"""
-    user_response = ""
-    if skip_strength_check:
-        user_response = "yes"  # 標準入力をシミュレート
-    elif mode == 'enc' and not is_strong_password(password):
-        # パスワードが強力でない場合にユーザーに確認を取る
-        while True:
-            user_response = input(f"[!] {file}に設定したパスワードが強力ではありませんが、このまま暗号化しますか？ (Yes/No): ").strip().lower()
-            if user_response == 'yes':
-                break  # 暗号化を続行
-            elif user_response == 'no':
-                password = getpass.getpass("🔑 Enter password: ")
-                if is_strong_password(password):
-                    break  # 新しい強力なパスワードで再試行
-                else:
-                    print("[!] 強力なパスワードが必要です。再度入力してください。")
-            else:
-                print("[!] 'Yes' か 'No' を入力してください。")
-    
+def derive_key(password: str, salt: bytes, mode: str = None, file: str = None, skip_strength_check=False, iterations: int = PBKDF2_ITERATIONS) -> bytes:
+    """パスワードとソルトからAES鍵（32バイト）を導出
+
+    mode='enc' で skip_strength_check=False のときだけ、弱いパスワードをこのまま使うか確認する（confirm_password_strength）。
+    """
+    if mode == 'enc' and not skip_strength_check:
+        password = confirm_password_strength(password, file)
+
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,  # AES-256 = 32バイト鍵
@@ -44,3 +59,81 @@ def derive_key(password: str, salt: bytes, mode: str, file: str, skip_strength_c
         iterations=iterations,
     )
     return kdf.derive(password.encode())
+
+def derive_subkey(master_key: bytes, salt: bytes, info: bytes) -> bytes:
+    """HKDF-SHA256でマスター鍵から用途別の鍵（32バイト）を導出"""
+    hkdf = HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=salt,
+        info=info,
+    )
+    return hkdf.derive(master_key)
+
+class KeyCache:
+    """PBKDF2で導出したマスター鍵を保持する上限付きのキャッシュ（LRU）
+
+    鍵は bytearray で持ち、追い出し時と clear() 時にゼロで上書きする。
+    呼び出し側には bytes のコピーを返すので、別スレッドが使っている最中の鍵がゼロ化されることはない。
+    キャッシュのキーにはパスワードそのものではなく、ソルトと合わせたハッシュを使う。
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _cache_key(password: str, salt: bytes, iterations: int) -> bytes:
+        return hashlib.sha256(salt + iterations.to_bytes(4, "big") + password.encode()).digest()
+
+    def get_or_derive(self, password: str, salt: bytes, iterations: int, derive) -> bytes:
+        """キャッシュにあればそれを、なければ derive() の結果を保存して返す（どちらもコピー）"""
+        cache_key = self._cache_key(password, salt, iterations)
+        with self._lock:
+            if cache_key in self._entries:
+                self._entries.move_to_end(cache_key)
+                return bytes(self._entries[cache_key])
+        master_key = bytes(derive())
+        with self._lock:
+            self._entries[cache_key] = bytearray(master_key)
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                _zeroize(evicted)
+        return master_key
+
+    def clear(self):
+        """保持している鍵をすべてゼロ化して破棄"""
+        with self._lock:
+            for master_key in self._entries.values():
+                _zeroize(master_key)
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+def _zeroize(buffer: bytearray):
+    buffer[:] = bytes(len(buffer))
+
+def _single_kdf_master_key(password, meta_salt, mode, file, skip_strength_check, key_cache, iterations) -> bytes:
+    # single_kdf のマスター鍵（key_cache があれば同じパスワード・ソルトで使い回す）
+    derive = lambda: derive_key(password, meta_salt, mode=mode, file=file, skip_strength_check=skip_strength_check, iterations=iterations)
+    return key_cache.get_or_derive(password, meta_salt, iterations, derive) if key_cache is not None else derive()
+
+def derive_file_keys(password: str, meta_salt: bytes, body_salt: bytes, single_kdf: bool, mode: str = None, file: str = None, skip_strength_check=False, key_cache: KeyCache = None, iterations: int = PBKDF2_ITERATIONS) -> tuple:
+    """メタデータ用と本体用の鍵を (meta_key, body_key) で返す"""
+    if single_kdf:
+        # PBKDF2は1回だけ。ファイルごとの body_salt をHKDFのソルトにする
+        master_key = _single_kdf_master_key(password, meta_salt, mode, file, skip_strength_check, key_cache, iterations)
+        return derive_subkey(master_key, body_salt, META_KEY_INFO), derive_subkey(master_key, body_salt, BODY_KEY_INFO)
+
+    meta_key = derive_key(password, meta_salt, mode=mode, file=file, skip_strength_check=skip_strength_check, iterations=iterations)
+    body_key = derive_key(password, body_salt, mode=mode, file=file, skip_strength_check=skip_strength_check, iterations=iterations)
+    return meta_key, body_key
+
+def derive_meta_key(password: str, meta_salt: bytes, body_salt: bytes, single_kdf: bool, mode: str = None, file: str = None, skip_strength_check=False, key_cache: KeyCache = None, iterations: int = PBKDF2_ITERATIONS) -> bytes:
+    """メタデータ用の鍵だけを導出（本体用の鍵のPBKDF2は行わない）"""
+    if single_kdf:
+        master_key = _single_kdf_master_key(password, meta_salt, mode, file, skip_strength_check, key_cache, iterations)
+        return derive_subkey(master_key, body_salt, META_KEY_INFO)
+    return derive_key(password, meta_salt, mode=mode, file=file, skip_strength_check=skip_strength_check, iterations=iterations)
@@ -0,0 +1,197 @@
+# pdfveil/watch.py
+# フォルダーの監視（pdfveil watch）
+# inotify（Linux、ctypes で libc を直接呼ぶ）で変更を待ち、使えなければ一定間隔のスキャンで代用する。
+# スキャナーなどが書き込み中のファイルを拾わないよう、大きさと更新時刻が settle 秒変わらなくなってから処理する。
+# 対象は隠しファイルでない *.pdf だけ（出力の .veil や一時ファイルは拾わない）。
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import time
+
+DEFAULT_SETTLE = 0.5  # 書き終えたとみなすまでの秒数
+DEFAULT_POLL_INTERVAL = 1.0
+
+# <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, len（この後に len バイトの名前）
+EVENT_BUFFER_SIZE = 64 * 1024
+
+
+def is_candidate(path: str) -> bool:
+    """監視の対象になるファイル名か（隠しファイルでない .pdf）"""
+    name = os.path.basename(path)
+    return name.lower().endswith(".pdf") and not name.startswith(".")
+
+
+def file_signature(path: str):
+    """(大きさ, 更新時刻) を返す（通常ファイルでなければ None）"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def scan_directory(directory: str) -> dict:
+    """directory 直下の対象ファイルとそのシグネチャ"""
+    found = {}
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if is_candidate(entry.name) and entry.is_file():
+                signature = file_signature(entry.path)
+                if signature is not None:
+                    found[entry.path] = signature
+    return found
+
+
+class PollingWatcher:
+    """一定間隔でディレクトリをスキャンし、増えた・変わった・消えたファイルを返す"""
+
+    def __init__(self, directory: str, interval: float = DEFAULT_POLL_INTERVAL):
+        self.directory = directory
+        self.interval = interval
+        self._known = scan_directory(directory)
+
+    def wait(self, timeout: float) -> set:
+        time.sleep(max(0.0, min(timeout, self.interval)))
+        current = scan_directory(self.directory)
+        changed = {path for path, signature in current.items() if self._known.get(path) != signature}
+        changed.update(self._known.keys() - current.keys())
+        self._known = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """inotify で directory 直下の作成・書き込み・移動・削除を待つ（Linux のみ）"""
+
+    def __init__(self, directory: str):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        if not hasattr(libc, "inotify_init1"):
+            raise OSError("inotify を使えません")
+        self.directory = directory
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, os.strerror(errno), directory)
+
+    def wait(self, timeout: float) -> set:
+        readable, _, _ = select.select([self.fd], [], [], max(0.0, timeout))
+        if not readable:
+            return set()
+        try:
+            data = os.read(self.fd, EVENT_BUFFER_SIZE)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            _, mask, _, name_length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + name_length].rstrip(b"\0")
+            offset += EVENT.size + name_length
+            if mask & IN_Q_OVERFLOW:
+                # イベントを取りこぼしたので全体を見直す
+                changed.update(scan_directory(self.directory))
+            elif name:
+                path = os.path.join(self.directory, os.fsdecode(name))
+                if is_candidate(path):
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def open_watcher(directory: str, polling: bool = False, interval: float = DEFAULT_POLL_INTERVAL):
+    """使えれば InotifyWatcher、使えなければ（または polling=True なら）PollingWatcher を返す"""
+    if not polling:
+        try:
+            return InotifyWatcher(directory)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(directory, interval)
+
+
+class Debouncer:
+    """変更のあったファイルを、大きさと更新時刻が settle 秒変わらなくなったら返す"""
+
+    def __init__(self, settle: float = DEFAULT_SETTLE):
+        self.settle = settle
+        self._pending = {}  # path -> (シグネチャ, 最後に変わった時刻)
+
+    def touch(self, path: str, now: float):
+        signature = file_signature(path)
+        if signature is None:
+            self._pending.pop(path, None)
+        elif path not in self._pending or self._pending[path][0] != signature:
+            self._pending[path] = (signature, now)
+
+    def ready(self, now: float) -> list:
+        ready = []
+        for path, (signature, since) in list(self._pending.items()):
+            current = file_signature(path)
+            if current is None:
+                del self._pending[path]
+            elif current != signature:
+                self._pending[path] = (current, now)
+            elif now - since >= self.settle:
+                del self._pending[path]
+                ready.append(path)
+        return sorted(ready)
+
+    def timeout(self, now: float, default: float) -> float:
+        """次に ready を確かめるまでの秒数"""
+        if not self._pending:
+            return default
+        return max(0.0, min(since + self.settle for _, since in self._pending.values()) - now)
+
+
+def watch_directory(directory: str, handle, settle: float = DEFAULT_SETTLE, polling: bool = False, interval: float = DEFAULT_POLL_INTERVAL, stop=None):
+    """directory に置かれたPDFを書き終えたら handle(path) を呼ぶ（stop（threading.Event）がセットされるまで）
+
+    起動時に既にあるPDFも対象にする。同じ内容のファイルは2回処理しない。
+    """
+    watcher = open_watcher(directory, polling, interval)
+    debouncer = Debouncer(settle)
+    handled = {}  # path -> 処理したときのシグネチャ（--remove しない場合に繰り返さない。消えたファイルは忘れる）
+    try:
+        now = time.monotonic()
+        for path in scan_directory(directory):
+            debouncer.touch(path, now)
+        while stop is None or not stop.is_set():
+            # stop を確かめられるよう、待つのは最長でも interval 秒
+            for path in watcher.wait(debouncer.timeout(time.monotonic(), interval)):
+                if file_signature(path) is None:
+                    handled.pop(path, None)  # 常駐中に handled が増え続けないよう、消えたファイル（--remove など）は忘れる
+                debouncer.touch(path, time.monotonic())
+            for path in debouncer.ready(time.monotonic()):
+                signature = file_signature(path)
+                if signature is None:
+                    handled.pop(path, None)
+                    continue
+                if handled.get(path) == signature:
+                    continue
+                handled[path] = signature
+                handle(path)
+    finally:
+        watcher.close()
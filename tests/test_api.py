@@ -0,0 +1,67 @@
+# tests/test_api.py
+import builtins
+import getpass
+import io
+import os
+import pytest
+from pypdf import PdfReader
+from pdfveil.decryptor import decrypt_bytes, decrypt_stream
+from pdfveil.encryptor import encrypt_bytes, encrypt_stream
+from pdfveil.utils import KeyCache
+
+PASSWORD = "weak"  # 弱いパスワードでも確認しない
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "test_files", "sample.pdf")
+
+@pytest.fixture(autouse=True)
+def no_console_input(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("console input must not be requested")
+    monkeypatch.setattr(builtins, "input", fail)
+    monkeypatch.setattr(getpass, "getpass", fail)
+
+def read_sample() -> bytes:
+    with open(SAMPLE_PDF, "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("options", [{}, {"encrypt_metadata": False}, {"paged": True, "unit_pages": 1}, {"single_kdf": True}])
+def test_bytes_roundtrip(options, capsys):
+    veil = encrypt_bytes(read_sample(), PASSWORD, **options)
+    assert veil.startswith(b"VEIL")
+    pdf = decrypt_bytes(veil, PASSWORD)
+    assert len(PdfReader(io.BytesIO(pdf)).pages) == len(PdfReader(SAMPLE_PDF).pages)
+    assert capsys.readouterr() == ("", "")
+
+def test_raw_roundtrip_is_byte_identical(capsys):
+    data = read_sample()
+    assert decrypt_bytes(encrypt_bytes(data, PASSWORD, raw=True, segment_size=4096), PASSWORD) == data
+    assert capsys.readouterr() == ("", "")
+
+def test_wrong_password_raises_value_error():
+    veil = encrypt_bytes(read_sample(), PASSWORD)
+    with pytest.raises(ValueError, match="認証"):
+        decrypt_bytes(veil, "wrong")
+
+def test_stream_api_with_files_and_key_cache(tmp_path):
+    # 通常ファイル同士なら raw の本体は mmap で処理する
+    veil_path = tmp_path / "sample.veil"
+    pdf_path = tmp_path / "sample.pdf"
+    key_cache = KeyCache()
+    with open(SAMPLE_PDF, "rb") as src, open(veil_path, "w+b") as dst:
+        written = encrypt_stream(src, dst, PASSWORD, raw=True, key_cache=key_cache)
+    assert written == os.path.getsize(veil_path)
+    with open(veil_path, "rb") as src, open(pdf_path, "w+b") as dst:
+        written = decrypt_stream(src, dst, PASSWORD, key_cache=key_cache)
+    assert written == os.path.getsize(SAMPLE_PDF)
+    assert pdf_path.read_bytes() == read_sample()
+    assert sorted(os.listdir(tmp_path)) == ["sample.pdf", "sample.veil"]  # 一時ファイルを作らない
+
+def test_metadata_warning_is_passed_to_callback(monkeypatch):
+    import pdfveil.decryptor as decryptor
+    veil = encrypt_bytes(read_sample(), PASSWORD, encrypt_metadata=False)
+    def broken(meta_data):
+        raise ValueError("broken")
+    monkeypatch.setattr(decryptor, "parse_info_dict", broken)
+    warnings = []
+    pdf = decrypt_bytes(veil, PASSWORD, warn=warnings.append)
+    assert pdf.startswith(b"%PDF-")
+    assert len(warnings) == 1 and "broken" in warnings[0]
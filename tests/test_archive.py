@@ -0,0 +1,122 @@
+# tests/test_archive.py
+import io
+import os
+import shutil
+import subprocess
+import sys
+import pytest
+from pdfveil.archive import Archive, HEADER, inspect_archive, is_archive, pack_files, unpack_archive
+from pdfveil.utils import KeyCache
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_PDF = os.path.join(TEST_DIR, "test_files/sample.pdf")
+REPO_DIR = os.path.dirname(TEST_DIR)
+PASSWORD = "Str0ng!Password"
+
+def make_pdfs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / name
+        shutil.copy(TEST_PDF, path)
+        paths.append(str(path))
+    return paths
+
+def test_entries_roundtrip_in_memory():
+    f = io.BytesIO()
+    archive = Archive(f, PASSWORD, create=True)
+    archive.add("big.pdf", io.BytesIO(b"x" * 10000), segment_size=4096)
+    archive.add("empty.pdf", io.BytesIO(b""))
+    archive.commit()
+
+    reopened = Archive(f, PASSWORD)
+    assert list(reopened.entries) == ["big.pdf", "empty.pdf"]
+    assert reopened.read("big.pdf") == b"x" * 10000
+    assert reopened.read("empty.pdf") == b""
+
+def test_pack_unpack_files_with_one_key_derivation(tmp_path):
+    files = make_pdfs(tmp_path, ["a.pdf", "b.pdf", "c.pdf"])
+    archive_path = str(tmp_path / "docs.varc")
+    key_cache = KeyCache()
+    assert pack_files(archive_path, files, PASSWORD, key_cache=key_cache) == ["a.pdf", "b.pdf", "c.pdf"]
+    assert is_archive(archive_path) and len(key_cache) == 1
+
+    outputs = unpack_archive(archive_path, PASSWORD, str(tmp_path / "out"), key_cache=key_cache)
+    with open(TEST_PDF, "rb") as f:
+        original = f.read()
+    assert [os.path.basename(p) for p in outputs] == ["a.pdf", "b.pdf", "c.pdf"]
+    assert all(open(p, "rb").read() == original for p in outputs)
+    assert len(key_cache) == 1
+
+def test_append_keeps_existing_entries_untouched(tmp_path):
+    archive_path = str(tmp_path / "docs.varc")
+    pack_files(archive_path, make_pdfs(tmp_path, ["a.pdf"]), PASSWORD)
+    with open(archive_path, "rb") as f:
+        before = f.read()
+
+    pack_files(archive_path, make_pdfs(tmp_path, ["b.pdf"]), PASSWORD, append=True)
+    with open(archive_path, "rb") as f:
+        after = f.read()
+    # 書き換わるのはヘッダーの索引の位置だけ（前の索引を含め、既存の部分はそのまま）
+    assert after[HEADER.size:len(before)] == before[HEADER.size:]
+    assert [e["name"] for e in inspect_archive(archive_path, PASSWORD)["entries"]] == ["a.pdf", "b.pdf"]
+
+def test_failed_append_leaves_previous_index(tmp_path, monkeypatch):
+    archive_path = str(tmp_path / "docs.varc")
+    pack_files(archive_path, make_pdfs(tmp_path, ["a.pdf"]), PASSWORD)
+    size = os.path.getsize(archive_path)
+
+    def fail(self):
+        raise OSError("disk full")
+    monkeypatch.setattr(Archive, "commit", fail)
+    with pytest.raises(OSError):
+        pack_files(archive_path, make_pdfs(tmp_path, ["b.pdf"]), PASSWORD, append=True)
+    monkeypatch.undo()
+
+    assert os.path.getsize(archive_path) == size
+    assert [e["name"] for e in inspect_archive(archive_path, PASSWORD)["entries"]] == ["a.pdf"]
+
+def test_duplicate_and_unsafe_names_are_rejected(tmp_path):
+    archive_path = str(tmp_path / "docs.varc")
+    files = make_pdfs(tmp_path, ["a.pdf"])
+    pack_files(archive_path, files, PASSWORD)
+    with pytest.raises(ValueError, match="既に"):
+        pack_files(archive_path, files, PASSWORD, append=True)
+    with open(archive_path, "r+b") as f:
+        archive = Archive(f, PASSWORD)
+        for name in ["../evil.pdf", "dir/a.pdf", "..", ""]:
+            with pytest.raises(ValueError, match="エントリー名"):
+                archive.add(name, io.BytesIO(b"x"))
+
+def test_wrong_password_and_tampered_index(tmp_path):
+    archive_path = str(tmp_path / "docs.varc")
+    pack_files(archive_path, make_pdfs(tmp_path, ["a.pdf"]), PASSWORD)
+    with pytest.raises(ValueError, match="認証"):
+        inspect_archive(archive_path, "wrong")
+    with open(archive_path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    with pytest.raises(ValueError, match="認証"):
+        inspect_archive(archive_path, PASSWORD)
+
+def run_pdfveil(*args):
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    return subprocess.run([sys.executable, "-c", code, *args], cwd=REPO_DIR, capture_output=True)
+
+def test_cli_pack_extract_unpack(tmp_path):
+    files = make_pdfs(tmp_path, ["a.pdf", "b.pdf"])
+    archive_path = str(tmp_path / "docs.varc")
+    assert run_pdfveil("pack", archive_path, *files, "-p", PASSWORD).returncode == 0
+    assert run_pdfveil("pack", archive_path, *make_pdfs(tmp_path, ["c.pdf"]), "-p", PASSWORD, "--append").returncode == 0
+
+    result = run_pdfveil("extract", archive_path, "c.pdf", "-p", PASSWORD, "-o", str(tmp_path / "one"))
+    assert result.returncode == 0, result.stdout
+    assert os.listdir(tmp_path / "one") == ["c.pdf"]
+
+    assert run_pdfveil("extract", archive_path, "missing.pdf", "-p", PASSWORD).returncode != 0
+    assert run_pdfveil("unpack", archive_path, "-p", PASSWORD).returncode == 0
+    assert sorted(os.listdir(tmp_path / "docs")) == ["a.pdf", "b.pdf", "c.pdf"]
+
+    result = run_pdfveil("info", archive_path, "-p", PASSWORD)
+    assert result.returncode == 0 and "3 件".encode() in result.stdout
@@ -0,0 +1,179 @@
+# tests/test_cli.py
+import io
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import pytest
+from pypdf import PdfReader
+import pdfveil.cli as cli_module
+from pdfveil.cli import process_files_one_by_one, process_one_file
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_PDF = os.path.join(TEST_DIR, "test_files/sample.pdf")
+REPO_DIR = os.path.dirname(TEST_DIR)
+HEAVY_MODULES = ("pypdf", "cryptography", "colorama", "multiprocessing")
+IMPORT_BUDGET_US = 150_000  # pdfveil.cli 全体の import 時間の上限（重い依存を読むと 250ms 以上かかる）
+PASSWORD = "Str0ng!Password"
+
+def make_batch(tmp_path, count):
+    files = []
+    for i in range(count):
+        path = tmp_path / f"doc{i}.pdf"
+        shutil.copy(TEST_PDF, path)
+        files.append(str(path))
+    return files
+
+def test_parallel_batch_roundtrip(tmp_path):
+    files = make_batch(tmp_path, 3)
+    results = process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 3, remove=True, jobs=2)
+    assert sorted(results) == sorted((f, None) for f in files)
+    veils = [f[:-4] + ".veil" for f in files]
+    assert all(os.path.exists(v) for v in veils)
+    assert not any(os.path.exists(f) for f in files)  # --remove
+
+    results = process_files_one_by_one(veils, "decrypt", False, [PASSWORD] * 3, jobs=2)
+    assert all(error is None for _, error in results)
+    assert all(os.path.exists(f) for f in files)
+
+def test_parallel_batch_reports_failures(tmp_path, capsys):
+    files = make_batch(tmp_path, 2)
+    process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 2, jobs=2)
+    veils = [f[:-4] + ".veil" for f in files]
+
+    # 1つだけパスワードを間違える -> 他のファイルは処理され、失敗は集計に残る
+    results = dict(process_files_one_by_one(veils, "decrypt", True, [PASSWORD, "wrong"], jobs=2))
+    assert results[veils[0]] is None
+    assert results[veils[1]] is not None
+    assert "成功 1 件 / 失敗 1 件" in capsys.readouterr().out
+
+def test_batch_key_derives_once(tmp_path, monkeypatch):
+    import pdfveil.utils as utils
+    from pdfveil.utils import generate_salt
+
+    calls = []
+    original = utils.derive_key
+    def counting_derive_key(*args, **kwargs):
+        calls.append(args)
+        return original(*args, **kwargs)
+    monkeypatch.setattr(utils, "derive_key", counting_derive_key)
+
+    files = make_batch(tmp_path, 3)
+    kdf_salt = generate_salt()
+    results = process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 3, jobs=1, kdf_salt=kdf_salt)
+    assert all(error is None for _, error in results)
+    assert len(calls) == 1  # 3ファイルでPBKDF2は1回
+
+    veils = [f[:-4] + ".veil" for f in files]
+    calls.clear()
+    results = process_files_one_by_one(veils, "decrypt", True, [PASSWORD] * 3, jobs=1)
+    assert all(error is None for _, error in results)
+    assert len(calls) == 1
+
+def test_stats_and_profile_are_collected_from_workers(tmp_path, capsys):
+    files = make_batch(tmp_path, 2)
+    profile_path = str(tmp_path / "run.prof")
+    process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 2, jobs=2, stats="json", profile=profile_path)
+
+    report = json.loads(capsys.readouterr().err.strip().splitlines()[-1])
+    assert sorted(data["file"] for data in report["files"]) == sorted(files)
+    assert report["total"]["files"] == 2
+    assert report["total"]["seconds"]["kdf"] > 0
+    # ワーカーのプロファイルは1つにまとめて保存される
+    assert any("encrypt_pdf" in function for _, _, function in pstats.Stats(profile_path).stats)
+
+def profile_then_crash(*args, **kwargs):
+    # プロファイルを書いた後でワーカーの結果を返せなくなった場合（future.result() が例外になる）
+    process_one_file(*args, **kwargs)
+    raise RuntimeError("worker crashed")
+
+@pytest.fixture
+def temp_dir(tmp_path, monkeypatch):
+    path = tmp_path / "tmp"
+    path.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(path))
+    return path
+
+def test_profile_temp_files_are_removed_when_workers_fail(tmp_path, temp_dir, monkeypatch):
+    files = make_batch(tmp_path, 2)
+    monkeypatch.setattr(cli_module, "process_one_file", profile_then_crash)
+    results = process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 2, jobs=2, profile=str(tmp_path / "run.prof"))
+    assert all("worker crashed" in error for _, error in results)
+    assert list(temp_dir.iterdir()) == []
+
+def test_profile_temp_files_are_removed_on_early_exit(tmp_path, temp_dir, monkeypatch):
+    files = make_batch(tmp_path, 2)
+    def interrupted(*args):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(cli_module, "save_profile", interrupted)
+    with pytest.raises(KeyboardInterrupt):
+        process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 2, jobs=1, profile=str(tmp_path / "run.prof"))
+    assert list(temp_dir.iterdir()) == []
+
+def run_python(*args):
+    return subprocess.run([sys.executable, *args], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+
+def test_version_does_not_load_heavy_modules():
+    code = (
+        "import sys; sys.argv = ['pdfveil', '--version']\n"
+        "from pdfveil.cli import run_cli; run_cli()\n"
+        f"print(sorted({{m.split('.')[0] for m in sys.modules}} & set({HEAVY_MODULES!r})))"
+    )
+    result = run_python("-c", code)
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+def test_cli_import_time_budget():
+    result = run_python("-X", "importtime", "-c", "import pdfveil.cli")
+    # stderr の各行は "import time: self | cumulative | module"
+    timings = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, module = line.split("|")
+            if cumulative.strip().isdigit():
+                timings[module.strip()] = int(cumulative)
+    assert not any(name.split(".")[0] in HEAVY_MODULES for name in timings)
+    assert timings["pdfveil.cli"] < IMPORT_BUDGET_US
+
+def run_pdfveil(*args, input=b""):
+    # 標準入力・標準出力はパイプになる（シークできない）
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    return subprocess.run([sys.executable, "-c", code, *args], cwd=REPO_DIR, input=input, capture_output=True)
+
+@pytest.mark.parametrize("options", [[], ["--raw"], ["--paged"], ["--no-encrypt-metadata", "--segment-size", "4K"]])
+def test_stdin_stdout_pipeline(options):
+    with open(TEST_PDF, "rb") as f:
+        pdf = f.read()
+    encrypted = run_pdfveil("encrypt", "-", "-o", "-", "-p", PASSWORD, *options, input=pdf)
+    assert encrypted.returncode == 0
+    assert encrypted.stdout.startswith(b"VEIL")
+    assert b"[+]" in encrypted.stderr  # 表示は標準エラー出力だけ
+
+    # 入力が '-' なら -o を省略しても標準出力に書く
+    decrypted = run_pdfveil("decrypt", "-", "-p", PASSWORD, input=encrypted.stdout)
+    assert decrypted.returncode == 0
+    if "--raw" in options:
+        assert decrypted.stdout == pdf
+    else:
+        assert len(PdfReader(io.BytesIO(decrypted.stdout)).pages) == len(PdfReader(TEST_PDF).pages)
+
+def test_stdio_with_files(tmp_path):
+    veil = run_pdfveil("encrypt", TEST_PDF, "-o", "-", "-p", PASSWORD, "--raw").stdout
+    out_path = tmp_path / "out.pdf"
+    result = run_pdfveil("decrypt", "-", "-o", str(out_path), "-p", PASSWORD, input=veil)
+    assert result.returncode == 0
+    with open(TEST_PDF, "rb") as f:
+        assert out_path.read_bytes() == f.read()
+    # 既存のファイルは --force なしでは上書きしない
+    assert run_pdfveil("decrypt", "-", "-o", str(out_path), "-p", PASSWORD, input=veil).returncode == 1
+
+def test_stdio_errors_exit_nonzero():
+    with open(TEST_PDF, "rb") as f:
+        veil = run_pdfveil("encrypt", "-", "-p", PASSWORD, input=f.read()).stdout
+    result = run_pdfveil("decrypt", "-", "-p", "wrong", input=veil)
+    assert result.returncode == 1
+    assert result.stdout == b""
+    assert "認証" in result.stderr.decode()
+    assert run_pdfveil("encrypt", "-", TEST_PDF, "-p", PASSWORD).returncode == 1
@@ -0,0 +1,112 @@
+# tests/test_compress.py
+import os
+import subprocess
+import sys
+import zlib
+from io import BytesIO
+import pytest
+import pdfveil.compress as compress_module
+from pdfveil.compress import CODEC_ZLIB, CODECS, CompressingWriter, iter_decompressed, parse_compression
+from pdfveil.decryptor import decrypt_bytes, decrypt_stream, inspect_veil
+from pdfveil.encryptor import encrypt_bytes
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_PDF = os.path.join(TEST_DIR, "test_files/sample.pdf")
+REPO_DIR = os.path.dirname(TEST_DIR)
+PASSWORD = "Str0ng!Password"
+
+def read_sample() -> bytes:
+    with open(TEST_PDF, "rb") as f:
+        return f.read()
+
+def compressible_pdf() -> bytes:
+    # 末尾にコメントを足しても有効なPDFのまま（raw で暗号化するのでそのまま戻る）
+    return read_sample() + b"%" + b"pdfveil " * 64 * 1024 + b"\n"
+
+@pytest.mark.parametrize("options", [{"raw": True}, {}, {"encrypt_metadata": False}, {"envelope": True, "raw": True}])
+def test_roundtrip_matches_uncompressed(options):
+    data = read_sample()
+    expected = decrypt_bytes(encrypt_bytes(data, PASSWORD, **options), PASSWORD)
+    assert decrypt_bytes(encrypt_bytes(data, PASSWORD, compression="zlib:9", segment_size=4096, **options), PASSWORD) == expected
+
+def test_compressible_input_gets_smaller():
+    data = compressible_pdf()
+    plain = encrypt_bytes(data, PASSWORD, raw=True)
+    compressed = encrypt_bytes(data, PASSWORD, raw=True, compression="zlib")
+    assert len(compressed) < len(plain) // 10
+    assert decrypt_bytes(compressed, PASSWORD) == data
+
+def test_info_shows_codec(tmp_path):
+    path = tmp_path / "sample.veil"
+    path.write_bytes(encrypt_bytes(read_sample(), PASSWORD, raw=True, compression="zlib:1"))
+    info = inspect_veil(str(path))
+    assert "compressed" in info["flags"] and info["compression"] == "zlib"
+
+@pytest.mark.parametrize("value", ["lz4", "zlib:10", "zlib:x", "zstd:0"])
+def test_invalid_spec_is_rejected(value):
+    with pytest.raises(ValueError):
+        parse_compression(value)
+
+def test_paged_cannot_be_compressed():
+    with pytest.raises(ValueError, match="--paged"):
+        encrypt_bytes(read_sample(), PASSWORD, paged=True, compression="zlib")
+
+def test_zstd_requires_zstandard(monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+    with pytest.raises(ValueError, match="zstandard"):
+        parse_compression("zstd")
+
+def test_zstd_corrupt_stream_is_rejected():
+    pytest.importorskip("zstandard")
+    with pytest.raises(ValueError, match="展開できません"):
+        list(iter_decompressed([b"not a zstd frame" * 4], CODECS["zstd"]))
+
+def test_zstd_roundtrip():
+    pytest.importorskip("zstandard")
+    data = compressible_pdf()
+    veil = encrypt_bytes(data, PASSWORD, raw=True, compression="zstd:3")
+    assert decrypt_bytes(veil, PASSWORD) == data
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+def test_decompression_output_is_bounded(monkeypatch, codec):
+    # 圧縮率の極端な入力でも、展開は MAX_OUTPUT_CHUNK ずつ取り出す
+    if codec == "zstd":
+        pytest.importorskip("zstandard")
+    monkeypatch.setattr(compress_module, "MAX_OUTPUT_CHUNK", 64 * 1024)
+    out = BytesIO()
+    with CompressingWriter(out, codec, 9) as writer:
+        writer.write(bytes(8 * 1024 * 1024))
+    compressed = out.getvalue()
+    # 1つの断片から大きく展開される場合も、細かい断片の場合も上限を守る
+    pieces = [compressed[i:i + 7] for i in range(0, len(compressed), 7)]
+    chunks = list(iter_decompressed([compressed], CODECS[codec])) + list(iter_decompressed(pieces, CODECS[codec]))
+    assert max(len(chunk) for chunk in chunks) <= 64 * 1024
+    assert sum(len(chunk) for chunk in chunks) == 2 * 8 * 1024 * 1024
+
+def test_truncated_stream_is_rejected():
+    data = zlib.compress(bytes(1024))
+    with pytest.raises(ValueError, match="途中で切れて"):
+        list(iter_decompressed([data[:-4]], CODEC_ZLIB))
+
+def test_decrypt_streams_from_pipe():
+    data = compressible_pdf()
+    veil = encrypt_bytes(data, PASSWORD, raw=True, compression="zlib", segment_size=4096)
+    r, w = os.pipe()
+    with os.fdopen(w, "wb") as f:
+        f.write(veil)
+    out = BytesIO()
+    with os.fdopen(r, "rb") as src:
+        decrypt_stream(src, out, PASSWORD)
+    assert out.getvalue() == data
+
+def test_cli_compress(tmp_path):
+    path = tmp_path / "sample.pdf"
+    path.write_bytes(read_sample())
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    bad = subprocess.run([sys.executable, "-c", code, "encrypt", str(path), "-p", PASSWORD, "--compress", "lz4"],
+                         cwd=REPO_DIR, capture_output=True, text=True)
+    assert bad.returncode != 0 and "lz4" in bad.stderr
+    result = subprocess.run([sys.executable, "-c", code, "encrypt", str(path), "-p", PASSWORD, "--compress", "zlib:9", "--raw", "-j", "1"],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert decrypt_bytes((tmp_path / "sample.veil").read_bytes(), PASSWORD) == read_sample()
@@ -1,9 +1,11 @@
 # tests/test_decryptor.py
 import os
 import hashlib
+import struct
+import pytest
 from pypdf import PdfReader
 from pdfveil.encryptor import encrypt_pdf
-from pdfveil.decryptor import decrypt_pdf
+from pdfveil.decryptor import decrypt_bytes, decrypt_pdf
 
 TEST_PDF = "tests/test_files/sample.pdf"
 ENCRYPTED_FILE = "tests/test_files/sample.veil"
@@ -52,3 +54,124 @@ def test_decrypt_pdf_success():
     original_text = extract_text_from_pdf(TEST_PDF)
     decrypted_text = extract_text_from_pdf(DECRYPTED_FILE)
     assert original_text == decrypted_text, "The decrypted PDF content does not match the original PDF content."
+
+def write_version1_veil(pdf_path: str, veil_path: str, password: str):
+    """旧フォーマット (version 1) の .veil を作成する"""
+    from pdfveil.encryptor import extract_body_without_metadata, extract_pdf_metadata
+    from pdfveil.utils import derive_key
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    def seal(key, data):
+        iv = os.urandom(12)
+        encryptor = Cipher(algorithms.AES(key), modes.GCM(iv)).encryptor()
+        ciphertext = encryptor.update(data) + encryptor.finalize()
+        return iv, ciphertext, encryptor.tag
+
+    meta_salt, body_salt = os.urandom(16), os.urandom(16)
+    meta_iv, meta_ct, meta_tag = seal(derive_key(password, meta_salt, mode='dec', file=pdf_path), extract_pdf_metadata(pdf_path))
+    iv, ciphertext, tag = seal(derive_key(password, body_salt, mode='dec', file=pdf_path), extract_body_without_metadata(pdf_path))
+    with open(veil_path, "wb") as f:
+        f.write(b"VEIL\x01\x01")
+        f.write(meta_salt + meta_iv + struct.pack(">I", len(meta_ct)) + meta_ct + meta_tag)
+        f.write(body_salt + iv + struct.pack(">I", len(ciphertext)) + ciphertext + tag)
+
+def test_decrypt_version1_file(tmp_path):
+    veil_path = str(tmp_path / "legacy.veil")
+    out_path = str(tmp_path / "legacy.pdf")
+    write_version1_veil(TEST_PDF, veil_path, PASSWORD)
+
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert extract_text_from_pdf(out_path) == extract_text_from_pdf(TEST_PDF)
+
+def test_decrypt_small_segments(tmp_path):
+    veil_path = str(tmp_path / "segmented.veil")
+    out_path = str(tmp_path / "segmented.pdf")
+    # 本体が複数セグメントにまたがるように小さく区切る
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, segment_size=1024)
+    with open(veil_path, "rb") as f:
+        assert f.read(5) == b"VEIL\x02"
+
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert extract_text_from_pdf(out_path) == extract_text_from_pdf(TEST_PDF)
+
+def test_decrypt_tampered_body_fails(tmp_path):
+    veil_path = str(tmp_path / "tampered.veil")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, segment_size=1024)
+    with open(veil_path, "r+b") as f:
+        f.seek(-20, os.SEEK_END)
+        byte = f.read(1)
+        f.seek(-20, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError):
+        decrypt_pdf(veil_path, PASSWORD, output_path=str(tmp_path / "tampered.pdf"))
+
+@pytest.mark.parametrize("encrypt_metadata", [True, False])
+def test_decrypt_single_kdf(tmp_path, encrypt_metadata):
+    veil_path = str(tmp_path / "single.veil")
+    out_path = str(tmp_path / "single.pdf")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, encrypt_metadata=encrypt_metadata, single_kdf=True)
+    with open(veil_path, "rb") as f:
+        assert f.read(6)[5] & 0x02
+
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert extract_text_from_pdf(out_path) == extract_text_from_pdf(TEST_PDF)
+
+    with pytest.raises(Exception):
+        decrypt_pdf(veil_path, "wrongpassword", output_path=str(tmp_path / "wrong.pdf"))
+
+def test_decrypt_raw_is_byte_for_byte(tmp_path):
+    veil_path = str(tmp_path / "raw.veil")
+    out_path = str(tmp_path / "raw.pdf")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, raw=True, segment_size=1024)
+    with open(veil_path, "rb") as f:
+        assert b"Producer" not in f.read()  # /Info も暗号文の中
+
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert get_file_hash(out_path) == get_file_hash(TEST_PDF)
+
+@pytest.mark.parametrize("encrypt_metadata", [True, False])
+def test_decrypt_without_pdfwriter_roundtrip(tmp_path, monkeypatch, encrypt_metadata):
+    import pdfveil.decryptor as decryptor
+
+    veil_path = str(tmp_path / "fast.veil")
+    out_path = str(tmp_path / "fast.pdf")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, encrypt_metadata=encrypt_metadata)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("PdfWriter で再構築してはいけない")
+    monkeypatch.setattr(decryptor, "PdfWriter", fail)
+
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert extract_text_from_pdf(out_path) == extract_text_from_pdf(TEST_PDF)
+    if not encrypt_metadata:
+        # 増分更新で /Info が戻っている
+        reader = PdfReader(out_path, strict=True)
+        assert reader.metadata["/Producer"] == PdfReader(TEST_PDF).metadata["/Producer"]
+
+def encrypted_sample(tmp_path) -> bytes:
+    veil_path = str(tmp_path / "header.veil")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True)
+    with open(veil_path, "rb") as f:
+        return f.read()
+
+@pytest.mark.parametrize("bit", [0x04, 0x08])
+def test_decrypt_flipped_flag_fails(tmp_path, bit):
+    data = bytearray(encrypted_sample(tmp_path))
+    # ヘッダーは本体の AAD で認証されるので、フラグを書き換えると本体の検証で失敗する
+    data[5] ^= bit
+    with pytest.raises(ValueError):
+        decrypt_bytes(bytes(data), PASSWORD)
+
+@pytest.mark.parametrize("bit", [0x40, 0x80])
+def test_decrypt_unknown_flag_is_rejected(tmp_path, bit):
+    data = bytearray(encrypted_sample(tmp_path))
+    data[5] |= bit
+    with pytest.raises(ValueError, match="未対応のフラグ"):
+        decrypt_bytes(bytes(data), PASSWORD)
+
+@pytest.mark.parametrize("length", [5, 6, 30, 60])
+def test_decrypt_truncated_header_is_invalid(tmp_path, length):
+    data = encrypted_sample(tmp_path)
+    with pytest.raises(ValueError, match="無効なVEILファイル"):
+        decrypt_bytes(data[:length], PASSWORD)
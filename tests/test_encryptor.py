@@ -2,7 +2,7 @@ import os
 import pytest
 import json
 from pypdf import PdfWriter
-from pdfveil.encryptor import encrypt_pdf, extract_pdf_metadata
+from pdfveil.encryptor import encrypt_pdf, extract_pdf_metadata, extract_document
 
 TEST_DIR = os.path.dirname(__file__)
 TEST_PDF = os.path.join(TEST_DIR, "test_files/sample.pdf")
@@ -70,3 +70,11 @@ def test_extract_pdf_metadata_returns_json():
     # 4. 代表的なメタデータ項目が存在するかチェック（例: ProducerやCreator）
     expected_keys = ["/Producer", "/Creator", "/CreationDate"]
     assert any(k in metadata_dict for k in expected_keys)
+
+def test_extract_document_single_parse():
+    # 1回の解析でヘッダー・/Info と本体の両方が取れる
+    with open(TEST_PDF, "rb") as f:
+        meta_data, reader = extract_document(f)
+        assert meta_data.startswith(b"%PDF-")
+        assert b"/Producer" in meta_data
+        assert len(reader.pages) > 0
@@ -0,0 +1,101 @@
+# tests/test_envelope.py
+import os
+import subprocess
+import sys
+import pytest
+from pdfveil.decryptor import decrypt_bytes, inspect_veil
+from pdfveil.encryptor import encrypt_bytes
+from pdfveil.envelope import KEY_BLOCK, KEY_BLOCK_OFFSET, rekey_veil
+from pdfveil.utils import KeyCache
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_PDF = os.path.join(TEST_DIR, "test_files/sample.pdf")
+REPO_DIR = os.path.dirname(TEST_DIR)
+PASSWORD = "Str0ng!Password"
+NEW_PASSWORD = "N3w!Password99"
+KEY_BLOCK_END = KEY_BLOCK_OFFSET + KEY_BLOCK.size
+
+def read_sample() -> bytes:
+    with open(TEST_PDF, "rb") as f:
+        return f.read()
+
+def write_veil(tmp_path, **options) -> str:
+    path = str(tmp_path / "sample.veil")
+    with open(path, "wb") as f:
+        f.write(encrypt_bytes(read_sample(), PASSWORD, envelope=True, **options))
+    return path
+
+@pytest.mark.parametrize("options", [{}, {"raw": True}, {"paged": True}, {"encrypt_metadata": False}])
+def test_rekey_rewrites_only_the_key_block(tmp_path, options):
+    path = write_veil(tmp_path, **options)
+    with open(path, "rb") as f:
+        before = f.read()
+    plaintext = decrypt_bytes(before, PASSWORD)
+
+    rekey_veil(path, PASSWORD, NEW_PASSWORD)
+    with open(path, "rb") as f:
+        after = f.read()
+    assert len(after) == len(before)
+    assert after[:KEY_BLOCK_OFFSET] == before[:KEY_BLOCK_OFFSET]
+    assert after[KEY_BLOCK_END:] == before[KEY_BLOCK_END:]
+    assert decrypt_bytes(after, NEW_PASSWORD) == plaintext
+    with pytest.raises(ValueError, match="データ鍵"):
+        decrypt_bytes(after, PASSWORD)
+
+def test_raw_envelope_roundtrip_is_byte_identical():
+    veil = encrypt_bytes(read_sample(), PASSWORD, envelope=True, raw=True, segment_size=4096)
+    assert decrypt_bytes(veil, PASSWORD) == read_sample()
+
+def test_flag_is_authenticated(tmp_path):
+    veil = bytearray(encrypt_bytes(read_sample(), PASSWORD, envelope=True, raw=True))
+    veil[5] ^= 0x02  # 読み方の変わらないフラグでも、書き換えればデータ鍵を取り出せない
+    with pytest.raises(ValueError, match="データ鍵"):
+        decrypt_bytes(bytes(veil), PASSWORD)
+
+def test_rekey_rejects_non_envelope_files(tmp_path):
+    path = str(tmp_path / "plain.veil")
+    with open(path, "wb") as f:
+        f.write(encrypt_bytes(read_sample(), PASSWORD, raw=True))
+    with pytest.raises(ValueError, match="エンベロープ"):
+        rekey_veil(path, PASSWORD, NEW_PASSWORD)
+
+def test_shared_new_salt_derives_new_key_once(tmp_path):
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"doc{i}.veil")
+        with open(path, "wb") as f:
+            f.write(encrypt_bytes(read_sample(), PASSWORD, envelope=True, raw=True, kdf_salt=b"s" * 16))
+        paths.append(path)
+    key_cache = KeyCache()
+    for path in paths:
+        rekey_veil(path, PASSWORD, NEW_PASSWORD, kdf_salt=b"t" * 16, key_cache=key_cache)
+    assert len(key_cache) == 2  # 古いパスワードと新しいパスワードで1回ずつ
+
+def test_info_shows_envelope_flag(tmp_path):
+    info = inspect_veil(write_veil(tmp_path), PASSWORD)
+    assert "envelope" in info["flags"] and info["verified"]
+
+def test_cli_rekey(tmp_path):
+    path = write_veil(tmp_path, raw=True)
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    result = subprocess.run([sys.executable, "-c", code, "rekey", path, "-p", PASSWORD, "--new-password", NEW_PASSWORD],
+                            cwd=REPO_DIR, capture_output=True, text=True)
+    assert result.returncode == 0 and "Rekeyed" in result.stdout
+    with open(path, "rb") as f:
+        assert decrypt_bytes(f.read(), NEW_PASSWORD) == read_sample()
+
+@pytest.mark.parametrize("batch_key", [False, True])
+def test_cli_rekey_salt_is_per_file_unless_batch_key(tmp_path, batch_key):
+    paths = []
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+        paths.append(write_veil(tmp_path / name, raw=True))
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    args = ["rekey", *paths, "-p", PASSWORD, "--new-password", NEW_PASSWORD, "-j", "1"] + (["--batch-key"] if batch_key else [])
+    result = subprocess.run([sys.executable, "-c", code, *args], cwd=REPO_DIR, capture_output=True, text=True)
+    assert result.returncode == 0
+    salts = set()
+    for path in paths:
+        with open(path, "rb") as f:
+            salts.add(f.read(KEY_BLOCK_END)[KEY_BLOCK_OFFSET:KEY_BLOCK_OFFSET + 16])
+    assert len(salts) == (1 if batch_key else 2)
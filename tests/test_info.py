@@ -0,0 +1,69 @@
+# tests/test_info.py
+import os
+import pytest
+from pdfveil import utils
+from pdfveil.encryptor import encrypt_pdf
+from pdfveil.decryptor import inspect_veil, read_veil_header
+
+PASSWORD = "testpassword"
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "test_files", "sample.pdf")
+
+def encrypt_sample(tmp_path, name="sample.veil", **options) -> str:
+    veil_path = str(tmp_path / name)
+    encrypt_pdf(SAMPLE_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, **options)
+    return veil_path
+
+def test_info_without_password_shows_header_only(tmp_path):
+    veil_path = encrypt_sample(tmp_path)
+    info = inspect_veil(veil_path)
+    assert info["version"] == 2
+    assert info["flags"] == ["meta_encrypted"]
+    assert info["metadata_encrypted"] is True
+    assert info["verified"] is False
+    assert info["metadata"] is None
+    assert info["file_size"] == os.path.getsize(veil_path)
+
+def test_info_plain_metadata_without_password(tmp_path):
+    veil_path = encrypt_sample(tmp_path, encrypt_metadata=False)
+    info = inspect_veil(veil_path)
+    assert info["verified"] is False
+    assert info["pdf_header"].startswith("%PDF-")
+    assert "/Producer" in info["metadata"]
+
+@pytest.mark.parametrize("encrypt_metadata", [True, False])
+def test_info_with_password_verifies_metadata(tmp_path, encrypt_metadata):
+    veil_path = encrypt_sample(tmp_path, encrypt_metadata=encrypt_metadata)
+    info = inspect_veil(veil_path, PASSWORD)
+    assert info["verified"] is True
+    assert info["pdf_header"].startswith("%PDF-")
+    assert "/Producer" in info["metadata"]
+
+@pytest.mark.parametrize("encrypt_metadata", [True, False])
+def test_info_wrong_password(tmp_path, encrypt_metadata):
+    veil_path = encrypt_sample(tmp_path, encrypt_metadata=encrypt_metadata)
+    with pytest.raises(ValueError):
+        inspect_veil(veil_path, "wrongpassword")
+
+def test_info_flags(tmp_path):
+    assert inspect_veil(encrypt_sample(tmp_path, "raw.veil", raw=True))["flags"] == ["meta_encrypted", "raw"]
+    assert inspect_veil(encrypt_sample(tmp_path, "paged.veil", paged=True, single_kdf=True))["flags"] == ["meta_encrypted", "single_kdf", "paged"]
+
+@pytest.mark.parametrize("single_kdf", [True, False])
+def test_info_derives_only_meta_key(tmp_path, monkeypatch, single_kdf):
+    veil_path = encrypt_sample(tmp_path, single_kdf=single_kdf)
+    calls = []
+    derive_key = utils.derive_key
+    monkeypatch.setattr(utils, "derive_key", lambda *args, **kwargs: calls.append(1) or derive_key(*args, **kwargs))
+    assert inspect_veil(veil_path, PASSWORD)["verified"] is True
+    assert len(calls) == 1
+
+def test_info_does_not_read_body(tmp_path):
+    veil_path = encrypt_sample(tmp_path)
+    with open(veil_path, "rb") as f:
+        body_offset = read_veil_header(f)["body_offset"]
+    # 本体を壊してもヘッダーとメタデータは読める
+    with open(veil_path, "r+b") as f:
+        f.truncate(body_offset + 10)
+    info = inspect_veil(veil_path, PASSWORD)
+    assert info["verified"] is True
+    assert info["body_size"] == 10
@@ -0,0 +1,136 @@
+# tests/test_manifest.py
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+import pdfveil.manifest as manifest_module
+from pdfveil.manifest import Manifest, file_digest
+
+TEST_DIR = os.path.dirname(__file__)
+TEST_PDF = os.path.join(TEST_DIR, "test_files/sample.pdf")
+REPO_DIR = os.path.dirname(TEST_DIR)
+PASSWORD = "Str0ng!Password"
+
+def make_files(tmp_path, count):
+    files = []
+    for i in range(count):
+        path = tmp_path / f"doc{i}.pdf"
+        shutil.copy(TEST_PDF, path)
+        files.append(str(path))
+    return files
+
+def output_for(file):
+    return file[:-4] + ".veil"
+
+def fake_encrypt(files):
+    # 出力を書いて成功した結果を返す（暗号化そのものは test_cli で確かめる）
+    for file in files:
+        with open(output_for(file), "wb") as f:
+            f.write(b"veil")
+    return [(file, None) for file in files]
+
+def run_once(manifest_path, files, jobs=2, options="", password_for=None):
+    manifest = Manifest.load(manifest_path)
+    changed, overwrite = manifest.plan(files, output_for, jobs=jobs, options=options, password_for=password_for)
+    manifest.record(fake_encrypt(changed))
+    manifest.save()
+    return changed, overwrite
+
+def test_file_digest_streams_large_files(tmp_path):
+    path = tmp_path / "big.bin"
+    data = os.urandom(3 * 1024 * 1024 + 5)
+    path.write_bytes(data)
+    assert file_digest(str(path)) == hashlib.sha256(data).hexdigest()
+
+def test_unchanged_files_are_skipped_without_hashing(tmp_path, monkeypatch):
+    files = make_files(tmp_path, 3)
+    manifest_path = str(tmp_path / "manifest.json")
+    assert run_once(manifest_path, files) == (files, set())
+
+    hashed = []
+    monkeypatch.setattr(manifest_module, "file_digest", lambda path: hashed.append(path) or "")
+    assert run_once(manifest_path, files) == ([], set())
+    assert hashed == []
+
+def test_touched_file_is_hashed_but_not_reencrypted(tmp_path):
+    files = make_files(tmp_path, 2)
+    manifest_path = str(tmp_path / "manifest.json")
+    run_once(manifest_path, files)
+    st = os.stat(files[0])
+    os.utime(files[0], ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+    assert run_once(manifest_path, files) == ([], set())
+    # 更新時刻を記録し直すので、次回は読まずに飛ばせる
+    assert Manifest.load(manifest_path).entries[os.path.abspath(files[0])]["mtime_ns"] == st.st_mtime_ns + 10**9
+
+def test_changed_inputs_and_missing_outputs_are_reencrypted(tmp_path):
+    files = make_files(tmp_path, 4)
+    manifest_path = str(tmp_path / "manifest.json")
+    run_once(manifest_path, files)
+    with open(files[1], "ab") as f:
+        f.write(b"\n% changed\n")
+    os.remove(output_for(files[2]))
+    new_file = str(tmp_path / "new.pdf")
+    shutil.copy(TEST_PDF, new_file)
+
+    changed, overwrite = run_once(manifest_path, files + [new_file])
+    assert changed == [files[1], files[2], new_file]
+    assert overwrite == {files[1], files[2]}  # 前回自分が作った出力だけ --force なしで上書きする
+
+def test_changed_options_are_reencrypted(tmp_path):
+    files = make_files(tmp_path, 2)
+    manifest_path = str(tmp_path / "manifest.json")
+    run_once(manifest_path, files, options="raw")
+    assert run_once(manifest_path, files, options="raw") == ([], set())
+    assert run_once(manifest_path, files, options="raw,compress:zlib:6") == (files, set(files))
+
+def test_changed_password_is_reencrypted(tmp_path):
+    files = make_files(tmp_path, 2)
+    manifest_path = str(tmp_path / "manifest.json")
+    passwords = {files[0]: PASSWORD, files[1]: PASSWORD}
+    run_once(manifest_path, files, password_for=passwords.get)
+    assert run_once(manifest_path, files, password_for=passwords.get) == ([], set())
+
+    passwords[files[1]] = "An0ther!Password"
+    assert run_once(manifest_path, files, password_for=passwords.get) == ([files[1]], {files[1]})
+    # マニフェストにはパスワードそのものを残さない
+    with open(manifest_path, encoding="utf-8") as f:
+        assert PASSWORD not in f.read()
+
+def test_failed_files_are_not_recorded(tmp_path):
+    files = make_files(tmp_path, 2)
+    manifest = Manifest.load(str(tmp_path / "manifest.json"))
+    changed, _ = manifest.plan(files, output_for)
+    fake_encrypt(changed)
+    manifest.record([(files[0], None), (files[1], "error")])
+    assert list(manifest.entries) == [os.path.abspath(files[0])]
+
+def test_cli_incremental_run(tmp_path):
+    files = make_files(tmp_path, 3)
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    def run():
+        return subprocess.run([sys.executable, "-c", code, "encrypt", *files, "-p", PASSWORD, "--incremental", str(tmp_path / "m.json"), "-j", "1"],
+                              cwd=REPO_DIR, capture_output=True, text=True)
+    first = run()
+    assert first.returncode == 0 and first.stdout.count("Encrypted and saved to") == 3
+
+    with open(files[0], "ab") as f:
+        f.write(b"\n% changed\n")
+    second = run()
+    assert second.returncode == 0, second.stdout
+    assert second.stdout.count("Encrypted and saved to") == 1  # 変わった1件だけ、--force なしで上書き
+
+def test_cli_incremental_reencrypts_on_new_options_or_password(tmp_path):
+    files = make_files(tmp_path, 2)
+    code = "import sys; sys.argv[0] = 'pdfveil'; from pdfveil.cli import run_cli; run_cli()"
+    def run(*extra):
+        return subprocess.run([sys.executable, "-c", code, "encrypt", *files, "--incremental", str(tmp_path / "m.json"), "-j", "1", "--raw", *extra],
+                              cwd=REPO_DIR, capture_output=True, text=True)
+    assert run("-p", PASSWORD).stdout.count("Encrypted and saved to") == 2
+    assert run("-p", PASSWORD).stdout.count("Encrypted and saved to") == 0
+
+    changed_options = run("-p", PASSWORD, "--compress", "zlib")
+    assert changed_options.returncode == 0 and changed_options.stdout.count("Encrypted and saved to") == 2
+    changed_password = run("-p", PASSWORD, "An0ther!Password", "--compress", "zlib")
+    assert changed_password.returncode == 0 and changed_password.stdout.count("Encrypted and saved to") == 1
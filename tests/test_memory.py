@@ -0,0 +1,116 @@
+# tests/test_memory.py
+# 本体をヒープにコピーしていないか、tracemalloc のピークで確かめる
+import os
+import struct
+import tracemalloc
+from io import BytesIO
+import pytest
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from pdfveil.decryptor import decrypt_stream
+from pdfveil.encryptor import encrypt_stream
+from pdfveil.format import MAGIC, VERSION_1, FLAG_META_ENCRYPTED
+from pdfveil.utils import KeyCache, derive_file_keys, generate_salt
+
+PASSWORD = "Str0ng!Password"
+SEGMENT_SIZE = 1024 * 1024
+BODY_SIZE = 32 * SEGMENT_SIZE
+# 入出力のバッファ（各1セグメント）と多少の余裕。本体の大きさには比例しない
+PEAK_LIMIT = 2.5 * SEGMENT_SIZE
+
+def traced_peak(func) -> int:
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+@pytest.fixture(scope="module")
+def raw_input(tmp_path_factory):
+    path = tmp_path_factory.mktemp("memory") / "large.pdf"
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        f.write(os.urandom(BODY_SIZE))
+    return str(path)
+
+def test_streamed_encrypt_and_decrypt_do_not_copy_the_body(raw_input):
+    veil_path = raw_input + ".veil"
+    out_path = raw_input + ".out"
+    options = dict(raw=True, use_mmap=False, segment_size=SEGMENT_SIZE, kdf_salt=generate_salt(), key_cache=KeyCache())
+
+    def encrypt():
+        with open(raw_input, "rb") as src, open(veil_path, "wb") as dst:
+            encrypt_stream(src, dst, PASSWORD, **options)
+
+    def decrypt():
+        with open(veil_path, "rb") as src, open(out_path, "wb") as dst:
+            decrypt_stream(src, dst, PASSWORD, use_mmap=False, key_cache=options["key_cache"])
+
+    encrypt()  # 鍵導出を済ませておく
+    assert traced_peak(encrypt) < PEAK_LIMIT
+    assert traced_peak(decrypt) < PEAK_LIMIT
+    with open(raw_input, "rb") as a, open(out_path, "rb") as b:
+        assert a.read() == b.read()
+
+def write_version1(path, password: str, body: bytes):
+    # version 1（本体を1つのGCMで暗号化、読み込みのみ対応）を組み立てる
+    meta_salt, body_salt, meta_iv, body_iv = generate_salt(), generate_salt(), os.urandom(12), os.urandom(12)
+    meta_key, body_key = derive_file_keys(password, meta_salt, body_salt, False, skip_strength_check=True)
+    meta = AESGCM(meta_key).encrypt(meta_iv, b"", None)
+    sealed = AESGCM(body_key).encrypt(body_iv, body, None)
+    with open(path, "wb") as f:
+        f.write(MAGIC + VERSION_1 + bytes([FLAG_META_ENCRYPTED]))
+        f.write(meta_salt + meta_iv + struct.pack(">I", 0) + meta)
+        f.write(body_salt + body_iv + struct.pack(">I", len(body)))
+        f.write(sealed)
+
+def test_version1_body_is_decrypted_in_chunks(tmp_path):
+    body = b"%PDF-1.4\n" + os.urandom(BODY_SIZE)
+    path = str(tmp_path / "v1.veil")
+    write_version1(path, PASSWORD, body)
+    out_path = str(tmp_path / "v1.pdf")
+    key_cache = KeyCache()
+
+    def decrypt():
+        with open(path, "rb") as src, open(out_path, "wb") as dst:
+            decrypt_stream(src, dst, PASSWORD, key_cache=key_cache)
+
+    assert traced_peak(decrypt) < PEAK_LIMIT
+    with open(out_path, "rb") as f:
+        assert f.read() == body
+
+def test_version1_tampered_tag_is_rejected(tmp_path):
+    path = str(tmp_path / "v1.veil")
+    write_version1(path, PASSWORD, b"%PDF-1.4\n" + os.urandom(1000))
+    with open(path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    with open(path, "rb") as src, pytest.raises(ValueError, match="本体の認証"):
+        decrypt_stream(src, BytesIO(), PASSWORD)
+
+def test_version1_tampered_body_writes_nothing(tmp_path):
+    path = str(tmp_path / "v1.veil")
+    write_version1(path, PASSWORD, b"%PDF-1.4\n" + os.urandom(3 * SEGMENT_SIZE))
+    with open(path, "r+b") as f:
+        f.seek(-100, os.SEEK_END)  # 暗号文の末尾近く（タグより前）
+        byte = f.read(1)
+        f.seek(-100, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 1]))
+    dst = BytesIO()
+    with open(path, "rb") as src, pytest.raises(ValueError, match="本体の認証"):
+        decrypt_stream(src, dst, PASSWORD)
+    assert dst.getvalue() == b""  # 認証前の平文は1バイトも出さない
+
+def test_version1_from_pipe(tmp_path):
+    path = str(tmp_path / "v1.veil")
+    body = b"%PDF-1.4\n" + os.urandom(5000)
+    write_version1(path, PASSWORD, body)
+    r, w = os.pipe()
+    with os.fdopen(w, "wb") as f, open(path, "rb") as veil:
+        f.write(veil.read())
+    dst = BytesIO()
+    with os.fdopen(r, "rb") as src:
+        decrypt_stream(src, dst, PASSWORD)
+    assert dst.getvalue() == body
@@ -0,0 +1,61 @@
+# tests/test_mmapio.py
+import os
+import pytest
+from io import BytesIO
+from pdfveil.encryptor import encrypt_pdf
+from pdfveil.decryptor import decrypt_pdf
+from pdfveil.mmapio import encrypt_mapped, decrypt_mapped
+from pdfveil.stream import SegmentWriter, generate_nonce_prefix, encrypted_body_size, decrypted_body_size
+
+TEST_PDF = "tests/test_files/sample.pdf"
+PASSWORD = "testpassword"
+KEY = bytes(range(32))
+SEGMENT_SIZE = 64
+
+@pytest.mark.parametrize("size", [0, 1, SEGMENT_SIZE, SEGMENT_SIZE * 3 + 5])
+@pytest.mark.parametrize("threads", [1, 3])
+def test_mapped_matches_segment_writer(size, threads):
+    data = os.urandom(size)
+    nonce_prefix = generate_nonce_prefix()
+    expected = BytesIO()
+    with SegmentWriter(expected, KEY, nonce_prefix, SEGMENT_SIZE) as writer:
+        writer.write(data)
+
+    encrypted = bytearray(encrypted_body_size(size, SEGMENT_SIZE))
+    encrypt_mapped(KEY, nonce_prefix, memoryview(data), memoryview(encrypted), SEGMENT_SIZE, threads)
+    assert bytes(encrypted) == expected.getvalue()
+
+    plain = bytearray(decrypted_body_size(len(encrypted), SEGMENT_SIZE))
+    decrypt_mapped(KEY, nonce_prefix, memoryview(encrypted), memoryview(plain), SEGMENT_SIZE, threads)
+    assert bytes(plain) == data
+
+def test_decrypted_body_size_rejects_truncation():
+    with pytest.raises(ValueError):
+        decrypted_body_size(SEGMENT_SIZE + 16 + 3, SEGMENT_SIZE)
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_mmap_and_stream_paths_agree(tmp_path, raw):
+    veil_path = str(tmp_path / "sample.veil")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, raw=raw, segment_size=1024, use_mmap=True)
+
+    mapped = str(tmp_path / "mapped.pdf")
+    streamed = str(tmp_path / "streamed.pdf")
+    decrypt_pdf(veil_path, PASSWORD, output_path=mapped, threads=2, use_mmap=True)
+    decrypt_pdf(veil_path, PASSWORD, output_path=streamed, use_mmap=False)
+    with open(mapped, "rb") as a, open(streamed, "rb") as b:
+        assert a.read() == b.read()
+
+def test_mmap_decrypt_tampered_removes_output(tmp_path):
+    veil_path = str(tmp_path / "tampered.veil")
+    out_path = str(tmp_path / "tampered.pdf")
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, raw=True, segment_size=1024)
+    with open(veil_path, "r+b") as f:
+        f.seek(-20, os.SEEK_END)
+        byte = f.read(1)
+        f.seek(-20, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError):
+        decrypt_pdf(veil_path, PASSWORD, output_path=out_path, use_mmap=True)
+    # 認証前の平文を含む出力は残さない
+    assert not os.path.exists(out_path)
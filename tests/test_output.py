@@ -0,0 +1,88 @@
+# tests/test_output.py
+import os
+import pytest
+from pdfveil import output
+from pdfveil.output import AtomicOutput, write_vectored
+from pdfveil.encryptor import encrypt_pdf
+from pdfveil.decryptor import decrypt_pdf
+
+PASSWORD = "testpassword"
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "test_files", "sample.pdf")
+
+def test_write_vectored_handles_partial_writes(tmp_path, monkeypatch):
+    writev = os.writev
+    # 1回に最大3バイトしか書けない writev
+    monkeypatch.setattr(os, "writev", lambda fd, views: writev(fd, [bytes(b"".join(views)[:3])]))
+    path = tmp_path / "out.bin"
+    with open(path, "w+b") as f:
+        f.write(b"<")
+        write_vectored(f, [b"abcd", b"", b"ef", b"ghijk"])
+        f.write(b">")
+        assert f.tell() == 13
+    assert path.read_bytes() == b"<abcdefghijk>"
+
+@pytest.mark.parametrize("fsync", ["none", "file", "full"])
+def test_atomic_output_replaces_on_success(tmp_path, fsync):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"old")
+    with AtomicOutput(str(path), fsync=fsync) as f:
+        f.write(b"new")
+        assert path.read_bytes() == b"old"
+    assert path.read_bytes() == b"new"
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+def test_atomic_output_keeps_target_on_error(tmp_path):
+    path = tmp_path / "out.bin"
+    path.write_bytes(b"old")
+    with pytest.raises(RuntimeError):
+        with AtomicOutput(str(path)) as f:
+            f.write(b"partial")
+            raise RuntimeError("interrupted")
+    assert path.read_bytes() == b"old"
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+def test_atomic_output_truncates_overestimated_size(tmp_path):
+    path = tmp_path / "out.bin"
+    with AtomicOutput(str(path), size=1024) as f:
+        f.write(b"short")
+    assert path.read_bytes() == b"short"
+
+def test_atomic_output_rejects_unknown_fsync(tmp_path):
+    with pytest.raises(ValueError):
+        AtomicOutput(str(tmp_path / "out.bin"), fsync="always")
+
+def test_encrypt_writes_header_with_one_writev(tmp_path, monkeypatch):
+    calls = []
+    writev = os.writev
+    monkeypatch.setattr(os, "writev", lambda fd, views: calls.append(len(views)) or writev(fd, views))
+    veil_path = str(tmp_path / "sample.veil")
+    encrypt_pdf(SAMPLE_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True)
+    assert len(calls) == 1
+
+def test_failed_decrypt_keeps_existing_output(tmp_path):
+    veil_path = str(tmp_path / "sample.veil")
+    encrypt_pdf(SAMPLE_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, raw=True)
+    out_path = tmp_path / "sample.pdf"
+    out_path.write_bytes(b"previous")
+    # 本体の最後のバイトを壊す
+    with open(veil_path, "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, os.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    with pytest.raises(ValueError):
+        decrypt_pdf(veil_path, PASSWORD, output_path=str(out_path), force=True)
+    assert out_path.read_bytes() == b"previous"
+    assert sorted(os.listdir(tmp_path)) == ["sample.pdf", "sample.veil"]
+
+def test_raw_output_is_preallocated_to_final_size(tmp_path, monkeypatch):
+    sizes = []
+    preallocate = output._preallocate
+    monkeypatch.setattr(output, "_preallocate", lambda fd, size: sizes.append(size) or preallocate(fd, size))
+    veil_path = str(tmp_path / "sample.veil")
+    encrypt_pdf(SAMPLE_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, raw=True)
+    assert sizes == [os.path.getsize(veil_path)]
+
+    out_path = str(tmp_path / "decrypted.pdf")
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert sizes[1] == os.path.getsize(out_path) == os.path.getsize(SAMPLE_PDF)
@@ -0,0 +1,80 @@
+# tests/test_paged.py
+import os
+import pytest
+from pypdf import PdfReader, PdfWriter
+from pdfveil.encryptor import encrypt_pdf
+from pdfveil.decryptor import decrypt_pdf, extract_pages
+from pdfveil.paged import parse_page_ranges
+
+PASSWORD = "testpassword"
+PAGE_COUNT = 12
+
+def write_numbered_pdf(path: str, pages: int = PAGE_COUNT):
+    # ページ番号を幅で見分けられる白紙のPDF
+    writer = PdfWriter()
+    for i in range(pages):
+        writer.add_blank_page(width=100 + i, height=200)
+    writer.add_metadata({"/Title": "paged test"})
+    with open(path, "wb") as f:
+        writer.write(f)
+
+def page_widths(path: str) -> list:
+    return [int(page.mediabox.width) - 100 for page in PdfReader(path).pages]
+
+@pytest.fixture
+def numbered_pdf(tmp_path):
+    path = str(tmp_path / "numbered.pdf")
+    write_numbered_pdf(path)
+    return path
+
+@pytest.mark.parametrize("unit_pages", [1, 5])
+@pytest.mark.parametrize("encrypt_metadata", [True, False])
+def test_extract_selected_pages(tmp_path, numbered_pdf, unit_pages, encrypt_metadata):
+    veil_path = str(tmp_path / "numbered.veil")
+    # 小さなセグメントで、ユニットや索引がセグメントをまたぐようにする
+    encrypt_pdf(numbered_pdf, PASSWORD, output_path=veil_path, skip_strength_check=True, paged=True, unit_pages=unit_pages, segment_size=256, encrypt_metadata=encrypt_metadata)
+
+    out_path = extract_pages(veil_path, PASSWORD, "3-5,11", output_path=str(tmp_path / "pages.pdf"))
+    assert page_widths(out_path) == [2, 3, 4, 10]
+    assert PdfReader(out_path).metadata["/Title"] == "paged test"
+
+def test_decrypt_paged_restores_all_pages(tmp_path, numbered_pdf):
+    veil_path = str(tmp_path / "numbered.veil")
+    out_path = str(tmp_path / "decrypted.pdf")
+    encrypt_pdf(numbered_pdf, PASSWORD, output_path=veil_path, skip_strength_check=True, paged=True, unit_pages=3, segment_size=512)
+    decrypt_pdf(veil_path, PASSWORD, output_path=out_path)
+    assert page_widths(out_path) == list(range(PAGE_COUNT))
+    assert PdfReader(out_path).metadata["/Title"] == "paged test"
+
+def test_extract_from_unpaged_file_falls_back(tmp_path, numbered_pdf):
+    veil_path = str(tmp_path / "numbered.veil")
+    encrypt_pdf(numbered_pdf, PASSWORD, output_path=veil_path, skip_strength_check=True)
+    out_path = extract_pages(veil_path, PASSWORD, "12", output_path=str(tmp_path / "last.pdf"))
+    assert page_widths(out_path) == [11]
+
+def test_extract_tampered_unit_fails(tmp_path, numbered_pdf):
+    veil_path = str(tmp_path / "numbered.veil")
+    out_path = str(tmp_path / "pages.pdf")
+    encrypt_pdf(numbered_pdf, PASSWORD, output_path=veil_path, skip_strength_check=True, paged=True, segment_size=256)
+    # 末尾付近（索引）を書き換える
+    with open(veil_path, "r+b") as f:
+        f.seek(-20, os.SEEK_END)
+        byte = f.read(1)
+        f.seek(-20, os.SEEK_END)
+        f.write(bytes([byte[0] ^ 0xFF]))
+    with pytest.raises(ValueError):
+        extract_pages(veil_path, PASSWORD, "1", output_path=out_path)
+    assert not os.path.exists(out_path)
+
+def test_raw_and_paged_are_exclusive(tmp_path, numbered_pdf):
+    with pytest.raises(ValueError):
+        encrypt_pdf(numbered_pdf, PASSWORD, output_path=str(tmp_path / "x.veil"), skip_strength_check=True, paged=True, raw=True)
+
+@pytest.mark.parametrize("spec, expected", [("1", [0]), ("3-5", [2, 3, 4]), ("1,4,7-8", [0, 3, 6, 7]), ("10-", [9, 10, 11]), ("-2", [0, 1])])
+def test_parse_page_ranges(spec, expected):
+    assert parse_page_ranges(spec, PAGE_COUNT) == expected
+
+@pytest.mark.parametrize("spec", ["0", "13", "5-3", "a", "1-x"])
+def test_parse_page_ranges_rejects_invalid(spec):
+    with pytest.raises(ValueError):
+        parse_page_ranges(spec, PAGE_COUNT)
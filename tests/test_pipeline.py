@@ -0,0 +1,109 @@
+# tests/test_pipeline.py
+import os
+import shutil
+import threading
+from pypdf import PdfReader
+from pdfveil.cli import process_files_one_by_one
+from pdfveil.output import AtomicOutput
+from pdfveil.pipeline import Prefetcher, Writer
+
+PASSWORD = "Str0ng!Password"  # 強度の確認を出さない
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "test_files", "sample.pdf")
+
+def make_batch(tmp_path, count):
+    files = []
+    for i in range(count):
+        path = tmp_path / f"doc{i}.pdf"
+        shutil.copy(SAMPLE_PDF, path)
+        files.append(str(path))
+    return files
+
+def test_prefetcher_reads_ahead_in_order(tmp_path):
+    files = [str(tmp_path / f"f{i}.bin") for i in range(5)]
+    for path in files:
+        with open(path, "wb") as f:
+            f.write(os.urandom(4096))
+    files.insert(2, str(tmp_path / "missing.bin"))  # 読めないファイルも順番は守る
+    with Prefetcher(files, depth=2) as prefetcher:
+        for path in files:
+            prefetcher.wait(path)
+
+def test_prefetcher_stops_early(tmp_path):
+    files = make_batch(tmp_path, 4)
+    with Prefetcher(files, depth=1) as prefetcher:
+        prefetcher.wait(files[0])
+
+def test_writer_runs_in_order_and_skips_after_failure():
+    done = []
+    def fail():
+        raise OSError("disk full")
+    with Writer(size=1) as writer:
+        writer.submit("a", lambda: done.append(("a", threading.current_thread().name)))
+        writer.submit("b", fail)
+        writer.submit("b", lambda: done.append(("b", None)))
+        writer.submit("c", lambda: done.append(("c", None)))
+    assert [file for file, _ in done] == ["a", "c"]
+    assert done[0][1] == "pdfveil-writer"
+    assert writer.errors == {"b": "disk full"}
+
+def test_deferred_output_is_replaced_on_commit(tmp_path):
+    path = tmp_path / "out.bin"
+    commits = []
+    with AtomicOutput(str(path), defer=commits.append) as f:
+        f.write(b"data")
+    assert not path.exists()
+    commits[0]()
+    assert path.read_bytes() == b"data"
+    assert os.listdir(tmp_path) == ["out.bin"]
+
+def test_pipelined_batch_roundtrip(tmp_path):
+    files = make_batch(tmp_path, 3)
+    results = process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 3, remove=True, jobs=1, prefetch=2)
+    assert all(error is None for _, error in results)
+    assert not any(os.path.exists(path) for path in files)
+
+    veils = [path[:-4] + ".veil" for path in files]
+    results = process_files_one_by_one(veils, "decrypt", False, [PASSWORD] * 3, jobs=1, prefetch=2)
+    assert all(error is None for _, error in results)
+    for path in files:
+        assert len(PdfReader(path).pages) == len(PdfReader(SAMPLE_PDF).pages)
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(p) for p in files + veils)
+
+def test_pipelined_write_failure_keeps_input(tmp_path, monkeypatch, capsys):
+    files = make_batch(tmp_path, 3)
+    replace = os.replace
+    def failing_replace(src, dst):
+        if dst.endswith("doc1.veil"):
+            raise OSError("no space left on device")
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", failing_replace)
+
+    results = dict(process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 3, remove=True, jobs=1, prefetch=1))
+    assert results[files[0]] is None and results[files[2]] is None
+    assert "no space left" in results[files[1]]
+    # 置き換えに失敗したファイルは入力を消さず、一時ファイルも残さない
+    assert sorted(os.listdir(tmp_path)) == ["doc0.veil", "doc1.pdf", "doc2.veil"]
+    assert "doc1.pdf" in capsys.readouterr().out
+
+def test_pipelined_success_is_printed_after_commit(tmp_path, monkeypatch, capsys):
+    files = make_batch(tmp_path, 2)
+    replace = os.replace
+    def failing_replace(src, dst):
+        if dst.endswith("doc1.veil"):
+            raise OSError("no space left on device")
+        replace(src, dst)
+    monkeypatch.setattr(os, "replace", failing_replace)
+
+    process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 2, jobs=1, prefetch=2)
+    out = capsys.readouterr().out
+    assert "saved to: " + str(tmp_path / "doc0.veil") in out
+    assert "saved to: " + str(tmp_path / "doc1.veil") not in out  # 置き換えに失敗したものは成功と表示しない
+
+def test_pipelined_shared_output_is_not_overwritten(tmp_path):
+    # -o で同じ出力先を指定すると、先のファイルの置き換えがまだでも後のファイルは上書きしない
+    files = make_batch(tmp_path, 3)
+    output = str(tmp_path / "out.veil")
+    results = dict(process_files_one_by_one(files, "encrypt", False, [PASSWORD] * 3, output=output, jobs=1, prefetch=2))
+    assert results[files[0]] is None
+    assert "既に存在します" in results[files[1]] and "既に存在します" in results[files[2]]
+    assert sorted(os.listdir(tmp_path)) == sorted(["doc0.pdf", "doc1.pdf", "doc2.pdf", "out.veil"])
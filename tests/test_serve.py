@@ -0,0 +1,176 @@
+# tests/test_serve.py
+import contextlib
+import http.client
+import json
+import os
+import socket
+import threading
+import pytest
+from pypdf import PdfReader
+from pdfveil.serve import PASSWORD_HEADER, RequestHandler, close_server, make_server
+
+PASSWORD = "testpassword"
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "test_files", "sample.pdf")
+
+class UnixConnection(http.client.HTTPConnection):
+    """Unix ドメインソケットに接続する HTTPConnection"""
+
+    def __init__(self, path):
+        super().__init__("localhost")
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.socket_path)
+
+@contextlib.contextmanager
+def running(kind, tmp_path, **options):
+    """サーバーを起動し、接続を作る関数を返す"""
+    if kind == "unix":
+        if not hasattr(socket, "AF_UNIX"):
+            pytest.skip("Unix domain sockets are not available")
+        server = make_server(socket_path=str(tmp_path / "pdfveil.sock"), jobs=1, **options)
+        factory = lambda: UnixConnection(server.server_address)
+    else:
+        server = make_server(port=0, jobs=1, **options)
+        factory = lambda: http.client.HTTPConnection(*server.server_address[:2])
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield factory
+    finally:
+        server.shutdown()
+        thread.join()
+        close_server(server)
+
+@pytest.fixture(params=["unix", "tcp"])
+def connect(request, tmp_path):
+    with running(request.param, tmp_path, max_queue=2) as factory:
+        yield factory
+
+def post(conn, path, body, password=PASSWORD, chunked=False):
+    headers = {PASSWORD_HEADER: password} if password else {}
+    if chunked:
+        # 小さな塊に分けて送る
+        body = iter([body[i:i + 1000] for i in range(0, len(body), 1000)])
+    conn.request("POST", path, body=body, headers=headers, encode_chunked=chunked)
+    response = conn.getresponse()
+    return response.status, response.read()
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_encrypt_decrypt_roundtrip(connect, tmp_path, chunked):
+    pdf = open(SAMPLE_PDF, "rb").read()
+    conn = connect()
+    status, veil = post(conn, "/encrypt?encrypt_metadata=0", pdf, chunked=chunked)
+    assert status == 200
+    assert veil.startswith(b"VEIL")
+
+    # 同じ接続を使い回す
+    status, decrypted = post(conn, "/decrypt", veil, chunked=chunked)
+    assert status == 200
+    out_path = tmp_path / "decrypted.pdf"
+    out_path.write_bytes(decrypted)
+    assert len(PdfReader(str(out_path)).pages) == len(PdfReader(SAMPLE_PDF).pages)
+
+def test_raw_roundtrip_is_byte_identical(connect):
+    pdf = open(SAMPLE_PDF, "rb").read()
+    status, veil = post(connect(), "/encrypt?raw=1", pdf)
+    assert status == 200
+    status, decrypted = post(connect(), "/decrypt", veil)
+    assert status == 200
+    assert decrypted == pdf
+
+def test_errors(connect):
+    pdf = open(SAMPLE_PDF, "rb").read()
+    status, veil = post(connect(), "/encrypt", pdf)
+    assert status == 200
+
+    status, body = post(connect(), "/decrypt", veil, password="wrong")
+    assert status == 400
+    assert "認証" in json.loads(body)["error"]
+    assert post(connect(), "/decrypt", veil, password=None)[0] == 400
+    assert post(connect(), "/encrypt?unknown=1", pdf)[0] == 400
+    assert post(connect(), "/rekey", pdf)[0] == 404
+
+def test_health_and_queue_limit(connect):
+    conn = connect()
+    conn.request("GET", "/health")
+    response = conn.getresponse()
+    health = json.loads(response.read())
+    assert response.status == 200
+    assert health["pending"] == 0 and health["max_queue"] == 2
+
+    # 本文を送り切らない接続で枠を埋めると、次のリクエストは 503 になる
+    held = []
+    for _ in range(2):
+        held_conn = connect()
+        held_conn.putrequest("POST", "/encrypt")
+        held_conn.putheader(PASSWORD_HEADER, PASSWORD)
+        held_conn.putheader("Content-Length", "100")
+        held_conn.endheaders(b"%PDF")
+        held.append(held_conn)
+    conn = connect()
+    for _ in range(100):
+        conn.request("GET", "/health")
+        if json.loads(conn.getresponse().read())["pending"] == 2:
+            break
+    conn = connect()
+    conn.request("POST", "/encrypt", body=b"%PDF-1.4", headers={PASSWORD_HEADER: PASSWORD})
+    response = conn.getresponse()
+    response.read()
+    assert response.status == 503
+    assert response.getheader("Retry-After") == "1"
+    for held_conn in held:
+        held_conn.close()
+
+def test_stalled_client_releases_its_slot(connect, monkeypatch):
+    monkeypatch.setattr(RequestHandler, "timeout", 0.5)
+    # 本文を途中まで送って止まったクライアントは 408 で切られ、枠が空く
+    stalled = connect()
+    stalled.putrequest("POST", "/encrypt")
+    stalled.putheader(PASSWORD_HEADER, PASSWORD)
+    stalled.putheader("Content-Length", "100")
+    stalled.endheaders(b"%PDF")
+    response = stalled.getresponse()
+    response.read()
+    assert response.status == 408
+    conn = connect()
+    conn.request("GET", "/health")
+    assert json.loads(conn.getresponse().read())["pending"] == 0
+    assert post(connect(), "/encrypt?raw=1", b"%PDF-1.4\n")[0] == 200
+
+def large_raw_pdf() -> bytes:
+    # 複数のセグメントになり、ソケットのバッファにも収まらない大きさ
+    return b"%PDF-1.4\n" + os.urandom(5 * 1024 * 1024)
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_large_body_streams_without_deadlock(connect, chunked):
+    # http.client は本文を送り終えてから応答を読むので、その間の出力はサーバーが溜めておく
+    pdf = large_raw_pdf()
+    status, veil = post(connect(), "/encrypt?raw=1", pdf, chunked=chunked)
+    assert status == 200
+    status, decrypted = post(connect(), "/decrypt", veil, chunked=chunked)
+    assert status == 200
+    assert decrypted == pdf
+
+def test_tampered_body_is_never_returned_complete(connect):
+    status, veil = post(connect(), "/encrypt?raw=1", large_raw_pdf())
+    assert status == 200
+    tampered = bytearray(veil)
+    tampered[-100] ^= 1  # 最後のセグメント
+    try:
+        status, _ = post(connect(), "/decrypt", bytes(tampered))
+    except http.client.IncompleteRead:
+        return  # 出力を返し始めた後に失敗したので、終わりの塊なしで切断された
+    assert status == 400
+
+@pytest.mark.parametrize("kind", ["unix", "tcp"])
+def test_body_size_limit(tmp_path, kind):
+    pdf = open(SAMPLE_PDF, "rb").read()
+    with running(kind, tmp_path, max_body=len(pdf) - 1) as connect:
+        conn = connect()
+        conn.request("GET", "/health")
+        assert json.loads(conn.getresponse().read())["max_body"] == len(pdf) - 1
+        assert post(connect(), "/encrypt", pdf)[0] == 413  # Content-Length で読む前に断る
+        assert post(connect(), "/encrypt", pdf, chunked=True)[0] == 413  # chunked は上限を超えた時点で断る
+        assert post(connect(), "/encrypt?raw=1", pdf[:-1])[0] == 200
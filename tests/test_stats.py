@@ -0,0 +1,38 @@
+# tests/test_stats.py
+import pytest
+from pdfveil.encryptor import encrypt_pdf
+from pdfveil.decryptor import decrypt_pdf
+from pdfveil.stats import Stats, format_stats
+
+TEST_PDF = "tests/test_files/sample.pdf"
+PASSWORD = "testpassword"
+
+@pytest.mark.parametrize("raw", [False, True])
+def test_encrypt_and_decrypt_record_stages(tmp_path, raw):
+    veil_path = str(tmp_path / "sample.veil")
+    encrypt_stats = Stats(TEST_PDF)
+    encrypt_pdf(TEST_PDF, PASSWORD, output_path=veil_path, skip_strength_check=True, raw=raw, segment_size=1024, stats=encrypt_stats)
+    assert {"kdf", "body", "aes_gcm"} <= set(encrypt_stats.seconds)
+    assert ("parse" in encrypt_stats.seconds) != raw
+    assert encrypt_stats.bytes["output"] > 0
+
+    decrypt_stats = Stats(veil_path)
+    decrypt_pdf(veil_path, PASSWORD, output_path=str(tmp_path / "sample.pdf"), threads=2, use_mmap=False, stats=decrypt_stats)
+    assert {"parse", "kdf", "body", "aes_gcm", "write"} <= set(decrypt_stats.seconds)
+    # 書き込んだ本体のバイト数は出力ファイルのサイズを超えない
+    assert 0 < decrypt_stats.bytes["write"] <= decrypt_stats.bytes["output"]
+
+def test_merge_aggregates_files():
+    total = Stats()
+    for name in ("a.pdf", "b.pdf"):
+        stats = Stats(name)
+        stats.add("kdf", 0.5)
+        stats.add("aes_gcm", 0.25, 1000)
+        stats.count("input", 10)
+        total.merge(stats.to_dict())
+
+    data = total.to_dict()
+    assert data["files"] == 2
+    assert data["seconds"] == {"kdf": 1.0, "aes_gcm": 0.5}
+    assert data["bytes"] == {"aes_gcm": 2000, "input": 20}
+    assert "合計 (2 件)" in format_stats(data)
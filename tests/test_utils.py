@@ -0,0 +1,47 @@
+# tests/test_utils.py
+import threading
+from pdfveil.utils import KeyCache
+
+def test_key_cache_is_bounded_and_zeroized():
+    cache = KeyCache(max_entries=2)
+    first = cache.get_or_derive("pw", b"salt-1", 1, lambda: b"\x11" * 32)
+    assert cache.get_or_derive("pw", b"salt-1", 1, lambda: b"\x22" * 32) == first  # ヒット
+    stored = list(cache._entries.values())
+    cache.get_or_derive("pw", b"salt-2", 1, lambda: b"\x22" * 32)
+    cache.get_or_derive("pw", b"salt-3", 1, lambda: b"\x33" * 32)
+
+    # 一番古い鍵は追い出され、キャッシュ内のバッファはゼロで上書きされている
+    assert len(cache) == 2
+    assert stored[0] == bytearray(32)
+    assert cache.get_or_derive("pw", b"salt-1", 1, lambda: b"\x55" * 32) == b"\x55" * 32  # 導出し直す
+
+    stored = list(cache._entries.values())
+    cache.clear()
+    assert len(cache) == 0
+    assert all(master_key == bytearray(32) for master_key in stored)
+
+def test_handed_out_keys_survive_eviction_and_clear():
+    cache = KeyCache(max_entries=2)
+    held = cache.get_or_derive("pw", b"salt-1", 1, lambda: b"\x11" * 32)
+    hit = cache.get_or_derive("pw", b"salt-1", 1, lambda: b"\x22" * 32)
+    cache.get_or_derive("pw", b"salt-2", 1, lambda: b"\x22" * 32)
+    cache.get_or_derive("pw", b"salt-3", 1, lambda: b"\x33" * 32)
+    cache.clear()
+    # 使っている最中の鍵はゼロにならない（ゼロの鍵からHKDFで導出してしまわない）
+    assert held == hit == b"\x11" * 32
+
+def test_shared_cache_across_threads_returns_real_keys():
+    cache = KeyCache(max_entries=1)
+    results = []
+
+    def worker(i):
+        for _ in range(200):
+            key = cache.get_or_derive("pw", bytes([i]) * 16, 1, lambda: bytes([i + 1]) * 32)
+            results.append(key == bytes([i + 1]) * 32)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(results)
@@ -0,0 +1,138 @@
+# tests/test_watch.py
+import os
+import shutil
+import threading
+import time
+import pytest
+from pdfveil.cli import watch_and_encrypt
+from pdfveil.decryptor import decrypt_pdf
+from pdfveil.watch import Debouncer, InotifyWatcher, PollingWatcher, is_candidate, watch_directory
+
+PASSWORD = "Str0ng!Password"
+SAMPLE_PDF = os.path.join(os.path.dirname(__file__), "test_files", "sample.pdf")
+TIMEOUT = 10
+
+def wait_for(condition):
+    deadline = time.monotonic() + TIMEOUT
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.02)
+
+def inotify_available(tmp_path):
+    try:
+        InotifyWatcher(str(tmp_path)).close()
+        return True
+    except OSError:
+        return False
+
+def test_is_candidate():
+    assert is_candidate("/in/scan.pdf")
+    assert is_candidate("/in/SCAN.PDF")
+    assert not is_candidate("/in/scan.veil")
+    assert not is_candidate("/in/.scan.pdf.abc.tmp")
+    assert not is_candidate("/in/.scan.pdf")
+
+def test_debouncer_waits_until_file_stops_changing(tmp_path):
+    path = str(tmp_path / "scan.pdf")
+    with open(path, "wb") as f:
+        f.write(b"partial")
+    debouncer = Debouncer(settle=1.0)
+    debouncer.touch(path, now=0.0)
+    assert debouncer.ready(now=0.5) == []
+    assert debouncer.timeout(now=0.5, default=5.0) == pytest.approx(0.5)
+
+    # 書き足されたら、そこから settle 秒待つ
+    with open(path, "ab") as f:
+        f.write(b" and the rest of it")
+    assert debouncer.ready(now=1.2) == []
+    assert debouncer.ready(now=2.0) == []
+    assert debouncer.ready(now=2.3) == [path]
+    assert debouncer.ready(now=9.0) == []
+
+def test_debouncer_forgets_removed_files(tmp_path):
+    path = tmp_path / "scan.pdf"
+    path.write_bytes(b"data")
+    debouncer = Debouncer(settle=0.1)
+    debouncer.touch(str(path), now=0.0)
+    path.unlink()
+    assert debouncer.ready(now=1.0) == []
+    assert debouncer.timeout(now=1.0, default=5.0) == 5.0
+
+def test_polling_watcher_reports_new_and_changed_files(tmp_path):
+    (tmp_path / "old.pdf").write_bytes(b"old")
+    watcher = PollingWatcher(str(tmp_path), interval=0.01)
+    assert watcher.wait(0) == set()
+    (tmp_path / "new.pdf").write_bytes(b"new")
+    (tmp_path / "notes.txt").write_bytes(b"ignored")
+    assert watcher.wait(0) == {str(tmp_path / "new.pdf")}
+    (tmp_path / "old.pdf").write_bytes(b"changed")
+    assert watcher.wait(0) == {str(tmp_path / "old.pdf")}
+    (tmp_path / "new.pdf").unlink()
+    assert watcher.wait(0) == {str(tmp_path / "new.pdf")}
+
+@pytest.mark.parametrize("polling", [True, False])
+def test_watch_directory_handles_each_file_once(tmp_path, polling):
+    if not polling and not inotify_available(tmp_path):
+        pytest.skip("inotify is not available")
+    (tmp_path / "existing.pdf").write_bytes(b"already here")
+    handled = []
+    stop = threading.Event()
+    thread = threading.Thread(target=watch_directory, args=(str(tmp_path), handled.append), kwargs=dict(settle=0.2, polling=polling, interval=0.05, stop=stop))
+    thread.start()
+    try:
+        with open(tmp_path / "scan.pdf", "wb") as f:
+            f.write(b"first half ")
+            f.flush()
+            time.sleep(0.1)
+            f.write(b"second half")
+        (tmp_path / ".scan.pdf.tmp").write_bytes(b"hidden")
+        wait_for(lambda: len(handled) == 2)
+        time.sleep(0.4)
+    finally:
+        stop.set()
+        thread.join()
+    assert sorted(handled) == [str(tmp_path / "existing.pdf"), str(tmp_path / "scan.pdf")]
+
+@pytest.mark.parametrize("polling", [True, False])
+def test_watch_directory_forgets_removed_files(tmp_path, polling):
+    if not polling and not inotify_available(tmp_path):
+        pytest.skip("inotify is not available")
+    path = tmp_path / "scan.pdf"
+    handled = []
+
+    def handle(path):
+        handled.append(path)
+        os.remove(path)  # --remove と同じく処理したら消す
+
+    stop = threading.Event()
+    thread = threading.Thread(target=watch_directory, args=(str(tmp_path), handle), kwargs=dict(settle=0.2, polling=polling, interval=0.05, stop=stop))
+    thread.start()
+    try:
+        # 同じ名前・大きさ・更新時刻のファイルを置き直しても、消えた時点で忘れているのでもう一度処理する
+        for count in (1, 2):
+            path.write_bytes(b"same scan")
+            os.utime(path, (1_000_000_000, 1_000_000_000))
+            wait_for(lambda: len(handled) == count)
+            wait_for(lambda: not path.exists())
+            time.sleep(0.3)
+    finally:
+        stop.set()
+        thread.join()
+    assert handled == [str(path), str(path)]
+
+def test_watch_and_encrypt(tmp_path):
+    inbox = tmp_path / "inbox"
+    outbox = tmp_path / "outbox"
+    inbox.mkdir()
+    outbox.mkdir()
+    stop = threading.Event()
+    thread = threading.Thread(target=watch_and_encrypt, args=(str(inbox), PASSWORD), kwargs=dict(output_dir=str(outbox), remove=True, jobs=1, settle=0.1, interval=0.05, stop=stop))
+    thread.start()
+    try:
+        shutil.copy(SAMPLE_PDF, inbox / "scan.pdf")
+        wait_for(lambda: (outbox / "scan.veil").exists() and not (inbox / "scan.pdf").exists())
+    finally:
+        stop.set()
+        thread.join()
+    decrypt_pdf(str(outbox / "scan.veil"), PASSWORD, output_path=str(tmp_path / "scan.pdf"))
+    assert (tmp_path / "scan.pdf").read_bytes().startswith(b"%PDF-")